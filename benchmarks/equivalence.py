@@ -0,0 +1,144 @@
+"""
+checks that the engines skipping idle cycles complete the same instructions in the same cycles as ticking
+every cycle, on the matrix workload with long data accesses and on a program of mostly loads and stores.
+Also checks that the batch engine completes the same tasks in the same cycles and the same number of
+instructions as Pipeline, on add.dump and on a loop of mostly loads and stores, neither has probabilistic branches.
+
+usage: python -m benchmarks.equivalence [cycles]
+"""
+import sys
+from pathlib import Path
+from typing import Callable, Optional
+
+from simulation.batch import BatchPipeline
+from simulation.load_exec import create_tasks, load_exec_dump, load_program
+from simulation.pipeline import Pipeline
+from simulation.tasks import BranchInstruction, InstructionStream, InstructionType, Task, TaskCategory
+
+QUANTUM_CYCLES = 10
+
+
+def matrix(threads: int) -> Callable[[], list[Task]]:
+    return lambda: load_exec_dump(Path("workload/matrix.dump"), {"mul_row_thread": threads})
+
+
+def loads_and_stores(threads: int) -> Callable[[], list[Task]]:
+    body = [InstructionType.LSU, InstructionType.LSU, InstructionType.FX, InstructionType.LSU] * 500
+    return lambda: [Task(i, TaskCategory.LSU, body) for i in range(1, threads + 1)]
+
+
+# name, tasks, latency of the data access
+SCENARIOS = (
+    ("matrix 3 threads lsu 20", matrix(3), 20),
+    ("matrix 4 threads lsu 50", matrix(4), 50),
+    ("matrix 4 threads lsu 1", matrix(4), 1),
+    ("loads and stores 4 threads lsu 20", loads_and_stores(4), 20),
+)
+
+
+def add_main(threads: int) -> Callable[[], list[Task]]:
+    def tasks() -> list[Task]:
+        program, entries = load_program(Path("workload/add.dump"), ["main"])
+        return create_tasks(program, entries, {"main": threads})
+    return tasks
+
+
+def load_store_loop(threads: int) -> Callable[[], list[Task]]:
+    body = [InstructionType.LSU, InstructionType.LSU, InstructionType.FX, InstructionType.LSU, InstructionType.VSU] * 6
+    program = InstructionStream.from_instructions(
+        body + [BranchInstruction.branch_until(40, -len(body)), BranchInstruction.ret()])
+    return lambda: [Task(i, TaskCategory.LSU, program) for i in range(1, threads + 1)]
+
+
+# name, tasks sharing one program and returning, latency of the data access
+BATCH_SCENARIOS = (
+    ("add 2 threads lsu 1", add_main(2), 1),
+    ("load/store loop 4 threads lsu 1", load_store_loop(4), 1),
+    ("load/store loop 4 threads lsu 20", load_store_loop(4), 20),
+)
+BATCH_RUNS = 3
+MAX_CYCLES = 200_000
+
+
+def completions(pipeline: Pipeline, step: Callable[[Pipeline], list], cycles: int) -> list[tuple[int, int]]:
+    """
+    :return: cycle, instructions completed in it, for every cycle that completed any
+    """
+    trace = []
+    while pipeline.cycle < cycles:
+        completed = step(pipeline)
+        if completed:
+            trace.append((pipeline.cycle, len(completed)))
+    return trace
+
+
+def per_quantum(pipeline: Pipeline, cycles: int) -> list[int]:
+    """
+    :return: instructions completed in every quantum of run_for
+    """
+    return [pipeline.run_for(QUANTUM_CYCLES) for _ in range(cycles // QUANTUM_CYCLES)]
+
+
+def first_difference(expected: list, actual: list) -> Optional[str]:
+    for position, (e, a) in enumerate(zip(expected, actual)):
+        if e != a:
+            return f"entry {position}: expected {e}, got {a}"
+    if len(expected) != len(actual):
+        return f"expected {len(expected)} entries, got {len(actual)}"
+    return None
+
+
+def check(cycles: int) -> bool:
+    """
+    :return: whether all scenarios agree
+    """
+    agree = True
+    for name, tasks, latency in SCENARIOS:
+        ticked = completions(Pipeline(tasks(), latency), Pipeline.tick, cycles)
+        advanced = completions(Pipeline(tasks(), latency), Pipeline.advance, cycles)
+        expected = [0] * (cycles // QUANTUM_CYCLES)
+        for cycle, count in ticked:
+            if cycle <= len(expected) * QUANTUM_CYCLES:
+                expected[(cycle - 1) // QUANTUM_CYCLES] += count
+        quanta = per_quantum(Pipeline(tasks(), latency), cycles)
+
+        for engine, expected_trace, trace in (("advance", ticked, advanced), ("run_for", expected, quanta)):
+            difference = first_difference(expected_trace, trace)
+            if difference is not None:
+                agree = False
+                print(f"{name}: {engine} differs from tick, {difference}")
+            else:
+                print(f"{name}: {engine} agrees with tick, {sum(c for _, c in ticked)} instructions")
+    return agree
+
+
+def check_batch() -> bool:
+    """
+    :return: whether every batch run agrees with Pipeline
+    """
+    agree = True
+    for name, tasks, latency in BATCH_SCENARIOS:
+        ticked = tasks()
+        pipeline = Pipeline(ticked, latency)
+        instructions = 0
+        while not all(task.is_complete() for task in ticked) and pipeline.cycle < MAX_CYCLES:
+            instructions += len(pipeline.tick())
+        expected = [task.completed_at for task in ticked]
+
+        result = BatchPipeline.from_tasks(tasks(), BATCH_RUNS, lsu_latency=latency).run(MAX_CYCLES)
+        for run in range(BATCH_RUNS):
+            completed_at = result.completed_at[:, run].tolist()
+            if completed_at != expected or result.instructions[run] != instructions:
+                agree = False
+                print(f"{name}: batch run {run} completed at {completed_at} with {result.instructions[run]} "
+                      f"instructions, Pipeline at {expected} with {instructions}")
+                break
+        else:
+            print(f"{name}: batch agrees with Pipeline, completed at {expected} with {instructions} instructions")
+    return agree
+
+
+if __name__ == '__main__':
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    if not (check(cycles) & check_batch()):
+        sys.exit(1)
@@ -0,0 +1,224 @@
+"""
+measures the throughput of the simulator on fixed, seeded scenarios.
+
+Every scenario runs in a fresh process, so its peak RSS is its own. Results are written as json,
+--baseline compares them to an earlier result file and exits with 1 if a scenario got slower than the tolerance.
+pipeline_<n>t ticks every cycle, scheduled_4t runs quanta through run_for, which skips idle cycles.
+python -m benchmarks.equivalence checks that both complete the same instructions in the same cycles.
+--traced-peak adds the most memory tracemalloc saw allocated at once, not the total allocated, as traced_peak_bytes.
+
+usage: python -m benchmarks.suite [--only pipeline_4t,quantum_round_robin_smt4] [--scale 0.1] \
+           [--output benchmark.json] [--baseline baseline.json] [--tolerance 0.1] [--traced-peak]
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Optional
+
+from simulation import CLOCK_CYCLES_PER_TIME_QUANTUM, SEED
+
+# 2: results measured before run_for and advance were cycle-equivalent to tick are not comparable
+FORMAT_VERSION = 2
+RATES = ("cycles", "instructions", "quanta")
+
+
+def parse_matrix_128(scale: float) -> dict[str, int]:
+    from simulation.load_exec import load_program
+
+    instructions = 0
+    for _ in range(max(1, round(200 * scale))):
+        program, _ = load_program(Path("workload/matrix_128.dump"), ["mul_row_thread", "main"], use_cache=False)
+        instructions += len(program)
+    return {"instructions": instructions}
+
+
+def pipeline(threads: int, scale: float) -> dict[str, int]:
+    from simulation.load_exec import load_exec_dump
+    from simulation.pipeline import Pipeline
+
+    tasks = load_exec_dump(Path("workload/matrix.dump"), {"mul_row_thread": threads})
+    simulated = Pipeline(tasks)
+    instructions = 0
+    for _ in range(max(1, round(100_000 * scale))):
+        instructions += len(simulated.tick())
+    return {"cycles": simulated.cycle, "instructions": instructions}
+
+
+def scheduled(threads: int, scale: float) -> dict[str, int]:
+    from simulation.load_exec import load_exec_dump
+    from simulation.scheduling import round_robin_smt4
+    from simulation.simulation import run_simulation_on_pipeline
+
+    tasks = load_exec_dump(Path("workload/matrix.dump"), {"mul_row_thread": threads})
+    run = run_simulation_on_pipeline([(0, task) for task in tasks], round_robin_smt4,
+                                     max_cycles=max(1, round(100_000 * scale)))
+    return {"cycles": run.cycles, "instructions": run.instructions}
+
+
+def synthetic_tasks(count: int, seed: int = SEED) -> list:
+    from simulation.tasks import InstructionType, Task, TaskCategory
+
+    rng = random.Random(seed)
+    kinds = (InstructionType.FX, InstructionType.LSU, InstructionType.VSU, InstructionType.BRANCH)
+    return [
+        (rng.randrange(count // 4), Task(i, rng.choice(list(TaskCategory)),
+                                          [rng.choice(kinds) for _ in range(rng.randint(1, 32))], seed=seed))
+        for i in range(1, count + 1)
+    ]
+
+
+def quantum(scheduler: str, scale: float) -> dict[str, int]:
+    from simulation.scheduling import get_scheduler
+    from simulation.simulation import run_simulation_to_exhaustion
+
+    tasks = synthetic_tasks(max(1, round(10_000 * scale)))
+    run_order = run_simulation_to_exhaustion(tasks, get_scheduler(scheduler))
+    return {
+        "quanta": len(run_order),
+        "cycles": len(run_order) * CLOCK_CYCLES_PER_TIME_QUANTUM,
+    }
+
+
+def render(scale: float) -> dict[str, int]:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from simulation.display import plot_schedule_processor_view
+    from simulation.scheduling import round_robin_smt4
+    from simulation.simulation import run_simulation_to_exhaustion
+
+    run_order = run_simulation_to_exhaustion(synthetic_tasks(max(1, round(400 * scale))), round_robin_smt4)
+    plot_schedule_processor_view(run_order)
+    plt.gcf().canvas.draw()
+    plt.close("all")
+    return {"quanta": len(run_order)}
+
+
+def scenarios() -> dict[str, Callable[[float], dict[str, int]]]:
+    from functools import partial
+    from simulation.scheduling import scheduler_names
+
+    found = {"parse_matrix_128": parse_matrix_128}
+    for threads in (1, 2, 4):
+        found[f"pipeline_{threads}t"] = partial(pipeline, threads)
+    found["scheduled_4t"] = partial(scheduled, 4)
+    for scheduler in scheduler_names():
+        found[f"quantum_{scheduler}"] = partial(quantum, scheduler)
+    found["render"] = render
+    return found
+
+
+def _peak_rss_kib() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KiB elsewhere
+
+
+def run_scenario(name: str, scale: float, traced_peak: bool) -> dict[str, object]:
+    """
+    runs in its own process.
+    """
+    scenario = scenarios()[name]
+    start = time.perf_counter()
+    work = scenario(scale)
+    seconds = time.perf_counter() - start
+    result = {"seconds": round(seconds, 4), **work}
+    for rate in RATES:
+        if rate in work:
+            result[f"{rate}_per_second"] = round(work[rate] / seconds, 1)
+    result["peak_rss_kib"] = _peak_rss_kib()
+    if traced_peak:
+        # a second run, tracing slows it down too much to be timed
+        tracemalloc.start()
+        scenario(scale)
+        result["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run(names: list[str], scale: float, traced_peak: bool) -> dict[str, object]:
+    results = {}
+    # a fresh process per scenario, so the peak RSS of one does not carry over to the next
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn"), max_tasks_per_child=1) as pool:
+        for name in names:
+            results[name] = pool.submit(run_scenario, name, scale, traced_peak).result()
+            print(f"{name:>36} {results[name]['seconds']:9.3f}s", file=sys.stderr)
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": scale,
+        "results": results,
+    }
+
+
+def compare(current: dict[str, object], baseline: dict[str, object], tolerance: float) -> list[str]:
+    """
+    :return: names of the scenarios that took more than 1 + tolerance times their baseline time
+    """
+    if baseline.get("scale") != current["scale"]:
+        print(f"baseline was measured at scale {baseline.get('scale')}, not {current['scale']}", file=sys.stderr)
+    slower = []
+    print(f"{'scenario':>36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:>36} {'-':>10} {result['seconds']:9.3f}s")
+            continue
+        change = result["seconds"] / before["seconds"] - 1 if before["seconds"] else 0.0
+        flag = ""
+        if change > tolerance:
+            slower.append(name)
+            flag = " slower"
+        elif change < -tolerance:
+            flag = " faster"
+        print(f"{name:>36} {before['seconds']:9.3f}s {result['seconds']:9.3f}s {change:+8.1%}{flag}")
+    return slower
+
+
+def _split(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[list[str]] = None):
+    known = list(scenarios())
+    parser = argparse.ArgumentParser(description="simulator throughput benchmarks")
+    parser.add_argument("--only", type=_split, default=known, help=f"comma separated, any of {', '.join(known)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="work per scenario relative to the default")
+    parser.add_argument("--traced-peak", action="store_true",
+                        help="run every scenario a second time with tracemalloc for the most memory allocated at once")
+    parser.add_argument("--output", type=Path, help="json file, stdout if not given")
+    parser.add_argument("--baseline", type=Path, help="json file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.only if name not in known]
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(unknown)}")
+
+    current = run(args.only, args.scale, args.traced_peak)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("version") != FORMAT_VERSION:
+            parser.error(f"{args.baseline} is not a benchmark result of version {FORMAT_VERSION}")
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
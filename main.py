@@ -9,6 +9,7 @@ from simulation.load_exec import load_exec_dump
 from simulation.pipeline import PipelineStart, Pipeline
 from simulation.scheduling import slot_fill_shed, score_scheduling, round_robin_smt4
 from simulation.simulation import run_simulation_to_exhaustion
+from simulation.statistics import from_timeline
 from simulation.tasks import Task, TaskCategory, InstructionType, BranchInstruction
 from simulation.display import plot_schedule_processor_view
 from simulation.tasks import TimeQuantum
@@ -23,8 +24,14 @@ SMT_MAX = 4
 N_THREADS = 5
 
 
-def calculate_statistics(timeline: dict[TimeQuantum, list[Task]]) -> dict[str, Any]:
-    return {}
+def calculate_statistics(timeline: dict[TimeQuantum, list[Task]],
+                         arrivals: Optional[dict[int, TimeQuantum]] = None) -> dict[str, Any]:
+    """
+    see simulation.statistics, runs can also collect them while simulating by passing a Statistics.
+
+    :param arrivals: task id -> arrival quantum, tasks arrive in the first quantum they ran in if not given
+    """
+    return from_timeline(timeline, arrivals).summary().as_dict()
 
 
 if __name__ == '__main__':
@@ -53,6 +60,6 @@ if __name__ == '__main__':
                insts)
     ))
     pipeline = Pipeline(tasks)
-    while not (res := pipeline.tick()):
+    while not (res := pipeline.advance()):
         pass
     pprint(res)
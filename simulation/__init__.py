@@ -1,6 +1,15 @@
 import os
+from pathlib import Path
 
 N_THREADS = int(os.getenv("N_THREADS", 4))
+SEED = int(os.getenv("SEED", 0))  # seeds the branch decisions of every task
+LSU_LATENCY = int(os.getenv("LSU_LATENCY", 1))  # cycles of a data access in the load/store pipeline
+INTERFERENCE_MATRIX = os.getenv("INTERFERENCE_MATRIX")  # json file of measured slowdowns, see simulation.interference
+ROOT = Path(__file__).resolve().parent.parent  # the repository, where example.env is
+# toml file extending the mnemonic classification, relative to ROOT
+MNEMONIC_TABLE = os.getenv("MNEMONIC_TABLE")
+TRACE = os.getenv("TRACE", "")  # comma separated subsystems to trace, see simulation.trace
+TRACE_LEVEL = os.getenv("TRACE_LEVEL", "debug")
 
 type TimeQuantum = int
 
@@ -0,0 +1,522 @@
+"""
+simulates many independent runs of one workload at once.
+
+The state of every structure of Pipeline is kept in numpy arrays with one element per run,
+so a cycle of all runs costs a few numpy operations per structure instead of a Pipeline.tick per run. The model follows
+Pipeline.tick cycle by cycle: the same fetch, IFB, decode, dispatch and unit pipeline rules apply,
+so runs without probabilistic branches complete in exactly the same cycles.
+Probabilistic branches are drawn from one numpy generator for the whole batch instead of the per task
+streams of Task, so single runs do not match Pipeline runs with the same seed, only their distribution does.
+
+Instructions are stored as task * len(program) + index, EMPTY marks a free slot.
+The run is the last dimension of every array, so the per run values of a structure are contiguous.
+Runs whose tasks all returned are dropped from the arrays, so a long tail does not slow down the others.
+Instructions never overtake each other inside a decode or unit pipeline, so both are stored as one queue
+per pipeline with the number of instructions in every stage, and moving between stages only changes counts.
+
+Speed: 10k runs of a 4 thread loop of about 800 cycles take about 1 ms per run, one Pipeline run 43 ms,
+about 40x, not the 100-1000x hoped for. A cycle is about 800 numpy calls, many of them over all runs:
+tick's own dispatch and decode bookkeeping takes a third of the time, UnitPipes.forward, _fetch, _scatter
+and _dispatch_mask most of the rest. Every run pays for every call, whether or not its pipeline changed,
+and the loops over decode slots, unit pipelines and threads stay in Python. Going further needs compiled kernels.
+python -m benchmarks.equivalence compares completion cycles and instruction counts with Pipeline.
+"""
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+from simulation import LSU_LATENCY, SEED
+from simulation.tasks import BranchInstruction, InstructionStream, InstructionType, Task
+
+EMPTY = -1
+
+# what dispatch does with an instruction
+KIND_BRANCH = 0
+KIND_FX = 1
+KIND_VSX = 2
+KIND_LSU = 3
+KIND_CALC_BLOCKED = 4  # counts as calculation, but no slice can issue it
+KIND_OTHER = 5  # dispatched, but not executed by any unit
+
+_MODE_PROB = BranchInstruction.BranchMode.PROB.value
+_MODE_UNTIL = BranchInstruction.BranchMode.UNTIL.value
+_MODE_FROM = BranchInstruction.BranchMode.FROM.value
+_MODE_RET = BranchInstruction.BranchMode.RET.value
+
+IFB_SIZE = 26
+IFB_REFILL = IFB_SIZE - 8  # fetch only while a thread buffer holds fewer instructions
+FETCH_WIDTH = 8
+DECODE_WIDTH = 3
+DECODE_STAGES = 8  # the IFB latch followed by decode, crk, xfr, pred0, pred1, xmit and dispatch
+SLICES = 4
+
+
+def _kind(inst_type: InstructionType) -> int:
+    match inst_type:
+        case InstructionType.BRANCH:
+            return KIND_BRANCH
+        case InstructionType.FX | InstructionType.NOP:
+            return KIND_FX
+        case InstructionType.VSU:
+            return KIND_VSX
+        case InstructionType.LSU:
+            return KIND_LSU
+        case InstructionType.CRYPTO | InstructionType.DFU:
+            return KIND_CALC_BLOCKED
+    return KIND_OTHER
+
+
+def _gather(a: np.ndarray, flat: np.ndarray) -> np.ndarray:
+    # much faster than indexing with one array per dimension
+    return a.reshape(-1).take(flat)
+
+
+def _scatter(a: np.ndarray, flat: np.ndarray, values: np.ndarray, where: np.ndarray):
+    # a must be contiguous, otherwise reshape copies and the values are lost
+    selected = np.flatnonzero(where)
+    a.reshape(-1)[flat.reshape(-1)[selected]] = values.reshape(-1)[selected]
+
+
+class UnitPipes:
+    """
+    issue queues followed by chains of single instruction stages, one per slice and run.
+    """
+    occupied: np.ndarray  # pipe, stage, run
+    queue_len: np.ndarray  # pipe, run
+    queue_size: int
+    timed: Optional[int]  # index of the stage with a latency above one cycle
+    latency: int
+    remaining: np.ndarray  # pipe, run: cycles the timed stage still holds its instruction
+    count: np.ndarray  # pipe, run: instructions in the queue and the stages
+    # instructions in order, only kept if the caller needs to know which instruction completed
+    entries: Optional[np.ndarray]  # pipe, ring position, run
+    head: np.ndarray
+
+    def __init__(self, runs: int, pipes: int, queue_size: int, stages: int, timed: Optional[int] = None,
+                 latency: int = 1, keep_entries: bool = False):
+        self.occupied = np.zeros((pipes, stages, runs), dtype=bool)
+        self.queue_len = np.zeros((pipes, runs), dtype=np.int32)
+        self.queue_size = queue_size
+        self.timed = timed if latency > 1 else None
+        self.latency = latency
+        self.remaining = np.zeros((pipes, runs), dtype=np.int32)
+        self.entries = np.full((pipes, queue_size + stages, runs), EMPTY, dtype=np.int32) if keep_entries else None
+        self.head = np.zeros((pipes, runs), dtype=np.int32)
+        self.count = np.zeros((pipes, runs), dtype=np.int32)
+        self._set_offsets()
+
+    def _set_offsets(self):
+        # flat index of the first ring position of every pipe and run
+        pipes, runs = self.head.shape
+        ring = self.queue_size + self.occupied.shape[1]
+        self._ring_offsets = np.arange(pipes)[:, None] * (ring * runs) + np.arange(runs)
+
+    def select(self, keep: np.ndarray):
+        """
+        drops all runs but the kept ones.
+
+        :param keep: indices of the kept runs
+        """
+        self.occupied = self.occupied.take(keep, axis=-1)
+        self.queue_len = self.queue_len.take(keep, axis=-1)
+        self.remaining = self.remaining.take(keep, axis=-1)
+        self.count = self.count.take(keep, axis=-1)
+        self.head = self.head.take(keep, axis=-1)
+        if self.entries is not None:
+            self.entries = self.entries.take(keep, axis=-1)
+        self._set_offsets()
+
+    @property
+    def free(self) -> np.ndarray:
+        return self.queue_size - self.queue_len
+
+    def forward(self) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        :return: pipe, run: whether an instruction left the last stage, and which one if entries are kept
+        """
+        occupied = self.occupied
+        n_stages = occupied.shape[1]
+
+        # like the pull chain of Stage.forward: a stage passes its instruction on
+        # if the next stage is free after passing on its own
+        popped = np.empty_like(occupied)
+        space = np.ones(self.queue_len.shape, dtype=bool)
+        was_empty = None
+        for s in range(n_stages - 1, -1, -1):
+            can = occupied[:, s] & space
+            if s == self.timed:
+                blocked = self.remaining > 0
+                self.remaining -= blocked
+                can &= ~blocked
+                was_empty = ~occupied[:, s]
+            popped[:, s] = can
+            space = ~occupied[:, s] | can
+        from_queue = space & (self.queue_len > 0)
+
+        completed = popped[:, -1]
+        occupied &= ~popped
+        occupied[:, 1:] |= popped[:, :-1]
+        occupied[:, 0] |= from_queue
+        self.queue_len -= from_queue
+
+        if self.timed is not None:
+            started = (popped[:, self.timed] | was_empty) & occupied[:, self.timed]
+            self.remaining = np.where(started, self.latency - 1, self.remaining)
+
+        self.count -= completed
+        if self.entries is None:
+            return completed, None
+        runs = self.head.shape[1]
+        inst = np.where(completed, _gather(self.entries, self._ring_offsets + self.head * runs), EMPTY)
+        self.head = (self.head + completed) % self.entries.shape[1]
+        return completed, inst
+
+    def issue(self, issued: np.ndarray, inst: Optional[np.ndarray] = None):
+        """
+        :param issued: pipe, run: whether an instruction is appended to the queue of the pipe
+        :param inst: pipe, run: the instructions, required if entries are kept
+        """
+        self.queue_len += issued
+        if self.entries is not None:
+            position = (self.head + self.count) % self.entries.shape[1]
+            _scatter(self.entries, self._ring_offsets + position * self.head.shape[1], inst, issued)
+        self.count += issued
+
+    def occupancy(self) -> np.ndarray:
+        return self.count.sum(axis=0)
+
+
+@dataclass
+class BatchResult:
+    completed_at: np.ndarray  # task, run: cycle the task returned in, -1 if it did not
+    instructions: np.ndarray  # run: completed instructions
+    cycles: int  # cycles simulated
+    ifb_occupancy: np.ndarray  # run: average instructions in the IFB
+    queue_occupancy: np.ndarray  # run: average instructions in the issue queues and unit pipelines
+    seed: int
+
+    @property
+    def makespan(self) -> np.ndarray:
+        """
+        :return: run: cycle the last task returned in, -1 if any did not
+        """
+        return np.where((self.completed_at > 0).all(axis=0), self.completed_at.max(axis=0), -1)
+
+
+class BatchPipeline:
+    """
+    runs of up to four threads executing one program, all advanced together by tick().
+    """
+    runs: int
+    threads: int
+    cycle: int
+    rng: np.random.Generator
+    seed: int
+
+    def __init__(self, program: InstructionStream, entries: Sequence[int], runs: int, seed: int = SEED,
+                 lsu_latency: int = LSU_LATENCY):
+        """
+        :param program: shared by all threads
+        :param entries: index of the first instruction of every thread
+        :param runs: number of independent runs
+        """
+        assert 1 <= len(entries) <= 4, "the IFB has four thread buffers"
+        assert len(program) > 0
+        self.runs = runs
+        self.threads = len(entries)
+        self.cycle = 0
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self._width = runs  # runs still in the arrays
+        self._rows = np.arange(runs)
+        self._run_ids = np.arange(runs)
+
+        n = self.program_size = len(program)
+        self.modes = np.asarray(program.branch_modes, dtype=np.int32)
+        self.deltas = np.asarray(program.target_deltas, dtype=np.int32)
+        self.probabilities = np.asarray(program.probabilities, dtype=np.float64)
+        self.counter_maxes = np.asarray(program.counter_maxes, dtype=np.int64)
+        self.resets = np.asarray(program.reset_counters, dtype=bool)
+        self.slots = np.maximum(np.asarray(program.branch_slots, dtype=np.int32), 0)
+        self.returns = self.modes == _MODE_RET
+
+        # lookups by instruction, the extra last element answers for EMPTY
+        kinds = {t.value: _kind(t) for t in InstructionType}
+        self.entry_kinds = np.append(np.tile([kinds[t] for t in program.types], self.threads), -1).astype(np.int8)
+        self.entry_returns = np.append(np.tile(self.returns, self.threads), False)
+        self.entry_threads = np.append(np.repeat(np.arange(self.threads), n), 0).astype(np.int32)
+
+        self.inst_index = np.repeat(np.asarray(entries, dtype=np.int32)[:, None], runs, axis=1)
+        self.counters = np.zeros((self.threads, max(program.branch_slot_count, 1), runs), dtype=np.int64)
+        self.next_fetch = np.zeros(runs, dtype=np.int32)
+        self.lower = False
+
+        self.ifb = np.full((4, IFB_SIZE, runs), EMPTY, dtype=np.int32)
+        self.ifb_head = np.zeros((4, runs), dtype=np.int32)
+        self.ifb_len = np.zeros((4, runs), dtype=np.int32)
+
+        # decode pipeline, ring position, run: the oldest instructions are in the dispatch stage
+        self.decode = np.full((2, DECODE_STAGES * DECODE_WIDTH, runs), EMPTY, dtype=np.int32)
+        self.decode_head = np.zeros((2, runs), dtype=np.int32)
+        # decode pipeline, stage, run: stage 0 is the IFB latch, the last one dispatch
+        self.decode_len = np.zeros((2, DECODE_STAGES, runs), dtype=np.int32)
+
+        self.branch = UnitPipes(runs, 1, 15, 6, keep_entries=True)
+        self.fx = UnitPipes(runs, SLICES, 13, 4)
+        self.vsx = UnitPipes(runs, SLICES, 13, 6)
+        self.lsu = UnitPipes(runs, SLICES, 13, 6, timed=2, latency=lsu_latency)
+
+        self.completed_at = np.full((self.threads, runs), -1, dtype=np.int64)
+        self.instructions = np.zeros(runs, dtype=np.int64)
+        self._ifb_occupancy = np.zeros(runs, dtype=np.int64)
+        self._queue_occupancy = np.zeros(runs, dtype=np.int64)
+        self._live = np.ones(runs, dtype=bool)
+        self._set_offsets()
+        # values of the dropped runs, by run id
+        self._results = BatchResult(self.completed_at.copy(), self.instructions.copy(), 0,
+                                    np.zeros(runs), np.zeros(runs), seed)
+
+    def _set_offsets(self):
+        self._rows = np.arange(self._width)
+        self._decode_offsets = np.arange(2)[:, None] * (self.decode.shape[1] * self._width) + self._rows
+
+    @classmethod
+    def from_tasks(cls, tasks: list[Task], runs: int, seed: int = SEED, lsu_latency: int = LSU_LATENCY):
+        assert all(task.instructions is tasks[0].instructions for task in tasks), "tasks must share a program"
+        return cls(tasks[0].instructions, [task.inst_index for task in tasks], runs, seed, lsu_latency)
+
+    def _branch_taken(self, fetching: np.ndarray, index: np.ndarray, thread: np.ndarray) -> np.ndarray:
+        mode = np.where(fetching, self.modes[index], 0)
+        taken = mode == _MODE_RET
+
+        prob = mode == _MODE_PROB
+        if prob.any():
+            rows = np.flatnonzero(prob)
+            taken[rows] = self.rng.random(len(rows)) < self.probabilities[index[rows]]
+
+        counting = ((mode == _MODE_UNTIL) | (mode == _MODE_FROM)) & (self.counter_maxes[index] > 0)
+        if counting.any():
+            rows = np.flatnonzero(counting)
+            i = index[rows]
+            slot = self.slots[i]
+            flat = (thread[rows] * self.counters.shape[1] + slot) * self._width + rows
+            counter = _gather(self.counters, flat) + 1
+            counter_max = self.counter_maxes[i]
+            until = mode[rows] == _MODE_UNTIL
+            hit = np.where(until, counter <= counter_max, counter >= counter_max)
+            # UNTIL resets when it falls through, FROM when it is taken
+            reset = self.resets[i] & (hit != until)
+            np.put(self.counters, flat, np.where(reset, 0, counter))
+            taken[rows] = hit
+        return taken
+
+    def _fetch(self):
+        thread = self.next_fetch
+        thread_flat = thread * self._width + self._rows
+        fetching = _gather(self.ifb_len, thread_flat) < IFB_REFILL
+        if not fetching.any():
+            return
+        start = _gather(self.inst_index, thread_flat)
+        end = np.minimum(start + FETCH_WIDTH, self.program_size)
+        next_index = end.copy()
+        active = fetching.copy()
+        length = _gather(self.ifb_len, thread_flat)
+        tail = _gather(self.ifb_head, thread_flat) + length
+        for j in range(FETCH_WIDTH):
+            index = start + j
+            active &= index < end
+            if not active.any():
+                break
+            index = np.where(active, index, 0)
+
+            position = (tail + j) % IFB_SIZE
+            _scatter(self.ifb, (thread * IFB_SIZE + position) * self._width + self._rows,
+                     thread * self.program_size + index, active)
+            length += active
+            # fetching stops after the first taken branch
+            taken = active & self._branch_taken(active, index, thread)
+            next_index = np.where(taken, np.where(self.returns[index], self.program_size, index + self.deltas[index]),
+                                  next_index)
+            active &= ~taken
+
+        np.put(self.ifb_len, thread_flat, length)
+        np.put(self.inst_index, thread_flat, np.where(fetching, next_index, start))
+        self.next_fetch = np.where(fetching, (thread + 1) % self.threads, thread)
+
+    def _dispatch_mask(self, kinds: np.ndarray) -> np.ndarray:
+        """
+        :param kinds: decode pipeline, position, run: kinds of the instructions in the dispatch stages
+        :return: decode pipeline, position, run: which of them leave this cycle
+        """
+        branch_free = self.branch.free[0] > 0
+        fx_free = self.fx.free > 0
+        vsx_free = self.vsx.free > 0
+        lsu_free = self.lsu.free > 0
+
+        rows = self._rows
+        branches = np.zeros(self._width, dtype=np.int32)
+        calcs = np.zeros(self._width, dtype=np.int32)
+        stores = np.zeros(self._width, dtype=np.int32)
+        dispatched_calcs = np.zeros(self._width, dtype=np.int32)
+        dispatched_stores = np.zeros(self._width, dtype=np.int32)
+        mask = np.zeros(kinds.shape, dtype=bool)
+        for p in range(2):
+            for j in range(DECODE_WIDTH):
+                kind = kinds[p, j]
+                is_branch = kind == KIND_BRANCH
+                is_fx = kind == KIND_FX
+                is_vsx = kind == KIND_VSX
+                is_calc = is_fx | is_vsx | (kind == KIND_CALC_BLOCKED)
+                is_store = kind == KIND_LSU
+                branches += is_branch
+                calcs += is_calc
+                stores += is_store
+                calc_flat = np.minimum(dispatched_calcs, SLICES - 1) * self._width + rows
+                take_calc = (calcs < 4) & ((is_fx & _gather(fx_free, calc_flat)) | (is_vsx & _gather(vsx_free, calc_flat)))
+                take_store = is_store & (stores < 4) & _gather(lsu_free, np.minimum(dispatched_stores, SLICES - 1)
+                                                               * self._width + rows)
+                dispatched_calcs += take_calc
+                dispatched_stores += take_store
+                mask[p, j] = (is_branch & (branches < 2) & branch_free) | take_calc | take_store | (kind == KIND_OTHER)
+        return mask
+
+    def tick(self):
+        self.cycle += 1
+        runs = self._width
+        ring = self.decode.shape[1]
+        offsets = self._decode_offsets
+
+        ready_len = self.decode_len[:, -1]
+        ready = np.stack([
+            np.where(j < ready_len, _gather(self.decode, offsets + (self.decode_head + j) % ring * runs), EMPTY)
+            for j in range(DECODE_WIDTH)
+        ], axis=1)
+        kinds = self.entry_kinds[ready]
+        mask = self._dispatch_mask(kinds)
+
+        # IFB: a thread for each decode pipeline, into the latch at the end of its queue
+        index_add = int(self.lower)
+        for p in range(2):
+            buffer = 2 * p + index_add
+            count = np.minimum(DECODE_WIDTH - self.decode_len[p, 0], self.ifb_len[buffer])
+            tail = self.decode_head[p] + self.decode_len[p].sum(axis=0)
+            for j in range(DECODE_WIDTH):
+                fetched = _gather(self.ifb, (buffer * IFB_SIZE + (self.ifb_head[buffer] + j) % IFB_SIZE) * runs
+                                  + self._rows)
+                _scatter(self.decode, offsets[p] + (tail + j) % ring * runs, fetched, j < count)
+            self.decode_len[p, 0] += count
+            self.ifb_head[buffer] = (self.ifb_head[buffer] + count) % IFB_SIZE
+            self.ifb_len[buffer] -= count
+        self.lower = not self.lower
+        self._fetch()
+
+        # dispatch the masked instructions, the others move up to the front of the queue in order
+        dispatched = mask.sum(axis=1, dtype=np.int32)
+        kept = np.full((2, DECODE_WIDTH, runs), EMPTY, dtype=np.int32)
+        kept_len = np.zeros((2, runs), dtype=np.int32)
+        for j in range(DECODE_WIDTH):
+            keep = ~mask[:, j] & (ready[:, j] != EMPTY)
+            for i in range(j + 1):
+                kept[:, i] = np.where(keep & (kept_len == i), ready[:, j], kept[:, i])
+            kept_len += keep
+        self.decode_head = (self.decode_head + dispatched) % ring
+        for i in range(DECODE_WIDTH):
+            _scatter(self.decode, offsets + (self.decode_head + i) % ring * runs, kept[:, i], i < kept_len)
+        decode_len = self.decode_len
+        decode_len[:, -1] -= dispatched
+        for s in range(DECODE_STAGES - 2, -1, -1):
+            count = np.minimum(decode_len[:, s], DECODE_WIDTH - decode_len[:, s + 1])
+            decode_len[:, s] -= count
+            decode_len[:, s + 1] += count
+
+        completed, inst = self.branch.forward()
+        returned = np.flatnonzero(self.entry_returns[inst[0]])
+        self.completed_at[self.entry_threads[inst[0, returned]], returned] = self.cycle
+        self.instructions += completed[0] & self._live
+
+        # in dispatch order, the first branch goes to the branch pipeline
+        # and the i-th calculation and load/store to slice i
+        branch = np.full((1, runs), EMPTY, dtype=np.int32)
+        fx = np.zeros((SLICES, runs), dtype=bool)
+        vsx = np.zeros((SLICES, runs), dtype=bool)
+        lsu = np.zeros((SLICES, runs), dtype=bool)
+        calcs = np.zeros(runs, dtype=np.int32)
+        stores = np.zeros(runs, dtype=np.int32)
+        for p in range(2):
+            for j in range(DECODE_WIDTH):
+                kind = np.where(mask[p, j], kinds[p, j], -1)
+                branch[0] = np.where((kind == KIND_BRANCH) & (branch[0] == EMPTY), ready[p, j], branch[0])
+                is_fx = kind == KIND_FX
+                is_vsx = kind == KIND_VSX
+                is_lsu = kind == KIND_LSU
+                calc_flat = calcs * runs + self._rows
+                _scatter(fx, calc_flat, is_fx, is_fx)
+                _scatter(vsx, calc_flat, is_vsx, is_vsx)
+                _scatter(lsu, stores * runs + self._rows, is_lsu, is_lsu)
+                calcs += is_fx | is_vsx
+                stores += is_lsu
+        self.branch.issue(branch != EMPTY, branch)
+
+        for pipes, issued in ((self.lsu, lsu), (self.vsx, vsx), (self.fx, fx)):
+            completed, _ = pipes.forward()
+            self.instructions += completed.sum(axis=0) * self._live
+            pipes.issue(issued)
+
+        # statistics only count until the last task of a run returned
+        live = self._live
+        self._ifb_occupancy += self.ifb_len.sum(axis=0) * live
+        self._queue_occupancy += (self.branch.occupancy() + self.fx.occupancy() + self.vsx.occupancy()
+                                  + self.lsu.occupancy()) * live
+        self._live = (self.completed_at < 0).any(axis=0)
+
+    def _drop_finished(self):
+        finished = np.flatnonzero(~self._live)
+        ids = self._run_ids[finished]
+        results = self._results
+        results.completed_at[:, ids] = self.completed_at[:, finished]
+        results.instructions[ids] = self.instructions[finished]
+        makespan = self.completed_at[:, finished].max(axis=0)
+        results.ifb_occupancy[ids] = self._ifb_occupancy[finished] / makespan
+        results.queue_occupancy[ids] = self._queue_occupancy[finished] / makespan
+
+        keep = np.flatnonzero(self._live)
+        self._run_ids = self._run_ids[keep]
+        for name in ("inst_index", "counters", "next_fetch", "ifb", "ifb_head", "ifb_len", "decode", "decode_head",
+                     "decode_len", "completed_at", "instructions", "_ifb_occupancy", "_queue_occupancy", "_live"):
+            setattr(self, name, getattr(self, name).take(keep, axis=-1))
+        for pipes in (self.branch, self.fx, self.vsx, self.lsu):
+            pipes.select(keep)
+        self._width = len(keep)
+        self._set_offsets()
+
+    def done(self) -> np.ndarray:
+        """
+        :return: run: whether all tasks of the run returned
+        """
+        return self.result().makespan > 0
+
+    def run(self, max_cycles: int) -> BatchResult:
+        """
+        ticks until every run returned from all its tasks or max_cycles passed.
+        """
+        while self.cycle < max_cycles and self._width > 0:
+            self.tick()
+            # dropping costs about as much as a few cycles, so wait until many runs finished
+            if np.count_nonzero(self._live) <= self._width // 2:
+                self._drop_finished()
+        return self.result()
+
+    def result(self) -> BatchResult:
+        """
+        :return: the statistics of all runs, the averages of unfinished runs are over all cycles so far
+        """
+        result = BatchResult(self._results.completed_at.copy(), self._results.instructions.copy(), self.cycle,
+                             self._results.ifb_occupancy.copy(), self._results.queue_occupancy.copy(), self.seed)
+        ids = self._run_ids
+        cycles = np.where(self._live, max(self.cycle, 1), self.completed_at.max(axis=0))
+        result.completed_at[:, ids] = self.completed_at
+        result.instructions[ids] = self.instructions
+        result.ifb_occupancy[ids] = self._ifb_occupancy / cycles
+        result.queue_occupancy[ids] = self._queue_occupancy / cycles
+        return result
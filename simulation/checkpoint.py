@@ -0,0 +1,77 @@
+"""
+snapshots of a running simulation, e.g. a PipelineSimulation between two quanta.
+
+A checkpoint is an lzma compressed pickle of the simulation objects: pipeline, run queue, tasks with their
+branch counters and random streams, or any other picklable state like a ProcessorState.
+Programs are left out, tasks refer to their program by a digest of its columns and get it back on restore,
+so a checkpoint only holds what changes while simulating. Restoring the same checkpoint several times forks
+independent what-if runs from it, each continuing exactly like the run that wrote the checkpoint.
+
+Schedulers are stored by reference, so they must be module level functions or partials of them.
+"""
+import hashlib
+import lzma
+import os
+import pickle
+from pathlib import Path
+from typing import Iterable
+
+from simulation import trace
+from simulation.tasks import InstructionStream, STREAM_COLUMNS
+
+FORMAT_VERSION = 2
+
+
+def _digest(program: InstructionStream) -> bytes:
+    digest = hashlib.sha256()
+    for name, _ in STREAM_COLUMNS:
+        digest.update(memoryview(getattr(program, name)).cast("B"))
+    return digest.digest()
+
+
+def program_digest(program: InstructionStream) -> bytes:
+    return program.derived("checkpoint.digest", _digest)
+
+
+class _Pickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if isinstance(obj, InstructionStream):
+            return "program", program_digest(obj)
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, programs: dict[bytes, InstructionStream]):
+        super().__init__(file)
+        self.programs = programs
+
+    def persistent_load(self, pid):
+        kind, digest = pid
+        if kind != "program" or digest not in self.programs:
+            raise ValueError(f"checkpoint needs program {digest.hex()[:12]}, which was not given")
+        return self.programs[digest]
+
+
+def save(path: Path, state: object):
+    """
+    writes state to path, replacing an older checkpoint only once the new one is complete.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with lzma.open(tmp, "wb", preset=1) as f:
+        pickle.dump(FORMAT_VERSION, f)
+        _Pickler(f, pickle.HIGHEST_PROTOCOL).dump(state)
+    os.replace(tmp, path)
+    if trace.simulation:
+        trace.log("simulation", f"checkpoint written to {path}", trace.Level.INFO)
+
+
+def load(path: Path, programs: Iterable[InstructionStream]) -> object:
+    """
+    :param programs: the programs the checkpointed tasks run, e.g. from load_exec.load_program
+    :return: a fresh copy of the state, every call returns an independent one
+    """
+    with lzma.open(path, "rb") as f:
+        version = pickle.load(f)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a checkpoint of version {FORMAT_VERSION}")
+        return _Unpickler(f, {program_digest(program): program for program in programs}).load()
@@ -0,0 +1,170 @@
+"""
+performance counters of the modelled core, after the PMU events of POWER.
+
+A Pipeline given a Counters counts every event at the end of each cycle, cycles it skips are counted as if they
+were simulated. Without a Counters the pipeline only checks for it once per cycle. The counts are kept in one
+array, read() returns them as a numpy array and sample() stores them, e.g. once per quantum,
+so per_sample() tells where the throughput of every quantum went.
+"""
+from array import array
+from enum import IntEnum
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from simulation.tasks import InstructionType
+
+if TYPE_CHECKING:
+    from simulation.pipeline import InstructionInfo, Pipeline
+
+
+class Event(IntEnum):
+    PM_CYC = 0
+    PM_INST_CMPL = 1
+    PM_INST_CMPL_T0 = 2  # completed instructions fetched by hardware thread 0
+    PM_INST_CMPL_T1 = 3
+    PM_INST_CMPL_T2 = 4
+    PM_INST_CMPL_T3 = 5
+    PM_INST_DISP = 6
+    # cycles in which dispatch held back an instruction, by reason
+    PM_DISP_HELD_BR_LIMIT = 7  # more than one branch
+    PM_DISP_HELD_CALC_LIMIT = 8  # more than three calculations
+    PM_DISP_HELD_LSU_LIMIT = 9  # more than three loads/stores
+    PM_DISP_HELD_BR_IQ_FULL = 10
+    PM_DISP_HELD_FX_IQ_FULL = 11
+    PM_DISP_HELD_VSX_IQ_FULL = 12
+    PM_DISP_HELD_LSU_IQ_FULL = 13
+    PM_DISP_HELD_UNSUPPORTED = 14  # calculations no slice executes
+    # cycles in which at least one issue queue of the unit was full
+    PM_ISSQ_FULL_BR = 15
+    PM_ISSQ_FULL_FX = 16
+    PM_ISSQ_FULL_VSX = 17
+    PM_ISSQ_FULL_LSU = 18
+    # instructions in the thread buffer of each hardware thread, summed over all cycles
+    PM_IFB_OCC_T0 = 19
+    PM_IFB_OCC_T1 = 20
+    PM_IFB_OCC_T2 = 21
+    PM_IFB_OCC_T3 = 22
+    PM_BR_PIPE_BUSY = 23  # cycles with an instruction in the branch pipeline
+    PM_BR_ISSUED = 24
+
+
+_COMPLETED_BY_THREAD = (Event.PM_INST_CMPL_T0, Event.PM_INST_CMPL_T1, Event.PM_INST_CMPL_T2, Event.PM_INST_CMPL_T3)
+_IFB_BY_THREAD = (Event.PM_IFB_OCC_T0, Event.PM_IFB_OCC_T1, Event.PM_IFB_OCC_T2, Event.PM_IFB_OCC_T3)
+_CALC_IQ_FULL = {
+    InstructionType.FX: Event.PM_DISP_HELD_FX_IQ_FULL,
+    InstructionType.NOP: Event.PM_DISP_HELD_FX_IQ_FULL,
+    InstructionType.VSU: Event.PM_DISP_HELD_VSX_IQ_FULL,
+}
+
+
+class Counters:
+    values: array  # Event -> count
+    _samples: array  # values at every sample, one after the other
+    _held: set[Event]  # reasons dispatch held instructions back for in the last cycle
+    _threads: list  # the threads the hardware thread of a task was last looked up in
+    _thread_of: dict[int, int]  # task id -> hardware thread it was last fetched on
+
+    def __init__(self):
+        self.values = array("Q", bytes(8 * len(Event)))
+        self._samples = array("Q")
+        self._held = set()
+        self._threads = []
+        self._thread_of = {}
+
+    def __getitem__(self, event: Event) -> int:
+        return self.values[event]
+
+    def read(self) -> np.ndarray:
+        """
+        :return: event -> count, a copy
+        """
+        return np.array(self.values, dtype=np.uint64)
+
+    def sample(self):
+        self._samples.extend(self.values)
+
+    def samples(self) -> np.ndarray:
+        """
+        :return: sample, event -> count at the time of the sample
+        """
+        return np.frombuffer(self._samples, dtype=np.uint64).reshape(-1, len(Event)).copy()
+
+    def per_sample(self) -> np.ndarray:
+        """
+        :return: sample, event -> count since the previous sample
+        """
+        return np.diff(self.samples().astype(np.int64), axis=0, prepend=0)
+
+    def reset(self):
+        self.values = array("Q", bytes(8 * len(Event)))
+        self._samples = array("Q")
+        self._held.clear()
+
+    def count(self, pipeline: "Pipeline", decode_ready: list["InstructionInfo"], mask: list[bool],
+              completed: list["InstructionInfo"]):
+        """
+        counts the cycle pipeline just simulated.
+
+        :param decode_ready: instructions dispatch looked at
+        :param mask: whether dispatch took each of them
+        """
+        values = self.values
+        values[Event.PM_INST_CMPL] += len(completed)
+        if completed:
+            threads = pipeline.ifb.previous.threads
+            if threads is not self._threads:
+                self._threads = threads
+                self._thread_of.update((task.id, thread) for thread, task in enumerate(threads))
+            thread_of = self._thread_of
+            for inst in completed:
+                values[_COMPLETED_BY_THREAD[thread_of.get(inst.task.id, 0)]] += 1
+
+        values[Event.PM_INST_DISP] += sum(mask)
+        held = self._held
+        held.clear()
+        branches = calc = store = 0
+        for inst, take in zip(decode_ready, mask):
+            kind = inst.type
+            if kind is InstructionType.BRANCH:
+                branches += 1
+                if not take:
+                    held.add(Event.PM_DISP_HELD_BR_LIMIT if branches >= 2 else Event.PM_DISP_HELD_BR_IQ_FULL)
+                else:
+                    values[Event.PM_BR_ISSUED] += 1
+            elif kind is InstructionType.LSU:
+                store += 1
+                if not take:
+                    held.add(Event.PM_DISP_HELD_LSU_LIMIT if store >= 4 else Event.PM_DISP_HELD_LSU_IQ_FULL)
+            elif kind.is_vsx() or kind.is_fx():
+                calc += 1
+                if not take:
+                    held.add(Event.PM_DISP_HELD_CALC_LIMIT if calc >= 4
+                             else _CALC_IQ_FULL.get(kind, Event.PM_DISP_HELD_UNSUPPORTED))
+        self._count_state(pipeline, 1)
+
+    def count_idle(self, pipeline: "Pipeline", cycles: int):
+        """
+        counts cycles pipeline skipped, nothing changes in them, so everything is counted as in the cycle before.
+        """
+        self._count_state(pipeline, cycles)
+
+    def _count_state(self, pipeline: "Pipeline", cycles: int):
+        values = self.values
+        values[Event.PM_CYC] += cycles
+        for event in self._held:
+            values[event] += cycles
+        for event, buffer in zip(_IFB_BY_THREAD, pipeline.ifb.thread_buffers):
+            values[event] += len(buffer) * cycles
+        branch_pipeline = pipeline.branch_pipeline
+        if branch_pipeline.in_flight:
+            values[Event.PM_BR_PIPE_BUSY] += cycles
+        if branch_pipeline.issue_queue.internal_content.is_full():
+            values[Event.PM_ISSQ_FULL_BR] += cycles
+        slices = pipeline.slices
+        if any(s.fxpipe.issue_queue.internal_content.is_full() for s in slices):
+            values[Event.PM_ISSQ_FULL_FX] += cycles
+        if any(s.vsx.issue_stage.internal_content.is_full() for s in slices):
+            values[Event.PM_ISSQ_FULL_VSX] += cycles
+        if any(s.lsu.issue_queue.internal_content.is_full() for s in slices):
+            values[Event.PM_ISSQ_FULL_LSU] += cycles
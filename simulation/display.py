@@ -1,44 +1,112 @@
+from operator import itemgetter
+
 import matplotlib.pyplot as plt
-from matplotlib import colormaps
+import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import to_rgba
+from matplotlib.patches import Patch
+from matplotlib.ticker import MaxNLocator
 from . import TimeQuantum
 from simulation.tasks import Task
 
+# the rows of a quantum, every SMT mode up to 4 splits them evenly
+_ROWS = 12
+
+
+class _Colours(dict):
+    # task id -> rgba, converted the first time a task is drawn
+    def of(self, task: Task) -> tuple:
+        colour = self.get(task.id)
+        if colour is None:
+            colour = self[task.id] = to_rgba(task.colour)
+        return colour
+
+
+def _bars(quanta: list[tuple[TimeQuantum, list[Task]]]) -> tuple[list[tuple[int, int, int, int]], list[Task]]:
+    """
+    merges the quanta a task runs in on the same thread, one after the other, into one bar.
+
+    :param quanta: time and tasks of every quantum that ran, ascending
+    :return: bars of start, end, thread, smt, the task of every bar
+    """
+    bars = []
+    tasks = []
+    open_bars = {}  # thread, smt -> index of the last bar drawn there
+    for time, scheduled in quanta:
+        n_smt = len(scheduled)
+        for i, task in enumerate(scheduled):
+            index = open_bars.get((i, n_smt))
+            if index is not None and tasks[index] is task and bars[index][1] == time:
+                bars[index] = (bars[index][0], time + 1, i, n_smt)
+            else:
+                open_bars[i, n_smt] = len(bars)
+                tasks.append(task)
+                bars.append((time, time + 1, i, n_smt))
+    return bars, tasks
+
 
-def plot_schedule_processor_view(timeline: dict[TimeQuantum, list[Task]], algorithm: str = "Round Robin"):
-    # we are passing all tasks multiple times. But since this is not a performant application this is not important.
+def _raster(timeline: dict[TimeQuantum, list[Task]], end: int, columns: int, colours: _Colours) -> np.ndarray:
+    """
+    samples columns quanta evenly from 0 to end, a column shows the quantum it starts at, nothing if none ran then.
+
+    :return: rows, columns, rgba image, the lowest row first
+    """
+    image = np.zeros((_ROWS, columns, 4))
+    for column, time in enumerate(np.linspace(0, end, columns, endpoint=False).astype(int)):
+        scheduled = timeline.get(int(time))
+        if not scheduled:
+            continue
+        rows = _ROWS // len(scheduled)
+        for i, task in enumerate(scheduled):
+            image[i * rows:(i + 1) * rows, column] = colours.of(task)
+    return image
+
+
+def plot_schedule_processor_view(timeline: dict[TimeQuantum, list[Task]], algorithm: str = "Round Robin",
+                                 max_columns: int = 4000, max_legend: int = 20):
+    """
+    draws the tasks of every quantum at its time, a quantum running n tasks is split into n threads.
+    Quanta missing from the timeline, e.g. idle ones the simulation skipped, are left empty.
+    Consecutive quanta a task runs in on the same thread are drawn as one bar, all bars as one collection.
+    Timelines of more than max_columns quanta are sampled into an image of max_columns columns instead,
+    so they take about as long as a timeline of max_columns quanta.
+
+    :param max_legend: tasks named in the legend, the first ones to run
+    """
     fig, ax = plt.subplots()
 
-    current_time = 0
-    appearances = set()
+    quanta = sorted(timeline.items(), key=itemgetter(0))
+    current_time = quanta[-1][0] + 1 if quanta else 0
     height = 2.0
 
-    for time, tasks in timeline.items():
-
-        n_smt = len(tasks)
-        # new_tasks = []
-        # for task in tasks:
-        #     new_tasks.extend([task] * task.category.value.slots_filled)
-        # tasks = new_tasks
-        delta_y = height / n_smt
-        for i, task in enumerate(tasks):
-            fill = ax.fill_between(
-                [current_time, current_time + 1],
-                [(i + 1) * delta_y, (i + 1) * delta_y],
-                i * delta_y,
-                facecolor=task.colour,
-            )
-            if task.id not in appearances:
-                fill.set_label(f"Task {task.id}")
-                appearances.add(task.id)
-
-        current_time += 1
+    legend = {}
+    for _, scheduled in quanta:
+        if len(legend) >= max_legend:
+            break
+        for task in scheduled:
+            if task.id not in legend and len(legend) < max_legend:
+                legend[task.id] = Patch(facecolor=task.colour, label=f"Task {task.id}")
+
+    colours = _Colours()
+    if len(quanta) <= max_columns:
+        bars, tasks = _bars(quanta)
+        verts = []
+        for start, end, i, n_smt in bars:
+            delta_y = height / n_smt
+            verts.append(((start, i * delta_y), (end, i * delta_y), (end, (i + 1) * delta_y),
+                          (start, (i + 1) * delta_y)))
+        ax.add_collection(PolyCollection(verts, facecolors=[colours.of(task) for task in tasks], linewidths=0))
+    elif current_time:
+        ax.imshow(_raster(timeline, current_time, max_columns, colours), extent=(0, current_time, 0, height),
+                  origin="lower", aspect="auto", interpolation="nearest")
+
     ax.set_ylim(0, height * 2)
     ax.set_xlim(0, current_time + 1)
     ax.set_xlabel('Time-quantum')
-    ax.xaxis.set_ticks(range(current_time + 1))
+    ax.xaxis.set_major_locator(MaxNLocator(integer=True))
     ax.set_yticks([height / 8 * i for i in range(1, 9, 2)])
     ax.set_yticklabels(['HW Thread 1', 'HW Thread 2', 'HW Thread 3', 'HW Thread 4'])
-    ax.legend(loc="upper left")
+    ax.legend(handles=list(legend.values()), loc="upper left")
     ax.grid(True)
     ax.set_title(f'Thread Scheduling Timeline ({algorithm})')
     plt.show()
@@ -0,0 +1,107 @@
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Optional
+
+from simulation import trace
+from simulation.tasks import InstructionStream, STREAM_COLUMNS
+
+# layout: header, entry table, then one typed array per instruction field.
+# all arrays are stored in native byte order, so caches are not portable between machines.
+MAGIC = b"SIMC"
+FORMAT_VERSION = 4
+# magic, format version, key, instruction count, entry count, branch slot count
+_HEADER = struct.Struct("=4sI32sIII")
+_ENTRY = struct.Struct("=HI")  # name length, instruction index
+
+# columns in file order, wider types first so every array stays aligned.
+_FIELDS = sorted(STREAM_COLUMNS, key=lambda column: -array(column[1]).itemsize)
+
+
+def cache_path(file: Path, key: bytes) -> Path:
+    """
+    :return: the cache file of the dump for key, loads of other thread entries or tables get their own
+    """
+    return file.with_name(f"{file.name}.{key[:6].hex()}.simcache")
+
+
+def cache_key(file: Path, thread_entries: list[str], parser_version: int, table_fingerprint: str = "") -> bytes:
+    """
+    hashes the dump content together with everything else the decoded program depends on.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{parser_version}:{table_fingerprint}:{','.join(sorted(thread_entries))}:".encode())
+    with open(file, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def write_cache(path: Path, key: bytes, instructions: InstructionStream, entries: dict[str, int]):
+    # per process, so parallel loaders of the same dump do not write into each other's file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, key, len(instructions), len(entries),
+                                 instructions.branch_slot_count))
+            for name, index in entries.items():
+                encoded = name.encode()
+                f.write(_ENTRY.pack(len(encoded), index))
+                f.write(encoded)
+            f.write(b"\0" * (-f.tell() % 8))
+            for name, _ in _FIELDS:
+                f.write(getattr(instructions, name))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        if trace.loader:
+            trace.log("loader", "could not write workload cache %s: %s", trace.Level.WARN, path, e)
+
+
+def read_cache(path: Path, key: bytes) -> Optional[tuple[InstructionStream, dict[str, int]]]:
+    """
+    memory-maps a cache file written by write_cache.
+    The returned program is a read-only view of the mapping, the file is never copied.
+
+    :return: None if there is no cache or it was created for a different key
+    """
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):  # missing or empty file
+        return None
+
+    if len(buffer) < _HEADER.size:
+        buffer.close()
+        return None
+    magic, version, cached_key, n_instructions, n_entries, branch_slot_count = _HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != FORMAT_VERSION or cached_key != key:
+        buffer.close()
+        return None
+
+    entries = {}
+    offset = _HEADER.size
+    for _ in range(n_entries):
+        length, index = _ENTRY.unpack_from(buffer, offset)
+        offset += _ENTRY.size
+        entries[bytes(buffer[offset:offset + length]).decode()] = index
+        offset += length
+    offset += -offset % 8
+
+    row_size = sum(array(code).itemsize for _, code in _FIELDS)
+    if offset + n_instructions * row_size > len(buffer):
+        buffer.close()
+        return None  # truncated
+
+    # the views keep the mapping alive for as long as the program is used
+    view = memoryview(buffer)
+    columns = {}
+    for name, code in _FIELDS:
+        size = n_instructions * array(code).itemsize
+        columns[name] = view[offset:offset + size].cast(code)
+        offset += size
+
+    # the slot count is stored, counting it would read the whole branch_slots column
+    return InstructionStream(branch_slot_count, **columns), entries
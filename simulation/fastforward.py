@@ -0,0 +1,83 @@
+"""
+functional fast-forward, runs tasks up to their region of interest without modelling the pipeline.
+
+Only branches are evaluated, with the same decisions fetch makes, so a task is left in exactly the state
+fetching the same instructions leaves it in: instruction index, branch counters and random stream.
+The detailed simulation continues from there, e.g. with Pipeline or run_simulation_on_pipeline.
+Instructions between two branches are skipped at once, so a fast-forward costs per taken branch,
+not per instruction.
+"""
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+from simulation import trace
+from simulation.pipeline import branch_taken
+from simulation.tasks import BranchInstruction, InstructionStream, Task
+
+_RET = BranchInstruction.BranchMode.RET.value
+# instructions executed at most if no limit is given, a loop that is always taken would never end otherwise
+MAX_INSTRUCTIONS = 10_000_000
+
+
+def _branch_indices(program: InstructionStream) -> list[int]:
+    modes = program.branch_modes
+    return [i for i in range(len(program)) if modes[i]]
+
+
+def fast_forward(task: Task, instructions: Optional[int] = None, until: Optional[int] = None) -> int:
+    """
+    executes task functionally until it executed instructions instructions, reached the instruction at until,
+    or returned. A task that returned is at the end of its program, like after fetching its return,
+    it completes as soon as it is scheduled on the pipeline.
+
+    :param instructions: most instructions to execute, MAX_INSTRUCTIONS if not given
+    :param until: index of the first instruction to leave to the detailed simulation, e.g. the entry
+        of a function as returned by load_exec.load_program when it is passed as a thread entry
+    :return: number of instructions executed
+    """
+    limited = instructions is not None
+    if not limited:
+        instructions = MAX_INSTRUCTIONS
+    program = task.instructions
+    branches = program.derived("fastforward.branches", _branch_indices)
+    end = len(program)
+    index = task.inst_index
+    executed = 0
+
+    while index < end and executed < instructions:
+        # straight line code up to and including the next branch
+        position = bisect_left(branches, index)
+        branch = branches[position] if position < len(branches) else None
+        block_end = end if branch is None else branch + 1
+        if until is not None and index <= until < block_end:
+            executed += until - index
+            index = until
+            break
+        if executed + block_end - index > instructions:
+            index += instructions - executed
+            executed = instructions
+            break
+        executed += block_end - index
+        if branch is None or program.branch_modes[branch] == _RET:
+            index = end  # nothing left to fetch
+        elif branch_taken(task, branch):
+            index = branch + program.target_deltas[branch]
+        else:
+            index = block_end
+
+    task.inst_index = index
+    if trace.fetch and not limited and executed == instructions:
+        trace.log("fetch", "stopped fast-forwarding task %s after MAX_INSTRUCTIONS at %s, it may loop forever",
+                  trace.Level.WARN, task.id, index)
+    if trace.fetch:
+        trace.log("fetch", f"fast-forwarded task {task.id} by {executed} instructions to {index}", trace.Level.INFO)
+    return executed
+
+
+def fast_forward_all(tasks: Iterable[Task], instructions: Optional[int] = None, until: Optional[int] = None) -> int:
+    """
+    fast-forwards every task on its own, see fast_forward.
+
+    :return: number of instructions executed by all tasks
+    """
+    return sum(fast_forward(task, instructions, until) for task in tasks)
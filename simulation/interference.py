@@ -0,0 +1,226 @@
+"""
+learns how much tasks slow each other down when they share the core.
+
+Tasks are grouped into the unit classes of simulation.packing. The profiler keeps the IPC of every class
+running alone and running next to each other class. It learns them from any run that reports the
+instructions every task completed, e.g. by running representative tasks through Pipeline with measure().
+The matrix is stored as json, so schedulers can load it instead of relying on the guesses in the cost model.
+
+usage: python -m simulation.interference --workload workload/matrix.dump:mul_row_thread=1,add_row_thread=1 \
+           --cycles 2000 --output interference.json
+"""
+import argparse
+import json
+import os
+from dataclasses import dataclass, replace
+from functools import cache
+from itertools import combinations_with_replacement
+from pathlib import Path
+from typing import Optional, Self, Sequence
+
+from simulation import INTERFERENCE_MATRIX, LSU_LATENCY, trace
+from simulation.packing import Unit, unit_class
+from simulation.pipeline import Pipeline
+from simulation.tasks import Task
+
+FORMAT_VERSION = 1
+
+
+@dataclass
+class Measurement:
+    instructions: int = 0
+    cycles: int = 0
+
+    @property
+    def ipc(self) -> float:
+        return self.instructions / self.cycles if self.cycles else 0.0
+
+    def add(self, instructions: int, cycles: int):
+        self.instructions += instructions
+        self.cycles += cycles
+
+
+class InterferenceProfiler:
+    """
+    IPC of every class alone and next to every other class, summed over all recorded runs.
+    Only runs of one or two tasks are recorded, larger groups do not tell which co-runner caused a slowdown.
+    """
+    lsu_latency: int  # of the pipeline the runs were measured on, slowdowns differ between latencies
+    solo: dict[Unit, Measurement]
+    paired: dict[tuple[Unit, Unit], Measurement]  # class, class of the co-runner
+
+    def __init__(self, lsu_latency: int = LSU_LATENCY):
+        self.lsu_latency = lsu_latency
+        self.solo = {}
+        self.paired = {}
+
+    def record(self, classes: Sequence[Unit], completed: Sequence[int], cycles: int):
+        """
+        :param classes: classes of the tasks that shared the core, see classify()
+        :param completed: instructions every task completed in the run
+        :param cycles: length of the run
+        """
+        if cycles <= 0:
+            return
+        if len(classes) == 1:
+            self.solo.setdefault(classes[0], Measurement()).add(completed[0], cycles)
+        elif len(classes) == 2:
+            for unit, other, instructions in zip(classes, reversed(classes), completed):
+                self.paired.setdefault((unit, other), Measurement()).add(instructions, cycles)
+
+    def slowdown(self, unit: Unit, co_runner: Unit) -> float:
+        """
+        :return: IPC of a task of class unit next to one of class co_runner relative to its IPC alone,
+            1.0 if either was not measured
+        """
+        solo = self.solo.get(unit)
+        paired = self.paired.get((unit, co_runner))
+        if solo is None or paired is None or solo.ipc == 0:
+            return 1.0
+        return paired.ipc / solo.ipc
+
+    def matrix(self) -> list[list[float]]:
+        """
+        :return: slowdown of every class (rows) next to every class (columns), in Unit order
+        """
+        return [[self.slowdown(unit, co_runner) for co_runner in Unit] for unit in Unit]
+
+    def merge(self, other: Self):
+        if other.lsu_latency != self.lsu_latency:
+            raise ValueError(f"cannot merge measurements at an LSU latency of {other.lsu_latency} "
+                             f"into ones at {self.lsu_latency}")
+        for unit, measurement in other.solo.items():
+            self.solo.setdefault(unit, Measurement()).add(measurement.instructions, measurement.cycles)
+        for pair, measurement in other.paired.items():
+            self.paired.setdefault(pair, Measurement()).add(measurement.instructions, measurement.cycles)
+
+    def save(self, path: Path):
+        data = {
+            "version": FORMAT_VERSION,
+            "lsu_latency": self.lsu_latency,
+            "solo": {unit.name: [m.instructions, m.cycles] for unit, m in self.solo.items()},
+            "paired": {f"{unit.name},{other.name}": [m.instructions, m.cycles]
+                       for (unit, other), m in self.paired.items()},
+            "slowdown": {unit.name: dict(zip((u.name for u in Unit), row)) for unit, row in zip(Unit, self.matrix())},
+        }
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path, lsu_latency: int = LSU_LATENCY) -> Self:
+        """
+        :param lsu_latency: of the pipeline the matrix is used for, a matrix measured at another one is rejected
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} is not an interference matrix of version {FORMAT_VERSION}")
+        if data["lsu_latency"] != lsu_latency:
+            raise ValueError(f"{path} was measured at an LSU latency of {data['lsu_latency']}, not {lsu_latency}")
+        profiler = cls(lsu_latency)
+        for name, (instructions, cycles) in data["solo"].items():
+            profiler.solo[Unit[name]] = Measurement(instructions, cycles)
+        for names, (instructions, cycles) in data["paired"].items():
+            unit, other = names.split(",")
+            profiler.paired[Unit[unit], Unit[other]] = Measurement(instructions, cycles)
+        return profiler
+
+
+@cache
+def load_matrix(path: Optional[Path] = None) -> InterferenceProfiler:
+    """
+    :param path: the INTERFERENCE_MATRIX file if not given
+    :return: the stored profiler, an empty one if there is no file, which predicts no slowdown
+    """
+    path = path or (Path(INTERFERENCE_MATRIX) if INTERFERENCE_MATRIX else None)
+    if path is None or not path.exists():
+        if trace.scheduler:
+            trace.log("scheduler", f"no interference matrix at {path}, assuming no slowdown", trace.Level.WARN)
+        return InterferenceProfiler()
+    return InterferenceProfiler.load(path)
+
+
+def classify(tasks: list[Task]) -> list[Unit]:
+    """
+    :return: the class of every task at its current position, classify before running the tasks
+    """
+    return [unit_class(task.instructions, task.inst_index) for task in tasks]
+
+
+def run_counted(tasks: list[Task], cycles: int, lsu_latency: int = LSU_LATENCY) -> tuple[list[int], int]:
+    """
+    runs tasks together until cycles passed or the first of them returned.
+
+    :return: instructions completed by every task, and the cycles run
+    """
+    pipeline = Pipeline(tasks, lsu_latency)
+    completed = {task.id: 0 for task in tasks}
+    while pipeline.cycle < cycles and not any(task.is_complete() for task in tasks):
+        for inst in pipeline.advance():
+            completed[inst.task.id] += 1
+    return [completed[task.id] for task in tasks], pipeline.cycle
+
+
+def _fresh(task: Task, task_id: int) -> Task:
+    # a copy with its own counters and branch stream, at the same position in the program
+    return replace(task, id=task_id, branch_counters=None, rng=None, ran_at=[], completed_at=-1)
+
+
+def measure(tasks: list[Task], cycles: int = 2000, profiler: Optional[InterferenceProfiler] = None,
+            lsu_latency: int = LSU_LATENCY) -> InterferenceProfiler:
+    """
+    runs one task of every class present next to one of every class, including its own, and alone for as long
+    as the pair ran, so short tasks are not compared against a warmed up run.
+
+    :param tasks: tasks to pick the representatives from, they are not modified
+    :param profiler: records into this profiler if given, it must have been measured at lsu_latency
+    """
+    profiler = profiler or InterferenceProfiler(lsu_latency)
+    if profiler.lsu_latency != lsu_latency:
+        raise ValueError(f"cannot record runs at an LSU latency of {lsu_latency} "
+                         f"into measurements at {profiler.lsu_latency}")
+    representatives = {}
+    for task, unit in zip(tasks, classify(tasks)):
+        representatives.setdefault(unit, task)
+
+    for unit, other in combinations_with_replacement(representatives, 2):
+        pair = [_fresh(representatives[unit], 1), _fresh(representatives[other], 2)]
+        completed, pair_cycles = run_counted(pair, cycles, lsu_latency)
+        profiler.record([unit, other], completed, pair_cycles)
+        for member in (unit, other):
+            profiler.record([member], *run_counted([_fresh(representatives[member], 1)], pair_cycles, lsu_latency))
+        if trace.scheduler:
+            trace.log("scheduler", f"{unit.name} next to {other.name}: {profiler.slowdown(unit, other):.2f}, "
+                                   f"{other.name} next to {unit.name}: {profiler.slowdown(other, unit):.2f}",
+                      trace.Level.INFO)
+    return profiler
+
+
+def main(argv: Optional[list[str]] = None):
+    from simulation.sweep import Workload
+    from simulation.load_exec import create_tasks, load_program
+
+    parser = argparse.ArgumentParser(description="measures the interference matrix of the classes of a workload")
+    parser.add_argument("--workload", type=Workload.parse, action="append", required=True,
+                        help="dump:function=threads,..., can be repeated")
+    parser.add_argument("--cycles", type=int, default=2000, help="cycles per measured run")
+    parser.add_argument("--output", type=Path, default=Path(INTERFERENCE_MATRIX or "interference.json"),
+                        help="json file, merged with its measurements if it exists")
+    args = parser.parse_args(argv)
+
+    tasks = []
+    for workload in args.workload:
+        program, entries = load_program(workload.dump, (fname for fname, _ in workload.thread_entries))
+        tasks += create_tasks(program, entries, dict(workload.thread_entries))
+
+    profiler = InterferenceProfiler.load(args.output) if args.output.exists() else InterferenceProfiler()
+    measure(tasks, args.cycles, profiler)
+    profiler.save(args.output)
+    for unit, row in zip(Unit, profiler.matrix()):
+        print(f"{unit.name:>6} " + " ".join(f"{slowdown:5.2f}" for slowdown in row))
+
+
+if __name__ == '__main__':
+    main()
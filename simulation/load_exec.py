@@ -1,61 +1,62 @@
 #!/usr/bin/env python
 import re
-import sys
+import tracemalloc
+from bisect import bisect_right
+from functools import cache
 from pathlib import Path
-from typing import List, Dict, Optional, Iterator
+from typing import Dict, Optional, Iterator, Iterable, NamedTuple
 from collections import OrderedDict
 
-from simulation.tasks import InstructionType, Task, TaskCategory, BranchInstruction, Instruction
+from simulation import SEED, trace
+from simulation.mnemonics import MnemonicClassifier
+from simulation.exec_cache import cache_key, cache_path, read_cache, write_cache
+from simulation.tasks import InstructionType, Task, TaskCategory, BranchInstruction, InstructionStream
 
-type InstructionMap = OrderedDict[int, tuple[str, str, str]]
 type FunctionMap = OrderedDict[str, int]
+# bump whenever the decoded program changes for the same dump, this invalidates all caches
+PARSER_VERSION = 1
 
+type AddressIndex = dict[int, int]  # address -> index into the relevant instructions
 
-def _get_index_of_addr(addr: int, instructions: InstructionMap) -> int:
-    for i, (a, _) in enumerate(instructions.items()):
-        if a == addr:
-            return i
-    raise ValueError(f"Could not find instruction at address {addr}")
-
-
-def _calculate_instruction_index_offset(addr: int, target: int, inst_map: InstructionMap) -> int:
-    rel_index = 0
-    found = False
-
-    if target < addr:
-        inst_map_iter = iter(reversed(inst_map.items()))
-        # skip to current instruction
-        for a, _ in inst_map_iter:
-            if addr == a:
-                break
-        for a, (inst, _, _) in inst_map_iter:
-            rel_index -= 1
-            if a == target:
-                found = True
-                break
-    else:  # look forward
-        inst_map_iter = iter(inst_map.items())
-        # skip to current inst
-        for a, _ in inst_map_iter:
-            if addr == a:
-                break
-
-        for a, (inst, _, _) in inst_map_iter:
-            rel_index += 1
-            if a == target:
-                found = True
-                break
-
-    if not found:
-        raise ValueError(f"Could not find target instruction {target} in instruction map")
-    return rel_index
-
-
-def parse_branch_instruction(inst_str: str, addr: int, metadata: str, args: str,
-                             inst_map: OrderedDict[int, tuple[str, str, str]]) -> BranchInstruction:
-    if inst_str in ("b", "bl", "blt", "beq", "bne", "bgt"):
-        target = int(args[0], 16)
-        relative = _calculate_instruction_index_offset(addr, target, inst_map)
+
+@cache
+def get_classifier() -> MnemonicClassifier:
+    """
+    :return: the default classifier with MNEMONIC_TABLE, built on first use instead of on import
+    """
+    return MnemonicClassifier.default()
+
+
+DIRECT_BRANCHES = ("b", "bl", "blt", "beq", "bne", "bgt")
+
+
+class FunctionStart(NamedTuple):
+    name: str
+    address: int
+
+
+class RawInstruction(NamedTuple):
+    address: int
+    inst: str
+    args: list[str]
+    metadata: str
+
+
+def _get_index_of_addr(addr: int, address_index: AddressIndex) -> int:
+    try:
+        return address_index[addr]
+    except KeyError:
+        raise ValueError(f"Could not find instruction at address {addr}") from None
+
+
+def _branch_target(inst_str: str, args: list[str]) -> Optional[int]:
+    if inst_str in DIRECT_BRANCHES:
+        return int(args[0], 16)
+    return None
+
+
+def parse_branch_instruction(inst_str: str, metadata: str, relative: int = 0) -> BranchInstruction:
+    if inst_str in DIRECT_BRANCHES:
         if metadata:
             type, n = metadata.split(':')
             n = int(n)
@@ -76,120 +77,197 @@ def parse_branch_instruction(inst_str: str, addr: int, metadata: str, args: str,
     return BranchInstruction.branch_prob(0.0, 0)
 
 
-def _not_relevant(inst: str) -> bool:
-    return map_instruction(inst) is None
-
-
-def create_address_maps(lines: List[str]) -> tuple[InstructionMap, FunctionMap]:
-    instructions = OrderedDict()
-    functions = OrderedDict()
+def parse_dump(lines: Iterable[str]) -> Iterator[FunctionStart | RawInstruction]:
+    """
+    lazily parses objdump output line by line.
 
+    :param lines: any iterable of lines, e.g. an open file
+    :return: function headers and raw instructions in file order
+    """
     for line in lines:
         if line[0].isdigit():
-            # function start:
-            base_addr = int(line.split()[0], 16)
             m = re.search('<(.+?)>', line)
             if not m: continue
-            name = m.group(1)
-
-            functions[name] = base_addr
+            yield FunctionStart(m.group(1), int(line.split()[0], 16))
         elif line.isspace():
             continue
         else:
             parts = line.strip().split('\t')
             address = int(parts[0].replace(':', ''), 16)
             inst, *args = parts[2].split()
-            if _not_relevant(inst): continue
             metadata = parts[3] if len(parts) > 3 else ""
-            instructions[address] = (inst, args, metadata)
+            yield RawInstruction(address, inst, args, metadata)
 
-    return instructions, functions
 
+def _scan_call_graph(file: Path) -> tuple[FunctionMap, dict[str, set[int]]]:
+    functions = OrderedDict()
+    branch_targets = {}
+    targets = None
 
-def load_exec_dump(file: Path, thread_entries: Dict[str, int]) -> list[Task]:
-    """
-    loads an ppc64le elf file and extracts all thread functions into
+    with open(file, "r") as f:
+        for record in parse_dump(f):
+            if isinstance(record, FunctionStart):
+                functions[record.name] = record.address
+                targets = branch_targets.setdefault(record.name, set())
+            elif targets is not None and (target := _branch_target(record.inst, record.args)) is not None:
+                targets.add(target)
 
-    :param filename:
-    :param thread_entries:
-    :return:
-    """
+    return functions, branch_targets
+
+
+def _reachable_functions(entries: Iterable[str], functions: FunctionMap,
+                         branch_targets: dict[str, set[int]]) -> set[str]:
+    starts = sorted((addr, name) for name, addr in functions.items())
+    start_addresses = [addr for addr, _ in starts]
+
+    reachable = set()
+    pending = list(entries)
+    while pending:
+        name = pending.pop()
+        if name in reachable: continue
+        if name not in functions:
+            raise ValueError(f"Could not find function {name}")
+        reachable.add(name)
+
+        for target in branch_targets[name]:
+            i = bisect_right(start_addresses, target) - 1
+            if i >= 0:
+                pending.append(starts[i][1])
+
+    return reachable
+
+
+def _load_reachable_instructions(file: Path, reachable: set[str]) -> tuple[InstructionStream, AddressIndex]:
+    task_instructions = InstructionStream()
+    address_index = {}
+    unresolved = {}  # forward branch target address -> indices of the branches jumping there
+    keep = False
 
     with open(file, "r") as f:
-        lines = f.readlines()
+        for record in parse_dump(f):
+            if isinstance(record, FunctionStart):
+                keep = record.name in reachable
+                continue
+            if not keep: continue
+
+            inst_type = map_instruction(record.inst)
+            if inst_type is None: continue
+
+            index = len(task_instructions)
+            address_index[record.address] = index
+            for branch_index in unresolved.pop(record.address, ()):
+                task_instructions.target_deltas[branch_index] = index - branch_index
+
+            if inst_type != InstructionType.BRANCH:
+                task_instructions.append(inst_type)
+                continue
+
+            branch = parse_branch_instruction(record.inst, record.metadata)
+            target = _branch_target(record.inst, record.args)
+            if target is not None:
+                if target in address_index:
+                    branch.target_index_delta = address_index[target] - index
+                else:
+                    unresolved.setdefault(target, []).append(index)
+            task_instructions.append(branch)
+
+    if unresolved:
+        raise ValueError(f"Could not find target instruction {next(iter(unresolved))} in instruction map")
+
+    return task_instructions, address_index
+
+
+def _decode_dump(file: Path, thread_entries: list[str], report_memory: bool) -> tuple[
+    InstructionStream, dict[str, int]]:
+    if report_memory:
+        tracemalloc.start()
+
+    try:
+        functions, branch_targets = _scan_call_graph(file)
+        reachable = _reachable_functions(thread_entries, functions, branch_targets)
+        task_instructions, address_index = _load_reachable_instructions(file, reachable)
+        entries = {fname: _get_index_of_addr(functions[fname], address_index) for fname in thread_entries}
+
+        if report_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            # asked for by the caller, so logged whether loader tracing is enabled or not
+            trace.log("loader", "loaded %d instructions of %d functions from %s, peak memory %.1f KiB",
+                      trace.Level.INFO, len(task_instructions), len(reachable), file, peak / 1024)
+    finally:
+        if report_memory:
+            tracemalloc.stop()
+
+    return task_instructions, entries
+
+
+def load_program(file: Path, thread_entries: Iterable[str], report_memory: bool = False,
+                 use_cache: bool = True) -> tuple[InstructionStream, dict[str, int]]:
+    """
+    decodes the functions reachable from the thread entries of an objdump of a ppc64le elf file.
+    The dump is streamed twice: once to collect the call graph and once to decode only the
+    functions reachable from the thread entries.
+    The decoded program is cached next to the dump, one file per set of thread entries and mnemonic table,
+    and reused as long as neither the dump nor PARSER_VERSION change.
+
+    :param file: objdump output of the executable
+    :param thread_entries: names of the functions threads start in
+    :param report_memory: print the peak memory used while loading
+    :param use_cache: read and write the .simcache file of the dump
+    :return: the program and the index of every thread entry in it
+    """
+    thread_entries = list(thread_entries)
+    cached = None
+    if use_cache:
+        key = cache_key(file, thread_entries, PARSER_VERSION, get_classifier().fingerprint())
+        cached = read_cache(cache_path(file, key), key)
 
-        # first pass: create map of all addresses.
-        instructions, functions = create_address_maps(lines)
+    if cached is not None:
+        if trace.loader:
+            trace.log("loader", "using cached program %s", trace.Level.INFO, cache_path(file, key))
+        return cached
 
-        task_instructions = []
-        # second pass: create instruction instances
-        for address, (inst, args, metadata) in instructions.items():
-            match map_instruction(inst):
-                case InstructionType.BRANCH:
-                    task_instructions.append(parse_branch_instruction(inst, address, metadata, args, instructions))
-                case InstructionType.NOP:
-                    task_instructions.append(Instruction(InstructionType.NOP))
-                case other:
-                    if other is None: continue
-                    task_instructions.append(Instruction(other))
+    program = _decode_dump(file, thread_entries, report_memory)
+    if use_cache:
+        write_cache(cache_path(file, key), key, *program)
+    return program
 
-        print(task_instructions)
 
+def create_tasks(program: InstructionStream, entries: dict[str, int], thread_entries: Dict[str, int],
+                 seed: int = SEED) -> list[Task]:
+    """
+    creates fresh tasks sharing one decoded program, ids are numbered from 1 in the order of thread_entries.
+
+    :param entries: function name -> index of its first instruction, as returned by load_program
+    :param thread_entries: function name -> number of threads starting there
+    :param seed: seed of the run, every task gets its own stream derived from it
+    """
     tasks = []
-    i = 1
+    i = 1  # ids start from 1
     for fname, count in thread_entries.items():
-        index = _get_index_of_addr(functions[fname], instructions)
-        tasks.extend((
-                         Task(
-                             i, TaskCategory.FX, task_instructions, inst_index=index,
-                             fname=fname
-                         )
-                     ) for i in range(i, count + 1))  # +1 since ids start from 1
+        index = entries[fname]
+        tasks.extend(
+            Task(i, TaskCategory.FX, program, inst_index=index, fname=fname, seed=seed) for i in range(i, i + count)
+        )
         i += count
 
     return tasks
 
 
+def load_exec_dump(file: Path, thread_entries: Dict[str, int], report_memory: bool = False,
+                   use_cache: bool = True, seed: int = SEED) -> list[Task]:
+    """
+    loads an objdump of a ppc64le elf file and extracts all thread functions into tasks, see load_program.
+
+    :param file: objdump output of the executable
+    :param thread_entries: function name -> number of threads starting there
+    :param report_memory: print the peak memory used while loading
+    :param use_cache: read and write the .simcache file of the dump
+    :param seed: seed of the run, see create_tasks
+    :return: one task per requested thread
+    """
+    program, entries = load_program(file, thread_entries.keys(), report_memory, use_cache)
+    return create_tasks(program, entries, thread_entries, seed)
+
+
 def map_instruction(inst: str) -> Optional[InstructionType]:
-    if inst.startswith((
-            "add", "sub", "mul", "div", "rl", "or", "xor", "nand", "and", "clrrdi", "clrldi",
-            "sld", "slw", "sr", "ext",
-    )):
-        return InstructionType.FX
-
-    if inst.startswith((
-            "b", "cmp"
-    )):
-        return InstructionType.BRANCH
-
-    if inst.startswith((
-            "l", "st",
-    )):
-        return InstructionType.LSU
-
-    if inst in ("sc", "tw", "twi", "td", "tdi", "sync", "isync", "tlbsync", "tlbie", "rfi"):
-        # ignore syscalls for now.
-        return None
-
-    if inst in (
-            'mflr', 'mtxer', 'mtctr', 'mr', 'mtlr'
-    ):
-        return InstructionType.FX
-
-    if inst.startswith((
-            "mtf", "mff"
-    )):
-        return InstructionType.VSU  # access to FP registers
-    if inst == "nop":
-        return InstructionType.NOP
-
-    if inst in (".long",):
-        return None  # data or nop
-
-    if inst.startswith((
-            "f"
-    )):
-        return InstructionType.VSU
-
-    print(f"Unknown instruction type {inst}", file=sys.stderr)
-    return None
+    return get_classifier().classify(inst)
@@ -0,0 +1,131 @@
+import tomllib
+from pathlib import Path
+from typing import Optional, Self
+
+from simulation import MNEMONIC_TABLE, ROOT, trace
+from simulation.tasks import InstructionType
+
+IGNORE = "ignore"
+# types the pipeline has an issue route for, see Pipeline.tick and InternalSlice.can_issue
+ISSUABLE = (InstructionType.FX, InstructionType.NOP, InstructionType.VSU, InstructionType.LSU,
+            InstructionType.BRANCH)
+
+# mnemonic -> instruction type, None marks instructions the simulation skips.
+# exact matches win over prefixes, longer prefixes win over shorter ones.
+EXACT_MNEMONICS: dict[str, Optional[InstructionType]] = {
+    # ignore syscalls for now.
+    "sc": None, "tw": None, "twi": None, "td": None, "tdi": None,
+    "sync": None, "isync": None, "tlbsync": None, "tlbie": None, "rfi": None,
+    "mflr": InstructionType.FX, "mtxer": InstructionType.FX, "mtctr": InstructionType.FX,
+    "mr": InstructionType.FX, "mtlr": InstructionType.FX,
+    "nop": InstructionType.NOP,
+    ".long": None,  # data or nop
+}
+
+PREFIX_MNEMONICS: dict[str, Optional[InstructionType]] = {
+    **dict.fromkeys((
+        "add", "sub", "mul", "div", "rl", "or", "xor", "nand", "and", "clrrdi", "clrldi",
+        "sld", "slw", "sr", "ext",
+    ), InstructionType.FX),
+    **dict.fromkeys(("b", "cmp"), InstructionType.BRANCH),
+    **dict.fromkeys(("l", "st"), InstructionType.LSU),
+    **dict.fromkeys(("mtf", "mff"), InstructionType.VSU),  # access to FP registers
+    "f": InstructionType.VSU,
+}
+
+
+def _parse_type(name: str) -> Optional[InstructionType]:
+    if name == IGNORE:
+        return None
+    try:
+        inst_type = InstructionType[name.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown instruction type {name} in mnemonic table") from None
+    if inst_type not in ISSUABLE:
+        # dispatch would wait for a slice that never takes them
+        raise ValueError(f"Instruction type {name} in mnemonic table cannot be issued by the pipeline, "
+                         f"use one of {', '.join(t.name for t in ISSUABLE)} or {IGNORE}")
+    return inst_type
+
+
+class MnemonicClassifier:
+    """
+    maps mnemonics to instruction types with one dict lookup for every mnemonic seen before.
+    """
+    exact: dict[str, Optional[InstructionType]]
+    prefixes: dict[str, Optional[InstructionType]]
+    _max_prefix: int
+    _memo: dict[str, Optional[InstructionType]]
+
+    def __init__(self, exact: dict[str, Optional[InstructionType]],
+                 prefixes: dict[str, Optional[InstructionType]]):
+        self.exact = dict(exact)
+        self.prefixes = dict(prefixes)
+        self._update()
+
+    @classmethod
+    def default(cls) -> Self:
+        """
+        :return: the built-in tables extended by MNEMONIC_TABLE, a relative path is relative to ROOT
+        """
+        classifier = cls(EXACT_MNEMONICS, PREFIX_MNEMONICS)
+        if MNEMONIC_TABLE:
+            classifier.load(ROOT / MNEMONIC_TABLE)
+        return classifier
+
+    def _update(self):
+        self._max_prefix = max(map(len, self.prefixes), default=0)
+        self._memo = {}
+
+    def extend(self, exact: Optional[dict[str, Optional[InstructionType]]] = None,
+               prefixes: Optional[dict[str, Optional[InstructionType]]] = None):
+        self.exact.update(exact or {})
+        self.prefixes.update(prefixes or {})
+        self._update()
+
+    def load(self, file: Path):
+        """
+        extends the tables from a toml file of the form::
+
+            [exact]
+            mfvsrld = "VSU"
+            [prefix]
+            xx = "VSU"
+
+        types are names of ISSUABLE instruction types, "ignore" drops the instruction.
+        """
+        with open(file, "rb") as f:
+            table = tomllib.load(f)
+
+        self.extend(
+            {m: _parse_type(t) for m, t in table.get("exact", {}).items()},
+            {m: _parse_type(t) for m, t in table.get("prefix", {}).items()},
+        )
+
+    def fingerprint(self) -> str:
+        """
+        identifies the tables, so decoded programs can be cached per table.
+        """
+        def dump(table: dict[str, Optional[InstructionType]]) -> str:
+            return ",".join(f"{m}={t.name if t else IGNORE}" for m, t in sorted(table.items()))
+
+        return f"{dump(self.exact)};{dump(self.prefixes)}"
+
+    def _lookup(self, inst: str) -> Optional[InstructionType]:
+        if inst in self.exact:
+            return self.exact[inst]
+        for length in range(min(len(inst), self._max_prefix), 0, -1):
+            prefix = inst[:length]
+            if prefix in self.prefixes:
+                return self.prefixes[prefix]
+
+        if trace.loader:
+            trace.log("loader", "unknown instruction type %s, skipped", trace.Level.WARN, inst)
+        return None
+
+    def classify(self, inst: str) -> Optional[InstructionType]:
+        try:
+            return self._memo[inst]
+        except KeyError:
+            inst_type = self._memo[inst] = self._lookup(inst)
+            return inst_type
@@ -0,0 +1,103 @@
+"""
+cost model of tasks sharing the core, used by the packing scheduler.
+
+A task is classified by the unit most of its next instructions go to. Every class has a pressure profile,
+the share of its instructions going to each unit. Alone, a thread issues THREAD_IPC instructions per cycle.
+Threads running together slow down by the same factor until neither dispatch nor any unit is over capacity,
+their combined IPC is precomputed for every mix of classes that fits the SMT width.
+"""
+from enum import IntEnum
+from functools import cache
+from itertools import combinations_with_replacement
+
+from simulation import LSU_LATENCY
+from simulation.tasks import InstructionStream, InstructionType, BranchInstruction
+
+
+class Unit(IntEnum):
+    FX = 0
+    LSU = 1
+    VSU = 2
+    BRANCH = 3
+
+
+# share of the instructions of a class going to each unit, in Unit order
+PRESSURE_PROFILES: dict[Unit, tuple[float, ...]] = {
+    Unit.FX: (0.60, 0.20, 0.05, 0.15),
+    Unit.LSU: (0.25, 0.60, 0.00, 0.15),
+    Unit.VSU: (0.15, 0.20, 0.55, 0.10),
+    Unit.BRANCH: (0.35, 0.20, 0.00, 0.45),
+}
+THREAD_IPC = 2.0
+DISPATCH_WIDTH = 6  # two decode pipelines of three
+PROFILE_WINDOW = 32  # instructions looked ahead to classify a task
+
+_UNITS = {
+    InstructionType.FX.value: Unit.FX,
+    InstructionType.NOP.value: Unit.FX,
+    InstructionType.LSU.value: Unit.LSU,
+    InstructionType.VSU.value: Unit.VSU,
+    InstructionType.CRYPTO.value: Unit.VSU,
+    InstructionType.DFU.value: Unit.VSU,
+    InstructionType.BRANCH.value: Unit.BRANCH,
+}
+_RET = BranchInstruction.BranchMode.RET.value
+
+
+def unit_capacity(lsu_latency: int = LSU_LATENCY) -> tuple[float, ...]:
+    """
+    :return: instructions per cycle every unit completes over all slices, in Unit order
+    """
+    return 4.0, 4.0 / lsu_latency, 4.0, 1.0
+
+
+def combined_ipc(counts: tuple[int, ...], lsu_latency: int = LSU_LATENCY) -> float:
+    """
+    :param counts: number of threads of every class, in Unit order
+    """
+    threads = sum(counts)
+    if threads == 0:
+        return 0.0
+    demand = [
+        sum(count * THREAD_IPC * PRESSURE_PROFILES[Unit(c)][unit] for c, count in enumerate(counts))
+        for unit in Unit
+    ]
+    scale = min(1.0, DISPATCH_WIDTH / (threads * THREAD_IPC),
+                *(capacity / d for capacity, d in zip(unit_capacity(lsu_latency), demand) if d > 0))
+    return threads * THREAD_IPC * scale
+
+
+@cache
+def ipc_table(smt: int, lsu_latency: int = LSU_LATENCY) -> dict[tuple[int, ...], float]:
+    """
+    :return: counts of threads of every class -> combined IPC, for up to smt threads
+    """
+    table = {}
+    for n in range(smt + 1):
+        for classes in combinations_with_replacement(Unit, n):
+            counts = tuple(classes.count(unit) for unit in Unit)
+            table[counts] = combined_ipc(counts, lsu_latency)
+    return table
+
+
+def unit_class(instructions: InstructionStream, index: int) -> Unit:
+    """
+    :return: the unit most of the instructions from index up to the next return go to
+    """
+    classes = instructions.derived("packing.classes", lambda _: {})  # instruction index -> class
+    unit = classes.get(index)
+    if unit is None:
+        unit = classes[index] = _classify(instructions, index)
+    return unit
+
+
+def _classify(instructions: InstructionStream, index: int) -> Unit:
+    counts = [0] * len(Unit)
+    end = min(index + PROFILE_WINDOW, len(instructions))
+    for i in range(index, end):
+        unit = _UNITS.get(instructions.types[i])
+        if unit is not None:
+            counts[unit] += 1
+        if instructions.branch_modes[i] == _RET:
+            break
+    return Unit(counts.index(max(counts)))
@@ -1,177 +1,372 @@
 from __future__ import annotations
 
+from collections import deque
 from dataclasses import dataclass, field
-from random import random
-from typing import NamedTuple, Self, Generator, Optional
-from unittest import case
+from typing import Self, Generator, Optional
 
-from simulation.state import ProcessorState, LimitedList
-from simulation.tasks import Task, InstructionType, Instruction, BranchInstruction, TimeQuantum
+from simulation import LSU_LATENCY, trace
+from simulation.counters import Counters
+from simulation.state import RingBuffer
+from simulation.tasks import Task, InstructionType, BranchInstruction, TimeQuantum, INSTRUCTION_TYPES, BRANCH_MODES
 
-current_time: TimeQuantum = 0
 
+# instruction types dispatched to the calculation pipelines of the slices,
+# a tuple as enum members hash slower than they compare
+CALCULATIONS = tuple(kind for kind in InstructionType if kind.is_vsx() or kind.is_fx())
 
-class InstructionInfo(NamedTuple):
-    inst: Instruction
+
+class InstructionInfo:
+    """
+    an instruction in flight. Records are recycled through an InstructionPool,
+    so they must not be kept after they left the pipeline.
+    """
+    __slots__ = ("type", "branch_mode", "task")
+    type: InstructionType
+    branch_mode: Optional[BranchInstruction.BranchMode]
     task: Task
 
+    def __init__(self, type: InstructionType, branch_mode: Optional[BranchInstruction.BranchMode], task: Task):
+        self.type = type
+        self.branch_mode = branch_mode
+        self.task = task
 
-@dataclass
-class BranchPipeline:
-    issue_queue: IssueQueueStage
-    ex_content: Stage
-    rf_stage: Stage
-    issue_stage: Stage
-    map_stage: Stage
-    fin_stage: Stage
-    xmit_stage: Stage
+    def __repr__(self):
+        return f"InstructionInfo({self.type}, {self.branch_mode}, task={self.task.id})"
+
+
+class InstructionPool:
+    __slots__ = ("_free", "created")
+    _free: list[InstructionInfo]
+    created: int
 
     def __init__(self):
-        self.issue_queue = IssueQueueStage(15, name="Branch_IssueQueue")
-        self.ex_content = Stage(self.issue_queue, 1)
-        self.rf_stage = Stage(self.ex_content, 1)
-        self.issue_stage = Stage(self.rf_stage, 1)
-        self.map_stage = Stage(self.issue_stage, 1)
-        self.fin_stage = Stage(self.map_stage, 1)
-        self.xmit_stage = Stage(self.fin_stage, 1)
-
-    def forward(self) -> list[InstructionInfo]:
-        res = self.xmit_stage.forward()
-        for inst in res:
-            if inst.inst.type == InstructionType.BRANCH and inst.inst.branch_mode == BranchInstruction.BranchMode.RET:
-                inst.task.mark_completed(current_time)
-        return res
+        self._free = []
+        self.created = 0
+
+    def acquire(self, type: InstructionType, branch_mode: Optional[BranchInstruction.BranchMode],
+                task: Task) -> InstructionInfo:
+        if not self._free:
+            self.created += 1
+            return InstructionInfo(type, branch_mode, task)
+
+        inst = self._free.pop()
+        inst.type = type
+        inst.branch_mode = branch_mode
+        inst.task = task
+        return inst
+
+    def release(self, insts: list[InstructionInfo]):
+        self._free.extend(insts)
+
+
+class MoveCounter:
+    """
+    instructions moved between the stages of one pipeline since the start of the simulation,
+    the pipeline compares it before and after a cycle to find cycles in which nothing happened.
+    """
+    __slots__ = ("moved",)
+    moved: int
+
+    def __init__(self):
+        self.moved = 0
+
+
+@dataclass(slots=True)
+class BranchPipeline:
+    issue_queue: IssueQueueStage
+    chain: StageChain
+    in_flight: int
+
+    def __init__(self, moves: Optional[MoveCounter] = None):
+        self.issue_queue = IssueQueueStage(15, name="Branch_IssueQueue", moves=moves)
+        self.chain = StageChain(self.issue_queue, ("EX", "RF", "ISSUE", "MAP", "FIN", "XMIT"))
+        self.in_flight = 0
+
+    def stages(self) -> list[Stage]:
+        return [self.issue_queue]
+
+    def forward(self, now: int) -> Optional[InstructionInfo]:
+        if not self.in_flight:
+            return None
+        inst = self.chain.forward()
+        if inst is None:
+            return None
+        self.in_flight -= 1
+        if inst.branch_mode == BranchInstruction.BranchMode.RET:
+            inst.task.mark_completed(now)
+            if trace.pipeline:
+                trace.log("pipeline", f"task {inst.task.id} completed at cycle {now}", trace.Level.INFO)
+            if trace.recording:
+                trace.record(now, trace.Event.TASK_COMPLETED, inst.task.id)
+        return inst
 
     def issue(self, inst: list[InstructionInfo]):
         self.issue_queue.add_insts(inst)
+        self.in_flight += len(inst)
 
 
 class Stage:
+    __slots__ = ("previous", "internal_content", "completion_rate", "name", "moves", "_out")
     previous: Stage
     internal_size: int
-    internal_content: LimitedList[InstructionInfo]
-
-    def __init__(self, previous: Stage, internal_size: int, completion_rate: int = 1, name: str = "Stage"):
+    internal_content: RingBuffer[InstructionInfo]
+    moves: MoveCounter  # shared by all stages of a pipeline
+    _out: list[InstructionInfo]
+
+    def __init__(self, previous: Stage, internal_size: int, completion_rate: int = 1, name: str = "Stage",
+                 moves: Optional[MoveCounter] = None):
+        """
+        :param moves: counts the moves of the pipeline, the one of previous or a new one if not given
+        """
         assert internal_size >= 0
 
         self.previous = previous
-        self.internal_content = LimitedList(internal_size)
+        if moves is None:
+            moves = previous.moves if previous is not None else MoveCounter()
+        self.moves = moves
+        self.internal_content = RingBuffer(internal_size)
         self.completion_rate = completion_rate
         self.name = name
-
-    def forward(self, mask: Optional[list[bool]] = None) -> list[InstructionInfo]:
-        finished_count = min(self.completion_rate, len(self.internal_content))
-        if mask:
-            assert len(list(filter(lambda x: x, mask))) <= finished_count
-
-        if mask:
-            res = [
-                self.internal_content.pop(i) for i, m in enumerate(mask) if m
-            ]
-        else:
-            res = [self.internal_content.pop(0) for _ in range(finished_count)]
-
-        # print(f"{self.name} passed {len(res)} instructions along")
-        # load new ones (must be one cycle here)
+        self._out = []
+
+    def forward(self, mask: Optional[list[bool]] = None, space: Optional[int] = None) -> list[InstructionInfo]:
+        """
+        passes finished instructions along and pulls new ones from the previous stage.
+
+        :param mask: positions of the instructions to pass, all finished ones if not given
+        :param space: how many instructions the caller can take at most
+        :return: a list that is reused by the next call, callers must consume it right away
+        """
+        content = self.internal_content
+        finished_count = self.completion_rate
+        if space is not None and space < finished_count:
+            finished_count = space
+
+        res = self._out
+        res.clear()
+        if mask is not None:
+            assert sum(mask) <= min(finished_count, len(content))
+            content.remove_masked(mask, res)
+        elif finished_count and content:
+            content.pop_into(res, finished_count)
+        if res:
+            self.moves.moved += len(res)
+
+        # load new ones (must be one cycle here), never more than fit
         if self.previous:
-            self.internal_content.extend(self.previous.forward())
+            new = self.previous.forward(space=content.free)
+            if new:
+                content.extend(new)
         return res
 
+    def waiting(self) -> int:
+        """
+        :return: cycles in which the stage holds back its oldest instruction
+        """
+        return 0
+
+    def skip(self, cycles: int):
+        """
+        lets cycles pass in which no instruction moves.
+        """
+        pass
+
+
+class TimedStage(Stage):
+    """
+    a stage that works on one instruction at a time for several cycles, e.g. a data access.
+    """
+    __slots__ = ("latency", "_remaining")
+    latency: int
+    _remaining: int  # cycles the oldest instruction still needs
+
+    def __init__(self, previous: Stage, internal_size: int, latency: int, name: str = "Stage"):
+        assert latency >= 1
+        super().__init__(previous, internal_size, name=name)
+        self.latency = latency
+        self._remaining = 0
+
+    def forward(self, mask: Optional[list[bool]] = None, space: Optional[int] = None) -> list[InstructionInfo]:
+        if self._remaining:
+            self._remaining -= 1
+            space = 0
+        was_empty = not self.internal_content
+        res = super().forward(mask, space)
+        # the next instruction starts as soon as the previous one left
+        if (res or was_empty) and self.internal_content:
+            self._remaining = self.latency - 1
+        return res
+
+    def waiting(self) -> int:
+        return self._remaining
+
+    def skip(self, cycles: int):
+        self._remaining = max(self._remaining - cycles, 0)
+
+
+def branch_taken(task: Task, index: int) -> bool:
+    """
+    decides the branch at index of the program of task, updating its branch counters.
+    """
+    program = task.instructions
+    mode = BRANCH_MODES[program.branch_modes[index]]
+    if mode.always:
+        return True
+
+    match mode:
+        case BranchInstruction.BranchMode.PROB:
+            return task.rng.random() < program.probabilities[index]
+        case BranchInstruction.BranchMode.UNTIL if program.counter_maxes[index] > 0:
+            # taken counter_max times, then falls through once
+            slot = program.branch_slots[index]
+            counter = task.branch_counters[slot] + 1
+            if counter <= program.counter_maxes[index]:
+                task.branch_counters[slot] = counter
+                return True
+            task.branch_counters[slot] = 0 if program.reset_counters[index] else counter
+            return False
+        case BranchInstruction.BranchMode.FROM if program.counter_maxes[index] > 0:
+            # falls through until it was reached counter_max times
+            slot = program.branch_slots[index]
+            counter = task.branch_counters[slot] + 1
+            if counter >= program.counter_maxes[index]:
+                task.branch_counters[slot] = 0 if program.reset_counters[index] else counter
+                return True
+            task.branch_counters[slot] = counter
+            return False
+    return False
+
 
 class PipelineStart(Stage):
+    __slots__ = ("threads", "next_fetch_index", "pool", "_ifb_additions")
     threads: list[Task]
     next_fetch_index: int
+    pool: InstructionPool
+    _ifb_additions: list[list[InstructionInfo]]
 
-    def __init__(self, threads: list[Task]):
-        super().__init__(None, 0)
+    def __init__(self, threads: list[Task], pool: Optional[InstructionPool] = None,
+                 moves: Optional[MoveCounter] = None):
+        super().__init__(None, 0, moves=moves)
         self.threads = threads
         self.next_fetch_index = 0
-        len(threads) - 1
+        self.pool = pool or InstructionPool()
+        self._ifb_additions = [[], [], [], []]
+
+    def exhausted(self) -> bool:
+        return all(task.inst_index >= len(task.instructions) for task in self.threads)
 
     def forward(self) -> list[list[InstructionInfo]]:
+        ifb_additions = self._ifb_additions
+        for additions in ifb_additions:
+            additions.clear()
+        if not self.threads:
+            return ifb_additions
 
         task_to_fetch_from = self.threads[self.next_fetch_index]
-
-        instructions = task_to_fetch_from.instructions[
-                       task_to_fetch_from.inst_index:task_to_fetch_from.inst_index + 8
-                       ]
-        instructions = list(
-            map(lambda inst: InstructionInfo(inst, task_to_fetch_from), instructions)
-        )
-        for i, inst in enumerate(instructions):
-            match inst:
-                case InstructionInfo(inst=BranchInstruction(), task=task):
-                    # determine branches
-                    print("branch")
-                    branch = inst.inst
-                    if branch.branch_mode.always:
-                        branch.target_index_delta += self.next_fetch_index + i
-                    if branch.type == BranchInstruction.BranchMode.PROB and branch.probability >= random():
-                        branch.target_index_delta += self.next_fetch_index + i
-                    if branch.type == BranchInstruction.BranchMode.UNTIL and branch.counter_max > 0:
-                        branch.counter += 1
-                        if branch.counter <= branch.counter_max:
-                            branch.target_index_delta += self.next_fetch_index + i
-                            if branch.reset_counter: branch.counter = 0
-                    if branch.type == BranchInstruction.BranchMode.FROM and branch.counter_max > 0:
-                        branch.counter += 1
-                        if branch.counter >= branch.counter_max:
-                            branch.target_index_delta += self.next_fetch_index + i
-                            if branch.reset_counter: branch.counter = 0
-
-        ifb_additions = [[], [], [], []]
-        ifb_additions[self.next_fetch_index] = instructions
-
-        task_to_fetch_from.inst_index += 8
+        program = task_to_fetch_from.instructions
+        start = task_to_fetch_from.inst_index
+
+        types = program.types
+        modes = program.branch_modes
+        end = min(start + 8, len(program))
+        next_index = end
+        # fetching stops after the first taken branch
+        for i in range(start, end):
+            mode = modes[i]
+            if mode and branch_taken(task_to_fetch_from, i):
+                end = i + 1
+                if BRANCH_MODES[mode] == BranchInstruction.BranchMode.RET:
+                    next_index = len(program)  # nothing left to fetch
+                else:
+                    next_index = i + program.target_deltas[i]
+                break
+
+        instructions = ifb_additions[self.next_fetch_index]
+        for i in range(start, end):
+            instructions.append(
+                self.pool.acquire(INSTRUCTION_TYPES[types[i]], BRANCH_MODES[modes[i]], task_to_fetch_from)
+            )
+
+        task_to_fetch_from.inst_index = next_index
         self.next_fetch_index = (self.next_fetch_index + 1) % len(self.threads)
-        print(f"Pipeline start fetched {len(instructions)} instructions")
+        # moving on to the next thread changes what the next cycle fetches, unless nothing is left anywhere
+        if instructions or not self.exhausted():
+            self.moves.moved += len(instructions) + 1
+        if trace.fetch:
+            trace.log("fetch", f"fetched {len(instructions)} instructions of task {task_to_fetch_from.id}")
         return ifb_additions
 
 
-def even_take(l1: list, l2: list, n: int) -> Generator[InstructionInfo]:
+def even_take(l1: RingBuffer, l2: RingBuffer, n: int) -> Generator[InstructionInfo]:
     while n >= 0:
         if len(l1) > 0:
-            yield l1.pop(0)
+            yield l1.popleft()
             n -= 1
         if len(l2) > 0:
-            yield l2.pop(0)
+            yield l2.popleft()
             n -= 1
         if len(l1) == 0 and len(l2) == 0:
             break
 
 
 class IFBStage(Stage):
-    thread_buffers: list[LimitedList]
+    __slots__ = ("thread_buffers", "_lower", "_decode_instructions")
+    thread_buffers: list[RingBuffer]
     _lower: bool
     previous: PipelineStart
+    _decode_instructions: list[list[InstructionInfo]]
 
     def __init__(self, previous: PipelineStart):
         super().__init__(previous, 0)
-        self.thread_buffers = [LimitedList(26), LimitedList(26), LimitedList(26), LimitedList(26)]
+        self.thread_buffers = [RingBuffer(26), RingBuffer(26), RingBuffer(26), RingBuffer(26)]
         self._lower = False
+        self._decode_instructions = [[], []]
 
-    def forward(self, n: int = 6) -> list[list[InstructionInfo]]:
+    def forward(self, n: int = 6, space: tuple[int, int] = (3, 3)) -> list[list[InstructionInfo]]:
+        """
+        :param n: instructions to pass to decode in total
+        :param space: how many instructions each of the two decode pipelines can take
+        """
         # take from up to two threads for decode
         index_add = int(self._lower)
 
         max_halve = int(n / 2)
-        takentop = min(len(self.thread_buffers[index_add]), max_halve + int(n % 2 == 1))
-        takenlower = min(len(self.thread_buffers[2 + index_add]), max_halve)
-        decode_instructions = [
-            list(self.thread_buffers[index_add].pop(0) for _ in range(takentop)),
-            list(self.thread_buffers[2 + index_add].pop(0) for _ in range(takenlower)),
-        ]
+        takentop = min(max_halve + int(n % 2 == 1), space[0])
+        takenlower = min(max_halve, space[1])
+        decode_instructions = self._decode_instructions
+        top, lower = decode_instructions
+        top.clear()
+        lower.clear()
+        self.thread_buffers[index_add].pop_into(top, takentop)
+        self.thread_buffers[2 + index_add].pop_into(lower, takenlower)
         self._lower = not self._lower
+        if top or lower:
+            self.moves.moved += len(top) + len(lower)
 
         buffer_fill = self.previous.next_fetch_index
         if len(self.thread_buffers[buffer_fill]) < 26 - 8:
             self.thread_buffers[buffer_fill].extend(self.previous.forward()[buffer_fill])
 
-        print(f"IFB stage passed {len(decode_instructions[0]) + len(decode_instructions[1])} instructions along")
-        print(
-            f"ifb status: t1: {len(self.thread_buffers[0])}, t2: {len(self.thread_buffers[1])} t3: {len(self.thread_buffers[2])} t4: {len(self.thread_buffers[3])}")
+        if trace.ifb:
+            trace.log("ifb", f"passed {len(top) + len(lower)} instructions along, status: "
+                             f"t1: {len(self.thread_buffers[0])}, t2: {len(self.thread_buffers[1])} "
+                             f"t3: {len(self.thread_buffers[2])} t4: {len(self.thread_buffers[3])}")
         return decode_instructions
 
+    def skip(self, cycles: int):
+        if cycles % 2:
+            self._lower = not self._lower
+        # fetch still visits the threads it has room for, without finding anything
+        start = self.previous
+        if not start.threads:
+            return
+        for _ in range(min(cycles, len(start.threads))):
+            if len(self.thread_buffers[start.next_fetch_index]) >= 26 - 8:
+                return
+            start.next_fetch_index = (start.next_fetch_index + 1) % len(start.threads)
+        if cycles > len(start.threads):
+            start.next_fetch_index = (start.next_fetch_index + cycles - len(start.threads)) % len(start.threads)
+
     def peek_ready(self) -> list[InstructionInfo]:
         index_add = int(self._lower)
         takentop = min(len(self.thread_buffers[index_add]), 3)
@@ -184,6 +379,8 @@ class IFBStage(Stage):
 
 
 class DecodePipeline:
+    __slots__ = ("prev_dummy", "decode_unit", "crk_unit", "xfr_unit", "predispatch0_unit", "predispatch1_unit",
+                 "transfer_unit", "dispatch_unit", "_pulling")
     prev_dummy: Stage
     decode_unit: Stage
     crk_unit: Stage
@@ -192,159 +389,309 @@ class DecodePipeline:
     predispatch1_unit: Stage
     transfer_unit: Stage
     dispatch_unit: Stage
+    _pulling: tuple[Stage, ...]  # the stages in front of dispatch, the newest first
 
     class PreviousDummy(Stage):
-        avail: list[InstructionInfo]
-
-        def __init__(self):
-            super().__init__(None, 0)
-            self.avail = []
-
-        def forward(self) -> list[InstructionInfo]:
-            return self.avail
-
-    def __init__(self):
-        self.prev_dummy = DecodePipeline.PreviousDummy()
-        self.decode_unit = Stage(self.prev_dummy, 3, name="Decode")
-        self.crk_unit = Stage(self.decode_unit, 3, name="CRK")
-        self.xfr_unit = Stage(self.crk_unit, 3, name="XFR")
-        self.predispatch0_unit = Stage(self.xfr_unit, 3, name="PRED0")
-        self.predispatch1_unit = Stage(self.predispatch0_unit, 3, name="PRED1")
-        self.transfer_unit = Stage(self.predispatch1_unit, 3, name="XMIT")
-        self.dispatch_unit = Stage(self.transfer_unit, 3, name="DISPATCH")
-
-    def peek_ready(self) -> list[InstructionInfo]:
+        # holds the instructions handed over by the IFB until the decode stage has room for them
+        __slots__ = ("avail",)
+        avail: RingBuffer[InstructionInfo]
+
+        def __init__(self, moves: Optional[MoveCounter] = None):
+            super().__init__(None, 0, moves=moves)
+            self.avail = RingBuffer(3)
+
+        def forward(self, mask: Optional[list[bool]] = None, space: Optional[int] = None) -> list[InstructionInfo]:
+            res = self._out
+            res.clear()
+            self.avail.pop_into(res, len(self.avail) if space is None else space)
+            if res:
+                self.moves.moved += len(res)
+            return res
+
+    def __init__(self, moves: Optional[MoveCounter] = None):
+        self.prev_dummy = DecodePipeline.PreviousDummy(moves)
+        self.decode_unit = Stage(self.prev_dummy, 3, 3, name="Decode")
+        self.crk_unit = Stage(self.decode_unit, 3, 3, name="CRK")
+        self.xfr_unit = Stage(self.crk_unit, 3, 3, name="XFR")
+        self.predispatch0_unit = Stage(self.xfr_unit, 3, 3, name="PRED0")
+        self.predispatch1_unit = Stage(self.predispatch0_unit, 3, 3, name="PRED1")
+        self.transfer_unit = Stage(self.predispatch1_unit, 3, 3, name="XMIT")
+        self.dispatch_unit = Stage(self.transfer_unit, 3, 3, name="DISPATCH")
+        self._pulling = (self.transfer_unit, self.predispatch1_unit, self.predispatch0_unit, self.xfr_unit,
+                         self.crk_unit, self.decode_unit)
+
+    def stages(self) -> list[Stage]:
+        return [self.prev_dummy, self.decode_unit, self.crk_unit, self.xfr_unit, self.predispatch0_unit,
+                self.predispatch1_unit, self.transfer_unit, self.dispatch_unit]
+
+    def peek_ready(self) -> RingBuffer[InstructionInfo]:
         return self.dispatch_unit.internal_content
 
-    def forward(self, new_inst: list[InstructionInfo], mask: Optional[list[bool]] = None) -> list[InstructionInfo]:
-        self.prev_dummy.avail = new_inst
-        return self.dispatch_unit.forward()
+    def free_input(self) -> int:
+        return self.prev_dummy.avail.free
+
+    def forward(self, new_inst: list[InstructionInfo], mask: Optional[list[bool]] = None,
+                offset: int = 0) -> list[InstructionInfo]:
+        """
+        :param mask: positions of the ready instructions to dispatch, all that fit if not given
+        :param offset: index of the mask entry of the oldest ready instruction
+        """
+        avail = self.prev_dummy.avail
+        added = avail.extend(new_inst)
+        assert added == len(new_inst), "IFB passed more instructions than decode can take"
+
+        dispatch = self.dispatch_unit
+        res = dispatch._out
+        res.clear()
+        behind = dispatch.internal_content
+        if mask is not None:
+            behind.remove_masked(mask, res, offset)
+            assert len(res) <= dispatch.completion_rate
+        else:
+            behind.pop_into(res, dispatch.completion_rate)
+        moved = len(res)
+        # same as Stage.forward pulling through the stages: every stage passes on what fits
+        # into the one behind it after that one passed its own instructions on
+        for stage in self._pulling:
+            content = stage.internal_content
+            moved += content.move_into(behind, stage.completion_rate)
+            behind = content
+        moved += avail.move_into(behind, len(avail))
+        if moved:
+            self.prev_dummy.moves.moved += moved
+        return res
 
 
 class IssueQueueStage(Stage):
+    __slots__ = ()
 
     @property
     def max_add(self):
-        return self.internal_content.max_size - len(self.internal_content)
+        return self.internal_content.free
 
-    def __init__(self, size: int = 13, name: str = "IssueQueue"):
-        super().__init__(None, size, name=name)
+    def __init__(self, size: int = 13, name: str = "IssueQueue", moves: Optional[MoveCounter] = None):
+        super().__init__(None, size, name=name, moves=moves)
 
     def add_insts(self, insts: list[InstructionInfo]):
         assert len(insts) <= self.max_add
 
         self.internal_content.extend(insts)
 
-    def forward(self) -> list[InstructionInfo]:
-        return [self.internal_content.pop(0) for _ in range(min(len(self.internal_content), 4))]
+    def add_inst(self, inst: InstructionInfo):
+        assert self.max_add > 0
+
+        self.internal_content.append(inst)
+
+    def forward(self, mask: Optional[list[bool]] = None, space: Optional[int] = None) -> list[InstructionInfo]:
+        res = self._out
+        res.clear()
+        self.internal_content.pop_into(res, 4 if space is None else min(4, space))
+        if res:
+            self.moves.moved += len(res)
+        return res
+
+
+class StageChain:
+    """
+    single instruction stages in a row behind an issue queue. Nothing holds an instruction back in them,
+    so all instructions move on by one stage every cycle and the chain works like a shift register.
+    """
+    __slots__ = ("issue_queue", "names", "moves", "_slots", "_occupied")
+    issue_queue: IssueQueueStage
+    names: tuple[str, ...]
+    moves: MoveCounter
+    _slots: deque[Optional[InstructionInfo]]  # the last stage on the right
+    _occupied: int  # slots holding an instruction
+
+    def __init__(self, issue_queue: IssueQueueStage, names: tuple[str, ...]):
+        self.issue_queue = issue_queue
+        self.names = names
+        self.moves = issue_queue.moves
+        self._slots = deque([None] * len(names), maxlen=len(names))
+        self._occupied = 0
+
+    def __len__(self) -> int:
+        return self._occupied
+
+    def forward(self) -> Optional[InstructionInfo]:
+        """
+        :return: the instruction leaving the last stage
+        """
+        queue = self.issue_queue.internal_content
+        new = queue.popleft() if queue else None
+        slots = self._slots
+        inst = slots.pop()
+        slots.appendleft(new)
+        occupied = self._occupied
+        if new is not None:
+            occupied += 1
+        if inst is not None:
+            occupied -= 1
+        self._occupied = occupied
+        # instructions inside the chain move on as well, even if none enters or leaves it
+        if occupied or inst is not None:
+            self.moves.moved += 1
+        return inst
 
 
 class LSUPipeline:
+    __slots__ = ("issue_queue", "chain", "address_gen", "bdcs", "dacc", "fmt", "fin", "xmit", "in_flight")
     issue_queue: IssueQueueStage
+    chain: Optional[StageChain]  # used instead of the stages if the data access takes one cycle
     address_gen: Stage
     bdcs: Stage
-    dacc: Stage
+    dacc: TimedStage
     fmt: Stage
     fin: Stage
     xmit: Stage
-
-    def __init__(self):
-        self.issue_queue = IssueQueueStage(name="LSU_IssueQueue")
-        self.address_gen = Stage(self.issue_queue, 1)
-        self.bdcs = Stage(self.address_gen, 1)
-        self.dacc = Stage(self.bdcs, 1)
-        self.fmt = Stage(self.dacc, 1)
-        self.fin = Stage(self.fmt, 1)
-        self.xmit = Stage(self.fin, 1)
-
-    def forward(self) -> list[InstructionInfo]:
-        res = self.xmit.forward()
-        return res
+    in_flight: int
+
+    def __init__(self, latency: int = LSU_LATENCY, moves: Optional[MoveCounter] = None):
+        """
+        :param latency: cycles of the data access
+        """
+        self.issue_queue = IssueQueueStage(name="LSU_IssueQueue", moves=moves)
+        self.chain = None
+        if latency == 1:
+            self.chain = StageChain(self.issue_queue, ("AGEN", "BDCS", "DACC", "FMT", "FIN", "XMIT"))
+        else:
+            self.address_gen = Stage(self.issue_queue, 1)
+            self.bdcs = Stage(self.address_gen, 1)
+            self.dacc = TimedStage(self.bdcs, 1, latency, name="DACC")
+            self.fmt = Stage(self.dacc, 1)
+            self.fin = Stage(self.fmt, 1)
+            self.xmit = Stage(self.fin, 1)
+        self.in_flight = 0
+
+    def stages(self) -> list[Stage]:
+        if self.chain is not None:
+            return [self.issue_queue]
+        return [self.issue_queue, self.address_gen, self.bdcs, self.dacc, self.fmt, self.fin, self.xmit]
+
+    def forward(self) -> Optional[InstructionInfo]:
+        if not self.in_flight:
+            return None
+        if self.chain is not None:
+            inst = self.chain.forward()
+        else:
+            res = self.xmit.forward()
+            inst = res[0] if res else None
+        if inst is not None:
+            self.in_flight -= 1
+        return inst
 
     def issue(self, inst: InstructionInfo):
-        self.issue_queue.add_insts([inst])
+        self.issue_queue.add_inst(inst)
+        self.in_flight += 1
 
 
 class FXPipeline:
+    __slots__ = ("issue_queue", "chain", "in_flight")
     issue_queue: IssueQueueStage
-    wb_stage: Stage
-    ex_stage: Stage
-    fin_stage: Stage
-    xmit_stage: Stage
+    chain: StageChain
+    in_flight: int
 
-    def __init__(self):
-        self.issue_queue = IssueQueueStage(name="FX_IssueQueue")
-        self.wb_stage = Stage(None, 1)
-        self.ex_stage = Stage(self.wb_stage, 1)
-        self.fin_stage = Stage(self.ex_stage, 1)
-        self.xmit_stage = Stage(self.fin_stage, 1)
+    def __init__(self, moves: Optional[MoveCounter] = None):
+        self.issue_queue = IssueQueueStage(name="FX_IssueQueue", moves=moves)
+        self.chain = StageChain(self.issue_queue, ("WB", "EX", "FIN", "XMIT"))
+        self.in_flight = 0
+
+    def stages(self) -> list[Stage]:
+        return [self.issue_queue]
 
     def issue(self, inst: InstructionInfo):
-        self.issue_queue.add_insts([inst])
+        self.issue_queue.add_inst(inst)
+        self.in_flight += 1
 
-    def forward(self) -> list[InstructionInfo]:
-        res = self.xmit_stage.forward()
-        return res
+    def forward(self) -> Optional[InstructionInfo]:
+        if not self.in_flight:
+            return None
+        inst = self.chain.forward()
+        if inst is not None:
+            self.in_flight -= 1
+        return inst
 
 
 class VSXPipeline:
+    __slots__ = ("issue_stage", "chain", "in_flight")
     issue_stage: IssueQueueStage
-    s1: Stage
-    s2: Stage
-    s3: Stage
-    s4: Stage
-    s5: Stage
-    s6: Stage
+    chain: StageChain
+    in_flight: int
 
-    def __init__(self):
-        self.issue_stage = IssueQueueStage(name="VSX_IssueQueue")
-        self.s1 = Stage(self.issue_stage, 1)
-        self.s2 = Stage(self.s1, 1)
-        self.s3 = Stage(self.s2, 1)
-        self.s4 = Stage(self.s3, 1)
-        self.s5 = Stage(self.s4, 1)
-        self.s6 = Stage(self.s5, 1)
-
-    def forward(self) -> list[InstructionInfo]:
-        res = self.s6.forward()
-        return res
+    def __init__(self, moves: Optional[MoveCounter] = None):
+        self.issue_stage = IssueQueueStage(name="VSX_IssueQueue", moves=moves)
+        self.chain = StageChain(self.issue_stage, ("S1", "S2", "S3", "S4", "S5", "S6"))
+        self.in_flight = 0
+
+    def stages(self) -> list[Stage]:
+        return [self.issue_stage]
+
+    def forward(self) -> Optional[InstructionInfo]:
+        if not self.in_flight:
+            return None
+        inst = self.chain.forward()
+        if inst is not None:
+            self.in_flight -= 1
+        return inst
 
     def issue(self, inst: InstructionInfo):
-        self.issue_stage.add_insts([inst])
+        self.issue_stage.add_inst(inst)
+        self.in_flight += 1
 
 
 class InternalSlice:
+    __slots__ = ("fxpipe", "vsx", "lsu", "_out")
     fxpipe: FXPipeline
     vsx: VSXPipeline
     lsu: LSUPipeline
-
-    def __init__(self):
-        self.lsu = LSUPipeline()
-        self.vsx = VSXPipeline()
-        self.fxpipe = FXPipeline()
+    _out: list[InstructionInfo]
+
+    def __init__(self, lsu_latency: int = LSU_LATENCY, moves: Optional[MoveCounter] = None):
+        self.lsu = LSUPipeline(lsu_latency, moves)
+        self.vsx = VSXPipeline(moves)
+        self.fxpipe = FXPipeline(moves)
+        self._out = []
+
+    def stages(self) -> list[Stage]:
+        return self.lsu.stages() + self.vsx.stages() + self.fxpipe.stages()
+
+    def can_issue(self, inst_type: InstructionType) -> bool:
+        match inst_type:
+            case InstructionType.FX | InstructionType.NOP:
+                return self.fxpipe.issue_queue.internal_content.free > 0
+            case InstructionType.VSU:
+                return self.vsx.issue_stage.internal_content.free > 0
+            case InstructionType.LSU:
+                return self.lsu.issue_queue.internal_content.free > 0
+        return False
 
     def forward(self, instruct: Optional[InstructionInfo], lsop: Optional[InstructionInfo]) -> list[
         InstructionInfo]:
-        res = []
-        res += self.lsu.forward()
-        res += self.vsx.forward()
-        res += self.fxpipe.forward()
-
-        match instruct:
-            case InstructionInfo(inst=InstructionType.BRANCH, task=task):
-                raise Exception("Branch must be issued to branch pipe")
-            case InstructionInfo(inst=InstructionType.FX):
-                self.fxpipe.issue(instruct)
-            case InstructionInfo(inst=InstructionType.VSU):
-                self.vsx.issue(instruct)
-            case InstructionInfo(inst=InstructionType.NOP):
-                self.fxpipe.issue(instruct)
-            case InstructionInfo(inst=InstructionType.LSU):
-                raise Exception("LSU must be added as lsop parameter")
-            case None:
-                pass
-            case _:
-                raise Exception(f"Unknown instruction type {instruct}")
+        res = self._out
+        res.clear()
+        # unrolled, iterating over the pipes allocates an iterator every cycle
+        inst = self.lsu.forward()
+        if inst is not None:
+            res.append(inst)
+        inst = self.vsx.forward()
+        if inst is not None:
+            res.append(inst)
+        inst = self.fxpipe.forward()
+        if inst is not None:
+            res.append(inst)
+
+        if instruct is not None:
+            match instruct.type:
+                case InstructionType.FX | InstructionType.NOP:
+                    self.fxpipe.issue(instruct)
+                case InstructionType.VSU:
+                    self.vsx.issue(instruct)
+                case InstructionType.BRANCH:
+                    raise Exception("Branch must be issued to branch pipe")
+                case InstructionType.LSU:
+                    raise Exception("LSU must be added as lsop parameter")
+                case _:
+                    raise Exception(f"Unknown instruction type {instruct}")
 
         if lsop:
             self.lsu.issue(lsop)
@@ -353,88 +700,246 @@ class InternalSlice:
 
 
 class Pipeline:
+    __slots__ = ("ifb", "decode_pipelines", "slices", "branch_pipeline", "pool", "moves", "cycle", "_completed",
+                 "_decode_ready", "_mask", "_decoded", "_branches", "_calcs", "_stores", "_quiet", "_timed", "counters")
     ifb: IFBStage
     decode_pipelines: list[DecodePipeline]
     slices: list[InternalSlice]
     branch_pipeline: BranchPipeline
-
-    def __init__(self, tasks: list[Task]):
-        self.ifb = IFBStage(PipelineStart(tasks))
-        self.decode_pipelines = [DecodePipeline() for _ in range(2)]
-        self.branch_pipeline = BranchPipeline()
-        self.slices = [InternalSlice() for _ in range(4)]
-
-    def tick(self):
-        decode_ready = []
-
-        for i in range(2):
-            decode_ready += self.decode_pipelines[i].peek_ready()
-        divider = len(self.decode_pipelines[0].peek_ready())
-
+    pool: InstructionPool
+    moves: MoveCounter  # of all stages of this pipeline
+    cycle: int
+    _completed: list[InstructionInfo]
+    _decode_ready: list[InstructionInfo]
+    _mask: list[bool]
+    _decoded: list[InstructionInfo]
+    _branches: list[InstructionInfo]
+    _calcs: list[InstructionInfo]
+    _stores: list[InstructionInfo]
+    _quiet: int  # cycles in a row in which no instruction moved
+    _timed: list[Stage]  # stages with a latency above one cycle
+    counters: Optional[Counters]
+
+    def __init__(self, tasks: list[Task], lsu_latency: int = LSU_LATENCY, counters: Optional[Counters] = None):
+        """
+        :param counters: counts the performance events of every cycle if given
+        """
+        self.pool = InstructionPool()
+        self.moves = MoveCounter()
+        self.ifb = IFBStage(PipelineStart(tasks, self.pool, self.moves))
+        self.decode_pipelines = [DecodePipeline(self.moves) for _ in range(2)]
+        self.branch_pipeline = BranchPipeline(self.moves)
+        self.slices = [InternalSlice(lsu_latency, self.moves) for _ in range(4)]
+        self.cycle = 0
+        self.counters = counters
+        self._quiet = 0
+        self._timed = [stage for stage in self.stages() if isinstance(stage, TimedStage) and stage.latency > 1]
+        self._completed = []
+        self._decode_ready = []
+        self._mask = []
+        self._decoded = []
+        self._branches = []
+        self._calcs = []
+        self._stores = []
+
+    def stages(self) -> list[Stage]:
+        stages = [self.ifb.previous, self.ifb]
+        for decode_pipeline in self.decode_pipelines:
+            stages += decode_pipeline.stages()
+        stages += self.branch_pipeline.stages()
+        for internal_slice in self.slices:
+            stages += internal_slice.stages()
+        return stages
+
+    def set_tasks(self, tasks: list[Task]):
+        """
+        fetches from tasks from the next cycle on. Instructions fetched before stay in flight and complete.
+        A task that was fetched from before keeps its thread buffer if it still exists.
+
+        :param tasks: at most four, none to only let the instructions in flight complete
+        """
+        assert len(tasks) <= 4, "the pipeline runs at most four threads"
+        start = self.ifb.previous
+        previous = {id(task): index for index, task in enumerate(start.threads)}
+        threads = [None] * len(tasks)
+        moved = []
+        for task in tasks:
+            index = previous.get(id(task))
+            if index is not None and index < len(tasks) and threads[index] is None:
+                threads[index] = task
+            else:
+                moved.append(task)
+        for index in range(len(threads)):
+            if threads[index] is None:
+                threads[index] = moved.pop(0)
+        start.threads = threads
+        start.next_fetch_index = 0
+        # the new tasks have something to fetch
+        self._quiet = 0
+
+    def run_for(self, cycles: int, completed: Optional[dict[int, int]] = None) -> int:
+        """
+        simulates cycles cycles, skipping the ones in which nothing moves.
+
+        :param completed: task id -> instructions completed, counted up if given
+        :return: number of instructions completed
+        """
+        end = self.cycle + cycles
+        count = 0
+        while self.cycle < end:
+            next_cycle = self.next_busy_cycle()
+            if next_cycle is None or next_cycle > end:
+                self.skip(end - self.cycle)
+                break
+            if next_cycle > self.cycle + 1:
+                self.skip(next_cycle - self.cycle - 1)
+            insts = self.tick()
+            count += len(insts)
+            if completed is not None:
+                for inst in insts:
+                    completed[inst.task.id] = completed.get(inst.task.id, 0) + 1
+        return count
+
+    def drain(self, completed: Optional[dict[int, int]] = None) -> int:
+        """
+        stops fetching and simulates until no instruction is left in flight.
+
+        :param completed: task id -> instructions completed, counted up if given
+        :return: number of instructions completed
+        """
+        self.set_tasks([])
+        count = 0
+        while (next_cycle := self.next_busy_cycle()) is not None:
+            count += self.run_for(next_cycle - self.cycle, completed)
+        return count
+
+    def next_busy_cycle(self) -> Optional[int]:
+        """
+        :return: the next cycle in which an instruction can move, None if that never happens again
+            because the pipeline is drained or stuck
+        """
+        if self._quiet < 2:
+            # a single quiet cycle proves nothing, the IFB alternates between the threads
+            return self.cycle + 1
+        # nothing else changes until a timed stage lets its instruction go, one that is done waiting
+        # lets it go in the next cycle
+        waiting = [stage.waiting() for stage in self._timed if stage.internal_content]
+        if not waiting:
+            return None
+        return self.cycle + min(waiting) + 1
+
+    def skip(self, cycles: int):
+        """
+        moves the clock forward without simulating cycles in which nothing moves.
+        """
+        if self.counters is not None:
+            self.counters.count_idle(self, cycles)
+        for stage in self._timed:
+            stage.skip(cycles)
+        self.ifb.skip(cycles)
+        self.cycle += cycles
+        if trace.pipeline:
+            trace.log("pipeline", f"skipped {cycles} idle cycles to cycle {self.cycle}")
+
+    def advance(self) -> list[InstructionInfo]:
+        """
+        simulates the next cycle in which anything happens.
+        Cycles in which all instructions wait for a multi-cycle stage are skipped,
+        so instructions complete in the same cycles as with tick(). Only long data accesses leave such cycles:
+        with 4 threads of mul_row_thread it is about 2.9x faster than tick() at an LSU latency of 50,
+        1.6x at 20 and no faster at 1.
+
+        :return: the instructions completed in that cycle, only valid until the next call
+        """
+        next_cycle = self.next_busy_cycle()
+        if next_cycle is not None and next_cycle > self.cycle + 1:
+            self.skip(next_cycle - self.cycle - 1)
+        return self.tick()
+
+    def tick(self) -> list[InstructionInfo]:
+        """
+        simulates one cycle.
+
+        :return: the instructions completed in this cycle, only valid until the next tick
+        """
+        moves = self.moves
+        moved = moves.moved
+        # records completed last cycle can be reused now
+        completed = self._completed
+        self.pool.release(completed)
+        completed.clear()
+        self.cycle += 1
+
+        top, lower = self.decode_pipelines
+        decode_ready = self._decode_ready
+        decode_ready.clear()
+        top_ready = top.peek_ready().copy_into(decode_ready)
+        lower.peek_ready().copy_into(decode_ready)
+
+        # dispatch at most one branch, three calculations and three loads/stores,
+        # and only as many as the issue queues can take.
         branches = 0
         calc = 0
         store = 0
-        mask = [True] * len(decode_ready)
-        for i, inst in enumerate(decode_ready):
-            if inst.inst.type == InstructionType.BRANCH:
+        dispatched_calcs = 0
+        dispatched_stores = 0
+        mask = self._mask
+        mask.clear()
+        slices = self.slices
+        for inst in decode_ready:
+            take = True
+            kind = inst.type
+            if kind is InstructionType.BRANCH:
                 branches += 1
-                if branches >= 2:
-                    mask[i] = False
-            if inst.inst.type.is_vsx() or inst.inst.type.is_fx():
+                take = branches < 2 and self.branch_pipeline.issue_queue.internal_content.free > 0
+            elif kind in CALCULATIONS:
                 calc += 1
-                if calc >= 4:
-                    mask[i] = False
-            if inst.inst.type == InstructionType.LSU:
+                take = calc < 4 and slices[dispatched_calcs].can_issue(kind)
+                dispatched_calcs += take
+            elif kind is InstructionType.LSU:
                 store += 1
-                if store >= 4:
-                    mask[i] = False
-
-        decoded: list[InstructionInfo] = []
-        for i in range(2):
-            decoded += self.decode_pipelines[i].forward(decode_ready, mask[i * divider:(i + 1) * divider])
-
-        branches = list(filter(lambda x: x.inst.type == InstructionType.BRANCH, decoded))
-        calcs = list(filter(lambda x: x.inst.type.is_vsx() or x.inst.type.is_fx(), decoded))
-        stores = list(filter(lambda x: x.inst.type == InstructionType.LSU, decoded))
-
-        completed = []
+                take = store < 4 and slices[dispatched_stores].can_issue(kind)
+                dispatched_stores += take
+            mask.append(take)
+
+        ifb_out = self.ifb.forward(6, (top.free_input(), lower.free_input()))
+
+        decoded = self._decoded
+        decoded.clear()
+        decoded += top.forward(ifb_out[0], mask)
+        decoded += lower.forward(ifb_out[1], mask, top_ready)
+
+        branches = self._branches
+        calcs = self._calcs
+        stores = self._stores
+        branches.clear()
+        calcs.clear()
+        stores.clear()
+        for inst in decoded:
+            kind = inst.type
+            if kind is InstructionType.BRANCH:
+                branches.append(inst)
+            elif kind in CALCULATIONS:
+                calcs.append(inst)
+            elif kind is InstructionType.LSU:
+                stores.append(inst)
+
+        branch = self.branch_pipeline.forward(self.cycle)
+        if branch is not None:
+            completed.append(branch)
         self.branch_pipeline.issue(branches)
+        calcs_count = len(calcs)
+        stores_count = len(stores)
         for i in range(4):
-            calc = None
-            lsu = None
-            if i < len(calcs):
-                calc = calcs[i]
-            if i < len(stores):
-                lsu = stores[i]
-            completed += self.slices[i].forward(calc, lsu)
-
-        not_taken = sum(mask)
-        print(not_taken)
-        self.ifb.forward(6 - not_taken)
-
+            completed += slices[i].forward(calcs[i] if i < calcs_count else None,
+                                           stores[i] if i < stores_count else None)
+
+        self._quiet = self._quiet + 1 if moves.moved == moved else 0
+        if self.counters is not None:
+            self.counters.count(self, decode_ready, mask, completed)
+        if trace.pipeline:
+            trace.log("pipeline", f"cycle {self.cycle}: dispatched {len(decoded)}, completed {len(completed)}")
+        if trace.recording:
+            for inst in completed:
+                trace.record(self.cycle, trace.Event.INSTRUCTION_COMPLETED, inst.task.id, inst.type.value)
         return completed
-
-
-def pipeline_tick(processor_state: ProcessorState, active_tasks: list[Task]):
-    # possible inputs:
-    # [Taks, None, None, None]
-    # [Task, Task, None, None]
-    # [Task, Task, Task, Task]
-    assert len(active_tasks) == 4  # filled with None for inactive thread slots
-
-    # HW threads:
-    thread_one, thread_two, thread_three, thread_four = active_tasks
-    assert thread_one is not None, "First thread must always be active"
-    if not thread_two:
-        thread_two = thread_one
-    if not thread_three:
-        thread_three = thread_one
-    if not thread_four:
-        thread_four = thread_two
-
-    step_complete_instructions(processor_state)
-    pass
-
-
-def decode_pipeline(inst: list[InstructionType]) -> list[InstructionType]:
-    pass
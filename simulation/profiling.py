@@ -0,0 +1,245 @@
+"""
+wall time attribution for the simulator.
+
+enable() replaces the methods listed in TARGETS and the STAGE_METHODS of Stage and every subclass of it
+that defines them with timed wrappers, disable() puts the original methods back. Nothing is wrapped while profiling is disabled, so it costs nothing then.
+Schedulers are passed around as plain functions, the engines wrap them through scheduler(),
+which returns the function itself while profiling is disabled.
+
+    with profiling.profiled() as profile:
+        run_simulation_on_pipeline(tasks, round_robin_smt4)
+    print(profile.table())
+    profile.write_collapsed(Path("profile.folded"))
+
+The collapsed stacks hold the self time of every call path in microseconds, one path per line,
+which flamegraph.pl, inferno or speedscope render as a flame graph.
+
+usage: python -m simulation.profiling --workload workload/matrix.dump:mul_row_thread=4 --cycles 100000 \
+           --scheduler round_robin_smt4 --output profile.folded
+"""
+import argparse
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Callable, Iterator, Optional
+
+from simulation.counters import Counters
+from simulation.pipeline import (BranchPipeline, DecodePipeline, FXPipeline, InternalSlice, LSUPipeline, Pipeline,
+                                 Stage, StageChain, VSXPipeline)
+
+# class -> names of the methods timed in it, besides the stages
+TARGETS: tuple[tuple[type, tuple[str, ...]], ...] = (
+    (Pipeline, ("tick", "skip", "set_tasks", "next_busy_cycle")),
+    (DecodePipeline, ("forward",)),
+    (BranchPipeline, ("forward", "issue")),
+    (InternalSlice, ("forward",)),
+    (LSUPipeline, ("forward", "issue")),
+    (FXPipeline, ("forward", "issue")),
+    (VSXPipeline, ("forward", "issue")),
+    (StageChain, ("forward",)),
+    (Counters, ("count", "count_idle")),
+)
+# timed in every stage class that defines them, so each stage is charged its own time
+STAGE_METHODS = ("forward", "skip")
+
+active: Optional["Profile"] = None
+_originals: list[tuple[type, str, Callable]] = []
+
+
+class Profile:
+    """
+    call paths are kept as a tree of nodes, node 0 is the root, every other node is one name below its parent.
+    """
+    _nodes: dict[tuple[int, str], int]  # parent node, name -> node
+    _parents: list[int]
+    _names: list[str]
+    _calls: list[int]  # node -> times it was entered
+    _nanoseconds: list[int]  # node -> time spent in it, including its children
+    _current: int
+    _schedulers: dict[int, Callable]  # id of a scheduler -> its timed wrapper
+
+    def __init__(self):
+        self._nodes = {}
+        self._parents = [0]
+        self._names = [""]
+        self._calls = [0]
+        self._nanoseconds = [0]
+        self._current = 0
+        self._schedulers = {}
+
+    def timed(self, function: Callable, name: str) -> Callable:
+        nodes = self._nodes
+        calls = self._calls
+        nanoseconds = self._nanoseconds
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            parent = self._current
+            node = nodes.get((parent, name))
+            if node is None:
+                node = self._node(parent, name)
+            self._current = node
+            calls[node] += 1
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                nanoseconds[node] += perf_counter_ns() - start
+                self._current = parent
+
+        return wrapper
+
+    def _node(self, parent: int, name: str) -> int:
+        node = self._nodes[parent, name] = len(self._names)
+        self._parents.append(parent)
+        self._names.append(name)
+        self._calls.append(0)
+        self._nanoseconds.append(0)
+        return node
+
+    def scheduler(self, algorithm: Callable) -> Callable:
+        wrapper = self._schedulers.get(id(algorithm))
+        if wrapper is None:
+            name = getattr(algorithm, "__name__", None) or getattr(algorithm, "func", algorithm).__name__
+            wrapper = self._schedulers[id(algorithm)] = self.timed(algorithm, f"scheduler:{name}")
+        return wrapper
+
+    def _path(self, node: int) -> list[str]:
+        path = []
+        while node:
+            path.append(self._names[node])
+            node = self._parents[node]
+        return path[::-1]
+
+    def self_times(self) -> list[int]:
+        """
+        :return: node -> nanoseconds spent in it but not in its children
+        """
+        own = list(self._nanoseconds)
+        for node in range(1, len(own)):
+            own[self._parents[node]] -= self._nanoseconds[node]
+        return own
+
+    def collapsed(self) -> Iterator[str]:
+        """
+        :return: lines of call path and self time in microseconds, e.g. Pipeline.tick;IFBStage.forward 1234
+        """
+        for node, nanoseconds in enumerate(self.self_times()):
+            if node and nanoseconds >= 1000:
+                yield f"{';'.join(self._path(node))} {nanoseconds // 1000}"
+
+    def write_collapsed(self, path: Path):
+        with open(path, "w") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+    def totals(self) -> dict[str, tuple[int, int, int]]:
+        """
+        :return: name -> calls, nanoseconds including callees, nanoseconds in itself, summed over all call paths.
+            A name called from within itself is only counted once
+        """
+        totals = {}
+        own = self.self_times()
+        for node in range(1, len(self._names)):
+            name = self._names[node]
+            calls, total, self_time = totals.get(name, (0, 0, 0))
+            recursive = name in self._path(self._parents[node])
+            totals[name] = (calls + self._calls[node], total + (0 if recursive else self._nanoseconds[node]),
+                            self_time + own[node])
+        return totals
+
+    def table(self) -> str:
+        """
+        :return: the time of every timed method, the slowest first
+        """
+        totals = self.totals()
+        wall = sum(self._nanoseconds[node] for (parent, _), node in self._nodes.items() if parent == 0)
+        lines = [f"{'method':<32} {'calls':>10} {'total ms':>10} {'self ms':>10} {'self %':>7} {'us/call':>8}"]
+        for name, (calls, total, self_time) in sorted(totals.items(), key=lambda item: -item[1][2]):
+            lines.append(f"{name:<32} {calls:>10} {total / 1e6:>10.1f} {self_time / 1e6:>10.1f} "
+                         f"{100 * self_time / wall if wall else 0.0:>6.1f}% {total / calls / 1e3 if calls else 0.0:>8.2f}")
+        return "\n".join(lines)
+
+
+def _stage_targets(cls: type = Stage) -> Iterator[tuple[type, tuple[str, ...]]]:
+    yield cls, tuple(name for name in STAGE_METHODS if name in cls.__dict__)
+    for subclass in cls.__subclasses__():
+        yield from _stage_targets(subclass)
+
+
+def enable() -> Profile:
+    """
+    starts timing into a new Profile, replacing the methods of TARGETS and of the stages.
+    """
+    global active
+    disable()
+    active = Profile()
+    for cls, names in (*TARGETS, *_stage_targets()):
+        for name in names:
+            method = cls.__dict__[name]
+            _originals.append((cls, name, method))
+            setattr(cls, name, active.timed(method, f"{cls.__qualname__}.{name}"))
+    return active
+
+
+def disable() -> Optional[Profile]:
+    """
+    restores the original methods.
+
+    :return: the profile that was active
+    """
+    global active
+    while _originals:
+        cls, name, method = _originals.pop()
+        setattr(cls, name, method)
+    profile, active = active, None
+    return profile
+
+
+@contextmanager
+def profiled() -> Iterator[Profile]:
+    profile = enable()
+    try:
+        yield profile
+    finally:
+        disable()
+
+
+def scheduler(algorithm: Callable) -> Callable:
+    """
+    :return: algorithm timed as scheduler:<name> while profiling, algorithm itself otherwise
+    """
+    if active is None:
+        return algorithm
+    return active.scheduler(algorithm)
+
+
+def main(argv: Optional[list[str]] = None):
+    from simulation import profiling  # the engines look at this module, not at __main__
+    from simulation.load_exec import create_tasks, load_program
+    from simulation.scheduling import get_scheduler, scheduler_names
+    from simulation.simulation import run_simulation_on_pipeline
+    from simulation.sweep import Workload
+
+    parser = argparse.ArgumentParser(description="profiles a run on the cycle level pipeline")
+    parser.add_argument("--workload", type=Workload.parse, required=True, help="dump:function=threads,...")
+    parser.add_argument("--scheduler", choices=scheduler_names(), default="round_robin_smt4")
+    parser.add_argument("--cycles", type=int, default=100_000, help="stop after this many cycles")
+    parser.add_argument("--output", type=Path, help="file for the collapsed stacks")
+    args = parser.parse_args(argv)
+
+    workload = args.workload
+    program, entries = load_program(workload.dump, (fname for fname, _ in workload.thread_entries))
+    tasks = create_tasks(program, entries, dict(workload.thread_entries))
+
+    with profiling.profiled() as profile:
+        run_simulation_on_pipeline([(0, task) for task in tasks], get_scheduler(args.scheduler),
+                                   max_cycles=args.cycles)
+    print(profile.table())
+    if args.output:
+        profile.write_collapsed(args.output)
+
+
+if __name__ == '__main__':
+    main()
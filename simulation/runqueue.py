@@ -1,99 +1,181 @@
-from simulation.tasks import Task
-from typing import Optional
+from collections import defaultdict, deque
+from itertools import islice
+from operator import itemgetter
+from typing import Iterator, Optional
+
+from simulation.tasks import Task, TaskCategory
+
+type Entry = list  # [task, queued, sequence number], queued is cleared when the task is removed
 
 
 class RunQueue:
-    tasks: list[Task]
-    _iter_indices: dict[int, int]
-    _prev_index: int
+    """
+    runnable tasks, oldest first.
+
+    Every task is queued in the queue of all tasks, the queue of its category and the queue of its slot width,
+    so the oldest task of a category or width is found without a scan.
+    A removed task stays in the queues it was not popped from until it reaches their front,
+    or until the queues are rebuilt because too many removed tasks piled up.
+    A task can only be queued once at a time.
+
+    peek_next, peek_prev and the peek_prev_*_width methods walk the queue with cursors that reset_indices
+    sets back, they take time proportional to the cursor position.
+    """
+    _queue: deque[Entry]
+    _by_category: defaultdict[TaskCategory, deque[Entry]]
+    _by_width: defaultdict[int, deque[Entry]]
+    _entries: dict[int, Entry]  # id of a queued task -> its entry
+    _removed: int  # removed since the last rebuild
+    _next_sequence: int
+    _last_index: int  # cursor of peek_next from the front
+    _prev_index: int  # cursor of peek_prev from the back
+    _iter_indices: dict[int, int]  # slot width -> cursor of peek_prev_*_width from the back
 
     def __init__(self, tasks: Optional[list[Task]] = None):
-        self.tasks = tasks or []
+        self._queue = deque()
+        self._by_category = defaultdict(deque)
+        self._by_width = defaultdict(deque)
+        self._entries = {}
+        self._removed = 0
+        self._next_sequence = 0
         self.reset_indices()
+        self.add_tasks(tasks or [])
+
+    def __getstate__(self):
+        # object ids do not survive pickling, the index is rebuilt from the queue of all tasks
+        state = self.__dict__.copy()
+        del state["_entries"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._entries = {id(entry[0]): entry for entry in self._queue if entry[1]}
+
+    @staticmethod
+    def _front(queue: deque[Entry]) -> Optional[Entry]:
+        while queue and not queue[0][1]:
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def _remove(self, entry: Entry):
+        entry[1] = False
+        del self._entries[id(entry[0])]
+        self._removed += 1
+        if self._removed > len(self._entries) + 1024:
+            for queue in (self._queue, *self._by_category.values(), *self._by_width.values()):
+                queued = [e for e in queue if e[1]]
+                queue.clear()
+                queue.extend(queued)
+            self._removed = 0
 
     def add_task(self, task: Task):
-        self.tasks.append(task)
+        entry = [task, True, self._next_sequence]
+        self._next_sequence += 1
+        self._entries[id(task)] = entry
+        self._queue.append(entry)
+        self._by_category[task.category].append(entry)
+        self._by_width[task.category.value.slots_filled].append(entry)
 
     def add_tasks(self, tasks: list[Task]):
-        self.tasks.extend(tasks)
+        for task in tasks:
+            self.add_task(task)
 
     def pop_n_tasks(self, n: int) -> list[Task]:
-        n = min(n, len(self.tasks))
-        return [
-            self.tasks.pop(0) for _ in range(n)
-        ]
+        popped = []
+        while len(popped) < n and (entry := self._front(self._queue)) is not None:
+            self._queue.popleft()
+            self._remove(entry)
+            popped.append(entry[0])
+        return popped
 
     def peek_n_tasks(self, n: int) -> list[Task]:
-        # n = min(n, len(self.tasks))
-        return self.tasks[:n]
+        return [entry[0] for entry in islice(filter(itemgetter(1), self._queue), n)]
 
     def pop_specific_task(self, task: Task):
-        self.tasks.remove(task)
+        if id(task) not in self._entries:
+            raise ValueError(f"Task {task.id} is not queued")
+        self._remove(self._entries[id(task)])
 
     def peek_four(self) -> list[Task]:
-        return self.tasks[:4]
+        return self.peek_n_tasks(4)
 
     def pop_four(self) -> list[Task]:
-        return [
-            self.tasks.pop(0) for _ in range(4)
-        ]
+        assert len(self) >= 4
+        return self.pop_n_tasks(4)
 
     def peek_two(self) -> list[Task]:
-        return self.tasks[:2]
+        return self.peek_n_tasks(2)
 
     def pop_two(self) -> list[Task]:
-        return [
-            self.tasks.pop(0) for _ in range(2)
-        ]
+        assert len(self) >= 2
+        return self.pop_n_tasks(2)
 
     def peek_task(self) -> list[Task]:
-        return [self.tasks[0]]
+        if self.is_empty():
+            raise IndexError("peek from an empty run queue")
+        return [self._front(self._queue)[0]]
 
     def pop_task(self) -> list[Task]:
+        if self.is_empty():
+            raise IndexError("pop from an empty run queue")
         if self._last_index > 0:
             self._last_index -= 1
-
-        return [self.tasks.pop(0)]
+        return self.pop_n_tasks(1)
 
     def is_empty(self) -> bool:
-        return len(self.tasks) == 0
+        return not self._entries
+
+    def oldest_of_category(self, category: TaskCategory) -> Optional[Task]:
+        entry = self._front(self._by_category[category])
+        return entry[0] if entry else None
+
+    def oldest_with_width(self, width: int) -> Optional[Task]:
+        entry = self._front(self._by_width[width])
+        return entry[0] if entry else None
+
+    def oldest_fitting(self, slots: int) -> Optional[Task]:
+        """
+        :return: the oldest task filling at most slots SMT slots
+        """
+        fronts = [self._front(queue) for width, queue in self._by_width.items() if width <= slots]
+        fronts = [entry for entry in fronts if entry is not None]
+        return min(fronts, key=itemgetter(2))[0] if fronts else None
+
+    @property
+    def tasks(self) -> list[Task]:
+        """
+        :return: the queued tasks oldest first, a new list that does not change the queue
+        """
+        return list(self)
 
     def reset_indices(self):
-        self._iter_indices = {
-            1: 0,
-            2: 0,
-            4: 0,
-        }
-        self._prev_index = 0
         self._last_index = 0
+        self._prev_index = 0
+        self._iter_indices = {1: 0, 2: 0, 4: 0}
 
     def peek_next(self) -> Optional[Task]:
-        if self._last_index >= len(self.tasks):
-            return None
-        task = self.tasks[self._last_index]
-        self._last_index += 1
+        """
+        :return: the task after the one returned last, starting from the oldest, None past the newest
+        """
+        task = next(islice(self, self._last_index, None), None)
+        if task is not None:
+            self._last_index += 1
         return task
 
-    def _peek_prev_with_size(self, size: int) -> Optional[Task]:
-        if self._iter_indices[size] == len(self.tasks):
-            return None
-
-        while self.tasks[len(self.tasks) - 1 - self._iter_indices[size]].category.value.slots_filled != size:
-            self._iter_indices[size] += 1
-
-            if self._iter_indices[size] == len(self.tasks):
-                return None
-
-        self._iter_indices[size] += 1
-        return self.tasks[len(self.tasks) - 1 - self._iter_indices[size]]
-
     def peek_prev(self) -> Optional[Task]:
-        if self._prev_index == len(self.tasks):
-            return None
+        """
+        :return: the task before the one returned last, starting from the newest, None past the oldest
+        """
+        task = next(islice(self._reversed(self._queue), self._prev_index, None), None)
+        if task is not None:
+            self._prev_index += 1
+        return task
 
-        last = self.tasks[len(self.tasks) - 1 - self._prev_index]
-        self._prev_index += 1
-        return last
+    def _peek_prev_with_size(self, size: int) -> Optional[Task]:
+        task = next(islice(self._reversed(self._by_width[size]), self._iter_indices[size], None), None)
+        if task is not None:
+            self._iter_indices[size] += 1
+        return task
 
     def peek_prev_single_width(self) -> Optional[Task]:
         return self._peek_prev_with_size(1)
@@ -104,5 +186,12 @@ class RunQueue:
     def peek_prev_four_width(self) -> Optional[Task]:
         return self._peek_prev_with_size(4)
 
+    @staticmethod
+    def _reversed(queue: deque[Entry]) -> Iterator[Task]:
+        return (entry[0] for entry in reversed(queue) if entry[1])
+
+    def __iter__(self) -> Iterator[Task]:
+        return (entry[0] for entry in filter(itemgetter(1), self._queue))
+
     def __len__(self):
-        return len(self.tasks)
+        return len(self._entries)
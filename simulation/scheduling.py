@@ -1,35 +1,82 @@
+from importlib.metadata import entry_points
+from typing import Callable, Optional
+
 from simulation.tasks import Task, TaskCategory
 from simulation.runqueue import RunQueue
-from simulation import N_THREADS as SMT_MAX
+from simulation.packing import Unit, ipc_table, unit_class
+from simulation.interference import InterferenceProfiler, load_matrix
+from simulation import N_THREADS as SMT_MAX, trace
+
+type Scheduler = Callable[[RunQueue], list[Task]]  # may take the SMT width as keyword argument smt
+
+SCHEDULERS: dict[str, Scheduler] = {}
+# other packages can add schedulers through entry points of this group
+ENTRY_POINT_GROUP = "simulation.schedulers"
+_entry_points_loaded = False
+
+PACKING_WINDOW = 8  # oldest tasks the packing scheduler chooses co-runners from
+
+
+def register_scheduler(name: Optional[str] = None) -> Callable[[Scheduler], Scheduler]:
+    """
+    registers the decorated scheduler under name, the function name if not given.
+    """
+    def register(scheduler: Scheduler) -> Scheduler:
+        key = name or scheduler.__name__
+        if key in SCHEDULERS:
+            raise ValueError(f"Scheduler {key} is already registered")
+        SCHEDULERS[key] = scheduler
+        return scheduler
+
+    return register
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name not in SCHEDULERS:
+            SCHEDULERS[entry_point.name] = entry_point.load()
+
+
+def get_scheduler(name: str) -> Scheduler:
+    if name not in SCHEDULERS:
+        _load_entry_points()
+    try:
+        return SCHEDULERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown scheduler {name}") from None
 
 
-def round_robin_smt4(run_queue: RunQueue) -> list[Task]:
+def scheduler_names() -> list[str]:
+    _load_entry_points()
+    return list(SCHEDULERS)
+
+
+@register_scheduler()
+def round_robin_smt4(run_queue: RunQueue, smt: int = SMT_MAX) -> list[Task]:
     assert not run_queue.is_empty()
 
-    return run_queue.pop_n_tasks(SMT_MAX)
+    return run_queue.pop_n_tasks(smt)
 
 
-def slot_fill_shed(run_queue: RunQueue) -> list[Task]:
+@register_scheduler()
+def slot_fill_shed(run_queue: RunQueue, smt: int = SMT_MAX) -> list[Task]:
     assert not run_queue.is_empty()
 
     if len(run_queue) < 2:
         return run_queue.pop_task()
 
-    run_queue.reset_indices()
     top = run_queue.pop_task()[0]
-    remaining = SMT_MAX - top.category.value.slots_filled
+    remaining = smt - top.category.value.slots_filled
     selected = [top]
-    if remaining <= 1:
-        return [top]  # no more room
-
-    while remaining > 1:
-        next = run_queue.peek_next()
-        if next is None:
-            break
-        if next.category.value.slots_filled > remaining:
-            continue
 
-        selected.append(run_queue.pop_task()[0])
+    # fill the remaining slots with the oldest tasks that still fit
+    while remaining > 1 and (next := run_queue.oldest_fitting(remaining)) is not None:
+        run_queue.pop_specific_task(next)
+        selected.append(next)
         remaining -= next.category.value.slots_filled
 
     return selected
@@ -81,34 +128,126 @@ def slot_fill_shed(run_queue: RunQueue) -> list[Task]:
     #
 
 
-def score_scheduling(run_queue: RunQueue) -> list[Task]:
+@register_scheduler()
+def score_scheduling(run_queue: RunQueue, smt: int = SMT_MAX) -> list[Task]:
     assert not run_queue.is_empty()
 
-    if len(run_queue) <= SMT_MAX:
-        return run_queue.pop_n_tasks(SMT_MAX)
+    if len(run_queue) <= smt:
+        return run_queue.pop_n_tasks(smt)
 
     selected = run_queue.pop_task()
     duplicate_penalty = 2.0
     # from the next four, select the one with the least duplicate
     # score:
     type_counts = {selected[0].category: 1}
-    while len(selected) < 4:
+    while len(selected) < smt:
         next_tasks = run_queue.peek_n_tasks(4)
         if not next_tasks:
             # no more tasks
             break
-        if len(next_tasks) <= SMT_MAX - len(selected):
+        if len(next_tasks) <= smt - len(selected):
             selected.extend(run_queue.pop_n_tasks(len(next_tasks)))
             break
-        print(len(next_tasks))
         scores = [1] * len(next_tasks)
         for i, task in enumerate(next_tasks):
             scores[i] = (type_counts.get(task.category, 1) - 1) * duplicate_penalty
 
-        print(scores)
+        if trace.scheduler:
+            trace.log("scheduler", f"scores of the next {len(next_tasks)} tasks: {scores}")
         lowest_score_task = next_tasks[scores.index(min(scores))]
         selected.append(lowest_score_task)
         type_counts[lowest_score_task.category] = type_counts.get(lowest_score_task.category, 0) + 1
         run_queue.pop_specific_task(lowest_score_task)
 
     return selected
+
+
+def _pack(run_queue: RunQueue, smt: int, score: Callable[[list[Unit]], float]) -> tuple[list[Task], list[Unit]]:
+    """
+    picks the oldest task and greedily adds the co-runner from the next tasks that gives the best scoring group.
+
+    :param score: classes of a group of tasks -> how well they run together, higher is better
+    :return: the picked tasks, popped from run_queue, and their classes
+    """
+    candidates = run_queue.peek_n_tasks(PACKING_WINDOW)
+    classes = [unit_class(task.instructions, task.inst_index) for task in candidates]
+
+    # the oldest task always runs, so no task starves
+    selected = [0]
+    while len(selected) < smt:
+        group = [classes[j] for j in selected]
+        best, best_score = None, float("-inf")
+        for i, unit in enumerate(classes):
+            if i in selected:
+                continue
+            group.append(unit)
+            group_score = score(group)
+            group.pop()
+            if group_score > best_score:
+                best, best_score = i, group_score
+        selected.append(best)
+
+    tasks = [candidates[i] for i in selected]
+    for task in tasks:
+        run_queue.pop_specific_task(task)
+    return tasks, [classes[i] for i in selected]
+
+
+def _counts(classes: list[Unit]) -> tuple[int, ...]:
+    counts = [0] * len(Unit)
+    for unit in classes:
+        counts[unit] += 1
+    return tuple(counts)
+
+
+@register_scheduler()
+def packing_scheduling(run_queue: RunQueue, smt: int = SMT_MAX) -> list[Task]:
+    """
+    runs the oldest task with the co-runners from the next tasks that maximise the predicted combined IPC,
+    see simulation.packing.
+    """
+    assert not run_queue.is_empty()
+
+    if len(run_queue) <= smt:
+        return run_queue.pop_n_tasks(smt)
+
+    table = ipc_table(smt)
+    tasks, classes = _pack(run_queue, smt, lambda group: table[_counts(group)])
+    if trace.scheduler:
+        trace.log("scheduler", f"packed classes {[unit.name for unit in classes]}, "
+                               f"predicted IPC {table[_counts(classes)]:.2f}")
+    return tasks
+
+
+def _group_throughput(matrix: InterferenceProfiler, group: list[Unit]) -> float:
+    """
+    :return: relative throughput of the group, every task slowed down by all of its co-runners
+    """
+    throughput = 0.0
+    for k, member in enumerate(group):
+        rate = 1.0
+        for m, co_runner in enumerate(group):
+            if m != k:
+                rate *= matrix.slowdown(member, co_runner)
+        throughput += rate
+    return throughput
+
+
+@register_scheduler()
+def interference_scheduling(run_queue: RunQueue, smt: int = SMT_MAX,
+                            matrix: Optional[InterferenceProfiler] = None) -> list[Task]:
+    """
+    runs the oldest task with the co-runners from the next tasks that keep the measured slowdowns lowest,
+    see simulation.interference.
+
+    :param matrix: the measured slowdowns, the INTERFERENCE_MATRIX file, loaded once, if not given.
+        Bind another one with functools.partial
+    """
+    assert not run_queue.is_empty()
+
+    if len(run_queue) <= smt:
+        return run_queue.pop_n_tasks(smt)
+
+    matrix = matrix or load_matrix()
+    tasks, _ = _pack(run_queue, smt, lambda group: _group_throughput(matrix, group))
+    return tasks
@@ -1,54 +1,130 @@
-from typing import Callable, Iterator
+from dataclasses import dataclass
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Iterator, Optional
 
-from simulation.state import ProcessorState
+from simulation.checkpoint import save as save_checkpoint
+from simulation.counters import Counters
+from simulation.interference import InterferenceProfiler, classify
+from simulation.pipeline import Pipeline
 from simulation.tasks import Task, InstructionType
 from simulation.runqueue import RunQueue
-from simulation import TimeQuantum, CLOCK_CYCLES_PER_TIME_QUANTUM
+from simulation.statistics import Statistics
+from simulation import TimeQuantum, CLOCK_CYCLES_PER_TIME_QUANTUM, LSU_LATENCY, profiling, trace
 
 
 def pop_run_instructions_from_tasks(tasks: list[Task]) -> None:
     for task in tasks:
-        task.remaining_instructions.pop(0)
+        task.inst_index += 1
 
 
 def pipeline_run_for_quantum(
-        processor_state: ProcessorState,
+        pipeline: Pipeline,
         tasks: list[Task],
-        quantum: TimeQuantum,
-):
-    processor_state.clear_pipeline()
-    assert processor_state.time_quantum == quantum
-    for tick in processor_state.cycles():
-        pipeline_tick(processor_state, tasks)
+        cycles: int = CLOCK_CYCLES_PER_TIME_QUANTUM,
+        carry_over: bool = True,
+        completed: Optional[dict[int, int]] = None,
+) -> int:
+    """
+    fetches from tasks for cycles cycles.
 
-    processor_state.advance_quantum()
+    :param carry_over: leave the instructions of the quantum in flight into the next one,
+        otherwise the pipeline is drained before returning, which takes extra cycles
+    :param completed: task id -> instructions completed, counted up if given
+    :return: number of instructions completed
+    """
+    pipeline.set_tasks(tasks)
+    count = pipeline.run_for(cycles, completed)
+    if not carry_over:
+        count += pipeline.drain(completed)
+    return count
+
+
+class ArrivalQueue:
+    """
+    tasks sorted by arrival quantum, handed out once their quantum is reached.
+    """
+    _arrivals: list[tuple[TimeQuantum, Task]]
+    _next: int
+
+    def __init__(self, tasks: list[tuple[TimeQuantum, Task]]):
+        # a stable sort keeps the order of tasks arriving in the same quantum
+        self._arrivals = sorted(tasks, key=itemgetter(0))
+        self._next = 0
+
+    def pop_arrived(self, quantum: TimeQuantum) -> list[Task]:
+        """
+        :return: the tasks arriving up to quantum that were not popped yet
+        """
+        start = self._next
+        while self._next < len(self._arrivals) and self._arrivals[self._next][0] <= quantum:
+            self._next += 1
+        return [task for _, task in self._arrivals[start:self._next]]
+
+    def next_quantum(self) -> Optional[TimeQuantum]:
+        """
+        :return: arrival quantum of the next task, None if all arrived
+        """
+        if self._next == len(self._arrivals):
+            return None
+        return self._arrivals[self._next][0]
+
+    def __len__(self):
+        return len(self._arrivals) - self._next
+
+
+def _arrived(arrivals: ArrivalQueue, quantum: TimeQuantum, statistics: Optional[Statistics]) -> list[Task]:
+    tasks = arrivals.pop_arrived(quantum)
+    if statistics is not None and tasks:
+        statistics.arrive(tasks, quantum)
+    return tasks
 
 
 def run_simulation_to_exhaustion(
         tasks: list[tuple[TimeQuantum, Task]],
         scheduling_algorithm: Callable[[RunQueue], list[Task]],
+        statistics: Optional[Statistics] = None,
 ) -> dict[TimeQuantum, list[Task]]:
-    run_queue = RunQueue(
-        list(map(lambda t: t[1], filter(lambda t: t[0] == 0, tasks))))  # initialise with tasks arriving at start
+    """
+    :param statistics: collects arrivals, scheduled quanta and completions while running
+    """
+    arrivals = ArrivalQueue(tasks)
+    run_queue = RunQueue(_arrived(arrivals, 0, statistics))  # initialise with tasks arriving at start
     run_order = {}
+    scheduling_algorithm = profiling.scheduler(scheduling_algorithm)
 
     quantum = 0
-    while not run_queue.is_empty():
+    while not run_queue.is_empty() or arrivals:
+        if run_queue.is_empty():
+            # idle until the next task arrives
+            quantum = arrivals.next_quantum()
+            run_queue.add_tasks(_arrived(arrivals, quantum, statistics))
+            if trace.simulation:
+                trace.log("simulation", f"idle until quantum {quantum}")
+
         scheduled_tasks = scheduling_algorithm(run_queue)
         quantum_smt = len(scheduled_tasks)
-        print(f"quantum {quantum} smt {quantum_smt}")
+        if trace.simulation:
+            trace.log("simulation", f"quantum {quantum} smt {quantum_smt}")
         for task in scheduled_tasks:
-            task.instructions.pop(0)
-            if len(task.instructions) == 0:
-                print(f"completed task {task.id} at quantum {quantum}")
+            if trace.recording:
+                trace.record(quantum, trace.Event.TASK_SCHEDULED, task.id, quantum_smt)
+            task.inst_index += 1
+            if task.inst_index >= len(task.instructions):
+                if trace.simulation:
+                    trace.log("simulation", f"completed task {task.id} at quantum {quantum}", trace.Level.INFO)
+                if trace.recording:
+                    trace.record(quantum, trace.Event.TASK_COMPLETED, task.id)
                 task.mark_completed(quantum)
+                if statistics is not None:
+                    statistics.complete(task, quantum)
 
         run_order[quantum] = scheduled_tasks
+        if statistics is not None:
+            statistics.record(quantum, scheduled_tasks)
 
         quantum += 1
-        new_tasks = filter(lambda t: t[0] == quantum, tasks)
-        for _, task in new_tasks:
-            run_queue.add_task(task)
+        run_queue.add_tasks(_arrived(arrivals, quantum, statistics))
 
         for task in scheduled_tasks:
 
@@ -57,3 +133,206 @@ def run_simulation_to_exhaustion(
                 run_queue.add_task(task)
 
     return run_order
+
+
+@dataclass
+class PipelineRun:
+    run_order: dict[TimeQuantum, list[Task]]
+    cycles: int
+    instructions: int
+
+    @property
+    def ipc(self) -> float:
+        return self.instructions / self.cycles if self.cycles else 0.0
+
+
+class PipelineSimulation:
+    """
+    a run on the cycle level pipeline, see run_simulation_on_pipeline.
+    It advances one quantum at a time, so it can be checkpointed between quanta with simulation.checkpoint
+    and resumed or forked from there.
+    """
+    arrivals: ArrivalQueue
+    run_queue: RunQueue
+    pipeline: Pipeline
+    scheduling_algorithm: Callable[[RunQueue], list[Task]]
+    _schedule: Callable[[RunQueue], list[Task]]  # scheduling_algorithm, timed while profiling
+    cycles_per_quantum: int
+    carry_over: bool
+    profiler: Optional[InterferenceProfiler]
+    statistics: Optional[Statistics]
+    run_order: dict[TimeQuantum, list[Task]]
+    draining: list[Task]  # fetched to the end, waiting for their return to complete
+    instructions: int
+    quantum: TimeQuantum
+
+    def __init__(
+            self,
+            tasks: list[tuple[TimeQuantum, Task]],
+            scheduling_algorithm: Callable[[RunQueue], list[Task]],
+            cycles_per_quantum: int = CLOCK_CYCLES_PER_TIME_QUANTUM,
+            carry_over: bool = True,
+            lsu_latency: int = LSU_LATENCY,
+            profiler: Optional[InterferenceProfiler] = None,
+            statistics: Optional[Statistics] = None,
+            counters: Optional[Counters] = None,
+    ):
+        """
+        :param statistics: collects arrivals, scheduled quanta and completions while running
+        :param counters: counts the performance events of the pipeline, sampled at the end of every quantum
+        """
+        if profiler is not None and profiler.lsu_latency != lsu_latency:
+            raise ValueError(f"cannot record runs at an LSU latency of {lsu_latency} "
+                             f"into measurements at {profiler.lsu_latency}")
+        self.arrivals = ArrivalQueue(tasks)
+        self.statistics = statistics
+        self.run_queue = RunQueue(_arrived(self.arrivals, 0, statistics))  # initialise with tasks arriving at start
+        self.pipeline = Pipeline([], lsu_latency, counters)
+        self.scheduling_algorithm = scheduling_algorithm
+        self._schedule = profiling.scheduler(scheduling_algorithm)
+        self.cycles_per_quantum = cycles_per_quantum
+        self.carry_over = carry_over
+        self.profiler = profiler
+        self.run_order = {}
+        self.draining = []
+        self.instructions = 0
+        self.quantum = 0
+
+    def __getstate__(self):
+        # a scheduler timed while profiling cannot be pickled, it is wrapped again on restore
+        state = self.__dict__.copy()
+        del state["_schedule"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._schedule = profiling.scheduler(self.scheduling_algorithm)
+
+    def done(self) -> bool:
+        return self.run_queue.is_empty() and not self.arrivals and not self.draining
+
+    def step(self):
+        """
+        simulates the next quantum, does nothing once the simulation is done.
+        """
+        if self.done():
+            return
+        pipeline = self.pipeline
+        run_queue = self.run_queue
+        if run_queue.is_empty() and not self.draining:
+            # idle until the next task arrives
+            next_quantum = self.arrivals.next_quantum()
+            pipeline.set_tasks([])
+            self.instructions += pipeline.run_for((next_quantum - self.quantum) * self.cycles_per_quantum)
+            self.quantum = next_quantum
+            run_queue.add_tasks(_arrived(self.arrivals, self.quantum, self.statistics))
+            if trace.simulation:
+                trace.log("simulation", f"idle until quantum {self.quantum}")
+
+        quantum = self.quantum
+        scheduled_tasks = self._schedule(run_queue) if not run_queue.is_empty() else []
+        if len(scheduled_tasks) > 4:
+            raise ValueError(f"scheduler picked {len(scheduled_tasks)} tasks, the pipeline runs at most 4")
+        quantum_smt = len(scheduled_tasks)
+        if trace.simulation:
+            trace.log("simulation", f"quantum {quantum} smt {quantum_smt} at cycle {pipeline.cycle}")
+        if trace.recording:
+            for task in scheduled_tasks:
+                trace.record(quantum, trace.Event.TASK_SCHEDULED, task.id, quantum_smt)
+
+        profiled = self.profiler is not None and 1 <= quantum_smt <= 2
+        classes = classify(scheduled_tasks) if profiled else None
+        completed = {} if profiled else None
+        start = pipeline.cycle
+        self.instructions += pipeline_run_for_quantum(pipeline, scheduled_tasks, self.cycles_per_quantum,
+                                                      self.carry_over, completed)
+        if profiled:
+            self.profiler.record(classes, [completed.get(task.id, 0) for task in scheduled_tasks],
+                                 pipeline.cycle - start)
+        if pipeline.counters is not None:
+            pipeline.counters.sample()
+
+        if pipeline.next_busy_cycle() is None:
+            # nothing moves anymore, tasks without a return ran off the end of their program
+            for task in self.draining:
+                if not task.is_complete():
+                    task.mark_completed(pipeline.cycle)
+        statistics = self.statistics
+        if statistics is not None:
+            for task in self.draining:
+                if task.is_complete():
+                    statistics.complete(task, quantum)
+        self.draining = [task for task in self.draining if not task.is_complete()]
+
+        self.run_order[quantum] = scheduled_tasks
+        if statistics is not None:
+            statistics.record(quantum, scheduled_tasks)
+
+        self.quantum = quantum + 1
+        run_queue.add_tasks(_arrived(self.arrivals, self.quantum, statistics))
+
+        for task in scheduled_tasks:
+            task.ran_at.append(self.quantum)
+            if task.is_complete():
+                if statistics is not None:
+                    statistics.complete(task, quantum)
+                continue
+            if task.inst_index >= len(task.instructions):
+                self.draining.append(task)
+            else:
+                run_queue.add_task(task)
+
+    def run(self, max_cycles: Optional[int] = None, checkpoint: Optional[Path] = None,
+            checkpoint_every: Optional[int] = None) -> PipelineRun:
+        """
+        :param max_cycles: stops after the first quantum ending at or after this cycle, even if tasks are left
+        :param checkpoint: file the simulation is saved to every checkpoint_every cycles and when it stops
+        """
+        next_checkpoint = self.pipeline.cycle + checkpoint_every if checkpoint and checkpoint_every else None
+        while not self.done():
+            self.step()
+            if next_checkpoint is not None and self.pipeline.cycle >= next_checkpoint:
+                save_checkpoint(checkpoint, self)
+                next_checkpoint = self.pipeline.cycle + checkpoint_every
+            if max_cycles is not None and self.pipeline.cycle >= max_cycles:
+                if trace.simulation:
+                    trace.log("simulation", f"stopped at cycle {self.pipeline.cycle} with "
+                                            f"{len(self.run_queue)} tasks left", trace.Level.WARN)
+                break
+        if checkpoint:
+            save_checkpoint(checkpoint, self)
+        return self.result()
+
+    def result(self) -> PipelineRun:
+        return PipelineRun(self.run_order, self.pipeline.cycle, self.instructions)
+
+
+def run_simulation_on_pipeline(
+        tasks: list[tuple[TimeQuantum, Task]],
+        scheduling_algorithm: Callable[[RunQueue], list[Task]],
+        cycles_per_quantum: int = CLOCK_CYCLES_PER_TIME_QUANTUM,
+        carry_over: bool = True,
+        lsu_latency: int = LSU_LATENCY,
+        profiler: Optional[InterferenceProfiler] = None,
+        max_cycles: Optional[int] = None,
+        statistics: Optional[Statistics] = None,
+) -> PipelineRun:
+    """
+    runs the tasks scheduled for every quantum on the cycle level pipeline for cycles_per_quantum cycles.
+    A task is complete once its return left the branch pipeline, its completed_at is that cycle.
+    A task that fetched its last instruction is not scheduled again, its instructions complete in later quanta.
+
+    Speed: 8 tasks of mul_row_thread at round robin SMT4 with carry-over took 53 s for 10^6 cycles on a slow
+    single core, 12% less than before the pipeline stopped allocating most of its per-cycle temporaries.
+    That only just meets a one minute target, a machine that took 78 s before still misses it.
+    Pipeline.tick takes about 96% of the time, scheduling and swapping the tasks between quanta the rest.
+
+    :param carry_over: keep the instructions of a quantum in flight into the next one,
+        otherwise the pipeline is drained at the end of every quantum
+    :param profiler: records the IPC of every quantum that ran one or two tasks
+    :param max_cycles: stops after the first quantum ending at or after this cycle, even if tasks are left
+    :param statistics: collects arrivals, scheduled quanta and completions while running
+    """
+    simulation = PipelineSimulation(tasks, scheduling_algorithm, cycles_per_quantum, carry_over, lsu_latency, profiler,
+                                    statistics)
+    return simulation.run(max_cycles)
@@ -5,24 +5,172 @@ from dataclasses import dataclass, field
 from typing import Iterator
 
 
-class LimitedList(list):
+class RingBuffer:
+    """
+    fixed capacity FIFO. Appending, popping from the front and reading by position are O(1),
+    nothing is allocated after construction.
+    """
+    __slots__ = ("max_size", "_items", "_head", "_len")
     max_size: int
+    _items: list
+    _head: int
+    _len: int
 
     def __init__(self, max_size: int):
-        super().__init__([])
         self.max_size = max_size
+        self._items = [None] * max_size
+        self._head = 0
+        self._len = 0
 
-    def append(self, __object):
-        if self.max_size == len(self):
+    def __len__(self) -> int:
+        return self._len
+
+    def __bool__(self) -> bool:
+        return self._len > 0
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self._len:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._head + index) % self.max_size]
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._items[(self._head + i) % self.max_size]
+
+    def __repr__(self):
+        return f"RingBuffer({list(self)}, max_size={self.max_size})"
+
+    @property
+    def free(self) -> int:
+        return self.max_size - self._len
+
+    def is_full(self) -> bool:
+        return self._len == self.max_size
+
+    def append(self, __object) -> bool:
+        if self._len == self.max_size:
             return False
-        super().append(__object)
+        self._items[(self._head + self._len) % self.max_size] = __object
+        self._len += 1
+        return True
+
+    def extend(self, objects) -> int:
+        """
+        appends until the buffer is full.
+
+        :return: number of objects added
+        """
+        if not isinstance(objects, (list, tuple)):
+            objects = list(objects)
+        added = min(len(objects), self.max_size - self._len)
+        items = self._items
+        max_size = self.max_size
+        tail = self._head + self._len
+        for i in range(added):
+            items[(tail + i) % max_size] = objects[i]
+        self._len += added
+        return added
+
+    def popleft(self):
+        if self._len == 0:
+            raise IndexError("pop from empty ring buffer")
+        obj = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.max_size
+        self._len -= 1
+        return obj
+
+    def pop_into(self, out: list, n: int) -> int:
+        """
+        moves up to n objects from the front to out.
+
+        :return: number of objects moved
+        """
+        if n > self._len:
+            n = self._len
+        items = self._items
+        max_size = self.max_size
+        head = self._head
+        for _ in range(n):
+            out.append(items[head])
+            items[head] = None
+            head = (head + 1) % max_size
+        self._head = head
+        self._len -= n
+        return n
+
+    def move_into(self, other: "RingBuffer", n: int) -> int:
+        """
+        moves up to n objects from the front to the back of other, no more than fit.
+
+        :return: number of objects moved
+        """
+        n = min(n, self._len, other.max_size - other._len)
+        items = self._items
+        max_size = self.max_size
+        head = self._head
+        other_items = other._items
+        other_size = other.max_size
+        tail = other._head + other._len
+        for i in range(n):
+            other_items[(tail + i) % other_size] = items[head]
+            items[head] = None
+            head = (head + 1) % max_size
+        self._head = head
+        self._len -= n
+        other._len += n
+        return n
+
+    def copy_into(self, out: list) -> int:
+        """
+        appends all objects to out, keeping them.
+
+        :return: number of objects copied
+        """
+        items = self._items
+        max_size = self.max_size
+        head = self._head
+        for i in range(self._len):
+            out.append(items[(head + i) % max_size])
+        return self._len
+
+    def remove_masked(self, mask: list[bool], out: list, offset: int = 0) -> int:
+        """
+        moves the objects at all positions with a true mask entry to out, the others keep their order.
+        Positions past the end of the mask are kept.
+
+        :param offset: index of the mask entry of the first position
+        :return: number of objects moved
+        """
+        kept = 0
+        moved = 0
+        end = len(mask) - offset
+        for i in range(self._len):
+            index = (self._head + i) % self.max_size
+            obj = self._items[index]
+            if i < end and mask[offset + i]:
+                out.append(obj)
+                moved += 1
+            else:
+                self._items[(self._head + kept) % self.max_size] = obj
+                kept += 1
+        for i in range(kept, self._len):
+            self._items[(self._head + i) % self.max_size] = None
+        self._len = kept
+        return moved
+
+    def clear(self):
+        for i in range(self._len):
+            self._items[(self._head + i) % self.max_size] = None
+        self._head = 0
+        self._len = 0
 
     def get_equal_partition(self, part_nr: int, smt_size: int) -> list:
         assert part_nr in (0, 1)
         assert smt_size in (1, 2, 4)
 
         # result should not be modified.
-        return self[part_nr * smt_size:(part_nr + 1) * smt_size]
+        return [self[i] for i in range(part_nr * smt_size, min((part_nr + 1) * smt_size, self._len))]
 
 
 @dataclass
@@ -31,8 +179,8 @@ class ProcessorState:
     cycles_left: int = CLOCK_CYCLES_PER_TIME_QUANTUM
     last_fetch_index: int = 0
 
-    ifb: list[InstructionType] = field(default_factory=lambda: LimitedList(96))
-    issue_queues: list[list[InstructionType]] = field(default_factory=lambda: [LimitedList(26), LimitedList(26)])
+    ifb: RingBuffer = field(default_factory=lambda: RingBuffer(96))
+    issue_queues: list[RingBuffer] = field(default_factory=lambda: [RingBuffer(26), RingBuffer(26)])
 
     def advance_quantum(self):
         # TODO:
@@ -0,0 +1,167 @@
+"""
+scheduling statistics, collected while a simulation runs.
+
+The engines report arrivals, scheduled quanta and completions to a Statistics object as they happen, which only
+appends to flat arrays, so the timeline never has to be walked again. summary() turns them into numpy arrays
+in one vectorised pass. All times are in quanta, a task completing in quantum q finishes at the end of it, q + 1.
+"""
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+
+from simulation.tasks import Task, TimeQuantum
+
+
+@dataclass
+class Summary:
+    task_ids: np.ndarray  # task: id, in order of arrival
+    completed: np.ndarray  # task: whether it completed
+    turnaround: np.ndarray  # task: arrival to completion, nan if it did not complete
+    waiting: np.ndarray  # task: quanta between arrival and completion in which it did not run
+    response: np.ndarray  # task: arrival to the first quantum it ran in, nan if it never ran
+    slowdown: np.ndarray  # task: turnaround relative to the quanta it needs alone
+    occupancy: np.ndarray  # quantum: number of tasks that ran in it
+    mean_occupancy: float
+    fairness: float  # Jain's index of the progress rates 1 / slowdown of the completed tasks, 1 is perfectly fair
+    throughput: float  # completed tasks per quantum
+    makespan: int  # quanta from the first to the end of the last recorded one
+
+    def as_dict(self) -> dict[str, object]:
+        return dict(vars(self))
+
+
+class Statistics:
+    """
+    a task is known once it arrived or first ran, tasks are told apart by id.
+    """
+    _slots: dict[int, int]  # task id -> index into the per task arrays
+    _ids: array
+    _arrival: array
+    _first: array  # first quantum the task ran in, -1 if it did not run yet
+    _runs: array  # quanta the task ran in
+    _finish: array  # end of the quantum it completed in, -1 if it did not complete
+    _quanta: array  # quanta in the order they were recorded
+    _smt: array  # tasks that ran in each recorded quantum
+
+    def __init__(self):
+        self._slots = {}
+        self._ids = array("q")
+        self._arrival = array("q")
+        self._first = array("q")
+        self._runs = array("q")
+        self._finish = array("q")
+        self._quanta = array("q")
+        self._smt = array("b")
+
+    def _slot(self, task: Task, arrival: TimeQuantum) -> int:
+        slot = self._slots.get(task.id)
+        if slot is None:
+            slot = self._slots[task.id] = len(self._ids)
+            self._ids.append(task.id)
+            self._arrival.append(arrival)
+            self._first.append(-1)
+            self._runs.append(0)
+            self._finish.append(-1)
+        return slot
+
+    def arrive(self, tasks: Iterable[Task], quantum: TimeQuantum):
+        """
+        tasks that are already known keep their arrival.
+        """
+        for task in tasks:
+            self._slot(task, quantum)
+
+    def record(self, quantum: TimeQuantum, tasks: list[Task]):
+        """
+        :param tasks: the tasks that ran in quantum, a task not seen before arrives in it
+        """
+        self._quanta.append(quantum)
+        self._smt.append(len(tasks))
+        first = self._first
+        runs = self._runs
+        for task in tasks:
+            slot = self._slots.get(task.id)
+            if slot is None:
+                slot = self._slot(task, quantum)
+            if first[slot] < 0:
+                first[slot] = quantum
+            runs[slot] += 1
+
+    def complete(self, task: Task, quantum: TimeQuantum):
+        """
+        a task completes once, reporting it again keeps its first completion.
+
+        :param quantum: the quantum the task completed in
+        """
+        slot = self._slot(task, quantum)
+        if self._finish[slot] < 0:
+            self._finish[slot] = quantum + 1
+
+    def summary(self, alone: Optional[dict[int, float]] = None) -> Summary:
+        """
+        :param alone: task id -> quanta the task needs running alone, the quanta it ran in if not given
+        """
+        arrival = np.frombuffer(self._arrival, dtype=np.int64).astype(float)
+        first = np.frombuffer(self._first, dtype=np.int64)
+        runs = np.frombuffer(self._runs, dtype=np.int64)
+        finish = np.frombuffer(self._finish, dtype=np.int64)
+        ids = np.frombuffer(self._ids, dtype=np.int64).copy()
+
+        completed = finish >= 0
+        turnaround = np.where(completed, finish - arrival, np.nan)
+        waiting = turnaround - runs
+        response = np.where(first >= 0, first - arrival, np.nan)
+        service = runs.astype(float)
+        if alone is not None:
+            service = np.array([alone.get(task_id, runs[i]) for i, task_id in enumerate(ids)], dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slowdown = turnaround / service
+
+        quanta = np.frombuffer(self._quanta, dtype=np.int64)
+        smt = np.frombuffer(self._smt, dtype=np.int8)
+        start = int(min(quanta.min(initial=0), arrival.min(initial=0)))
+        end = int(max(quanta.max(initial=-1) + 1, finish.max(initial=0)))
+        occupancy = np.zeros(end - start, dtype=np.int64)
+        occupancy[quanta - start] = smt  # every quantum is recorded once
+
+        rates = 1 / slowdown[completed & (slowdown > 0)]
+        fairness = float(rates.sum() ** 2 / (len(rates) * (rates ** 2).sum())) if len(rates) else 1.0
+        makespan = end - start
+        return Summary(
+            task_ids=ids,
+            completed=completed,
+            turnaround=turnaround,
+            waiting=waiting,
+            response=response,
+            slowdown=slowdown,
+            occupancy=occupancy,
+            mean_occupancy=float(occupancy.mean()) if makespan else 0.0,
+            fairness=fairness,
+            throughput=float(completed.sum() / makespan) if makespan else 0.0,
+            makespan=makespan,
+        )
+
+
+def from_timeline(timeline: dict[TimeQuantum, list[Task]],
+                  arrivals: Optional[dict[int, TimeQuantum]] = None) -> Statistics:
+    """
+    collects the statistics of a finished run in one pass over its timeline.
+    A completed task completed in the last quantum it ran in.
+
+    :param arrivals: task id -> arrival quantum, tasks arrive in the first quantum they ran in if not given
+    """
+    statistics = Statistics()
+    last = {}
+    for quantum, tasks in timeline.items():
+        if arrivals is not None:
+            for task in tasks:
+                statistics.arrive((task,), arrivals.get(task.id, quantum))
+        statistics.record(quantum, tasks)
+        for task in tasks:
+            last[task.id] = (task, quantum)
+    for task, quantum in last.values():
+        if task.is_complete():
+            statistics.complete(task, quantum)
+    return statistics
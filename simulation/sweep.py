@@ -0,0 +1,184 @@
+"""
+runs a grid of scheduler x SMT mode x workload x quantum length experiments in a process pool.
+
+usage: python -m simulation.sweep --scheduler round_robin_smt4,score_scheduling --smt 1,2,4 \
+           --workload workload/matrix.dump:mul_row_thread=4 --quantum-cycles 10,100 --seed 0,1 --output results.csv
+
+The quantum engine runs one abstract instruction per task and quantum, the pipeline engines run the scheduled
+tasks on the cycle level pipeline, keeping instructions in flight between quanta or draining it after every quantum.
+
+every worker decodes each dump once and reuses it for all of its cells,
+results are written as csv rows as soon as a cell finishes.
+A cell only depends on its configuration and seed, so the rows do not change with the number of workers.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import cache, partial
+from itertools import product
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Self, TextIO
+
+from simulation import CLOCK_CYCLES_PER_TIME_QUANTUM, SEED
+from simulation.load_exec import create_tasks, load_program
+from simulation.scheduling import get_scheduler, scheduler_names
+from simulation.simulation import run_simulation_on_pipeline, run_simulation_to_exhaustion
+from simulation.tasks import InstructionStream
+
+COLUMNS = ("scheduler", "smt", "workload", "quantum_cycles", "seed", "engine", "tasks", "quanta", "cycles",
+           "instructions", "mean_turnaround_cycles", "seconds")
+ENGINES = ("quantum", "pipeline", "pipeline_drained")
+
+
+@dataclass(frozen=True)
+class Workload:
+    dump: Path
+    thread_entries: tuple[tuple[str, int], ...]  # function name, number of threads
+
+    @classmethod
+    def parse(cls, spec: str) -> Self:
+        """
+        :param spec: dump and thread entries, e.g. workload/matrix.dump:mul_row_thread=4,main=1
+        """
+        dump, _, entries = spec.partition(":")
+        if not entries:
+            raise ValueError(f"Workload {spec} has no thread entries")
+        thread_entries = []
+        for entry in entries.split(","):
+            fname, _, count = entry.partition("=")
+            thread_entries.append((fname, int(count or 1)))
+        return cls(Path(dump), tuple(thread_entries))
+
+    @property
+    def name(self) -> str:
+        return f"{self.dump.name}:" + ",".join(f"{fname}={count}" for fname, count in self.thread_entries)
+
+
+@dataclass(frozen=True)
+class Cell:
+    scheduler: str
+    smt: int
+    workload: Workload
+    quantum_cycles: int
+    seed: int = SEED
+    engine: str = "quantum"
+
+
+def grid(schedulers: Iterable[str], smt_modes: Iterable[int], workloads: Iterable[Workload],
+         quantum_cycles: Iterable[int], seeds: Iterable[int] = (SEED,),
+         engines: Iterable[str] = ("quantum",)) -> list[Cell]:
+    for scheduler in schedulers:
+        get_scheduler(scheduler)
+    for engine in engines:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine}, known: {', '.join(ENGINES)}")
+    return [Cell(*cell) for cell in product(schedulers, smt_modes, workloads, quantum_cycles, seeds, engines)]
+
+
+@cache
+def _load(workload: Workload) -> tuple[InstructionStream, dict[str, int]]:
+    # cached per process, so a worker decodes or maps every dump only once
+    return load_program(workload.dump, (fname for fname, _ in workload.thread_entries))
+
+
+def run_cell(cell: Cell) -> dict[str, object]:
+    program, entries = _load(cell.workload)
+    tasks = create_tasks(program, entries, dict(cell.workload.thread_entries), cell.seed)
+    scheduler = partial(get_scheduler(cell.scheduler), smt=cell.smt)
+
+    start = time.perf_counter()
+    if cell.engine == "quantum":
+        run_order = run_simulation_to_exhaustion([(0, task) for task in tasks], scheduler)
+        cycles = len(run_order) * cell.quantum_cycles
+        instructions = None
+        # a task completing in quantum q has run for q + 1 quanta
+        turnaround = sum(task.completed_at + 1 for task in tasks) / len(tasks) * cell.quantum_cycles
+    else:
+        run = run_simulation_on_pipeline([(0, task) for task in tasks], scheduler, cell.quantum_cycles,
+                                         carry_over=cell.engine == "pipeline")
+        run_order, cycles, instructions = run.run_order, run.cycles, run.instructions
+        # completed_at is a cycle here
+        turnaround = sum(task.completed_at for task in tasks) / len(tasks)
+    seconds = time.perf_counter() - start
+
+    return {
+        "scheduler": cell.scheduler,
+        "smt": cell.smt,
+        "workload": cell.workload.name,
+        "quantum_cycles": cell.quantum_cycles,
+        "seed": cell.seed,
+        "engine": cell.engine,
+        "tasks": len(tasks),
+        "quanta": len(run_order),
+        "cycles": cycles,
+        "instructions": instructions,
+        "mean_turnaround_cycles": round(turnaround, 2),
+        "seconds": round(seconds, 4),
+    }
+
+
+def sweep(cells: list[Cell], jobs: Optional[int] = None) -> Iterator[dict[str, object]]:
+    """
+    runs every cell in a worker process.
+
+    :param jobs: number of worker processes, all cores if not given, 1 runs the cells in this process
+    :return: one result row per cell, in the order the cells finish
+    """
+    if jobs == 1:
+        yield from map(run_cell, cells)
+        return
+
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(run_cell, cell) for cell in cells]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_table(rows: Iterable[dict[str, object]], output: TextIO):
+    writer = csv.DictWriter(output, COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        output.flush()
+
+
+def _split(value: str) -> list[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="scheduler x SMT mode x workload x quantum length sweep")
+    parser.add_argument("--scheduler", type=_split, default=scheduler_names(),
+                        help=f"comma separated, any of {', '.join(scheduler_names())}")
+    parser.add_argument("--smt", type=lambda v: [int(n) for n in _split(v)], default=[1, 2, 4],
+                        help="comma separated SMT modes")
+    parser.add_argument("--workload", type=Workload.parse, action="append",
+                        help="dump:function=threads,..., can be repeated")
+    parser.add_argument("--quantum-cycles", type=lambda v: [int(n) for n in _split(v)],
+                        default=[CLOCK_CYCLES_PER_TIME_QUANTUM], help="comma separated clock cycles per quantum")
+    parser.add_argument("--seed", type=lambda v: [int(n) for n in _split(v)], default=[SEED],
+                        help="comma separated seeds, every cell runs once per seed")
+    parser.add_argument("--engine", type=_split, default=["quantum"],
+                        help=f"comma separated, any of {', '.join(ENGINES)}")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--output", type=Path, help="csv file, stdout if not given")
+    args = parser.parse_args(argv)
+
+    workloads = args.workload or [Workload.parse("workload/matrix.dump:mul_row_thread=4")]
+    cells = grid(args.scheduler, args.smt, workloads, args.quantum_cycles, args.seed, args.engine)
+
+    start = time.perf_counter()
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_table(sweep(cells, args.jobs), f)
+    else:
+        write_table(sweep(cells, args.jobs), sys.stdout)
+    print(f"{len(cells)} cells in {time.perf_counter() - start:.2f}s with {args.jobs} workers", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 import os
+from array import array
 from dataclasses import dataclass, field
 from enum import auto, Enum
-from typing import Self
+from random import Random
+from typing import Any, Callable, Self, Iterable, Iterator, Optional
 
-from simulation import TimeQuantum, N_THREADS
+from simulation import TimeQuantum, N_THREADS, SEED, trace
 
 from matplotlib.pyplot import colormaps
 
@@ -61,7 +63,6 @@ class BranchInstruction(Instruction):
     branch_mode: BranchMode = BranchMode.PROB
     probability: float = 0.5
     counter_max: int = 0
-    counter: int = 0
     reset_counter: bool = True
 
     def __init__(self):
@@ -108,6 +109,126 @@ class BranchInstruction(Instruction):
         return instance
 
 
+# array typecode of every InstructionStream column
+STREAM_COLUMNS = (
+    ("types", "B"),
+    ("branch_modes", "B"),  # 0 for instructions that are no branches
+    ("target_deltas", "i"),
+    ("probabilities", "f"),
+    ("counter_maxes", "I"),
+    ("reset_counters", "B"),
+    ("branch_slots", "i"),  # index into the per task branch counters, -1 if the branch has no counter
+)
+
+INSTRUCTION_TYPES: dict[int, InstructionType] = {t.value: t for t in InstructionType}
+BRANCH_MODES: dict[int, Optional[BranchInstruction.BranchMode]] = {
+    0: None, **{m.value: m for m in BranchInstruction.BranchMode}
+}
+
+type Column = array | memoryview
+
+
+class InstructionStream:
+    """
+    decoded program stored as parallel typed arrays, one entry per instruction.
+    The stream is never written to during simulation, so any number of tasks can share it.
+    Branch counters are kept per task, in an array with one slot per counting branch.
+    """
+    types: Column
+    branch_modes: Column
+    target_deltas: Column
+    probabilities: Column
+    counter_maxes: Column
+    reset_counters: Column
+    branch_slots: Column
+    branch_slot_count: int
+    _derived: dict[str, Any]  # see derived()
+
+    def __init__(self, branch_slot_count: Optional[int] = None, **columns: Column):
+        """
+        :param branch_slot_count: of the columns, counted from branch_slots if not given
+        """
+        for name, code in STREAM_COLUMNS:
+            setattr(self, name, columns.get(name, array(code)))
+        if branch_slot_count is None:
+            branch_slot_count = max(self.branch_slots, default=-1) + 1
+        self.branch_slot_count = branch_slot_count
+        self._derived = {}
+
+    def derived(self, name: str, compute: Callable[[Self], Any]) -> Any:
+        """
+        data other modules compute from the program, e.g. the indices of its branches.
+        It is computed on first use and kept with the program until an instruction is appended,
+        so it is freed together with the program.
+
+        :param name: tells the data of different users apart, e.g. "fastforward.branches"
+        """
+        derived = self._derived
+        if name not in derived:
+            derived[name] = compute(self)
+        return derived[name]
+
+    @classmethod
+    def from_instructions(cls, instructions: Iterable[Instruction | InstructionType]) -> Self:
+        stream = cls()
+        for inst in instructions:
+            stream.append(inst)
+        return stream
+
+    def append(self, inst: Instruction | InstructionType):
+        if isinstance(inst, InstructionType):
+            inst = Instruction(inst)
+        if self._derived:
+            self._derived.clear()
+
+        self.types.append(inst.type.value)
+        if isinstance(inst, BranchInstruction):
+            self.branch_modes.append(inst.branch_mode.value)
+            self.target_deltas.append(inst.target_index_delta)
+            self.probabilities.append(inst.probability)
+            self.counter_maxes.append(inst.counter_max)
+            self.reset_counters.append(inst.reset_counter)
+            if inst.branch_mode in (BranchInstruction.BranchMode.UNTIL, BranchInstruction.BranchMode.FROM):
+                self.branch_slots.append(self.branch_slot_count)
+                self.branch_slot_count += 1
+            else:
+                self.branch_slots.append(-1)
+        else:
+            self.branch_modes.append(0)
+            self.target_deltas.append(0)
+            self.probabilities.append(0.0)
+            self.counter_maxes.append(0)
+            self.reset_counters.append(False)
+            self.branch_slots.append(-1)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, index: int) -> Instruction:
+        # materialises a single instruction, not meant for the simulation itself.
+        mode = BRANCH_MODES[self.branch_modes[index]]
+        if mode is None:
+            return Instruction(INSTRUCTION_TYPES[self.types[index]])
+
+        branch = BranchInstruction()
+        branch.branch_mode = mode
+        branch.target_index_delta = self.target_deltas[index]
+        branch.probability = self.probabilities[index]
+        branch.counter_max = self.counter_maxes[index]
+        branch.reset_counter = bool(self.reset_counters[index])
+        return branch
+
+    def __iter__(self) -> Iterator[Instruction]:
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, InstructionStream):
+            return NotImplemented
+        return all(
+            getattr(self, name).tolist() == getattr(other, name).tolist() for name, _ in STREAM_COLUMNS
+        )
+
+
 class TaskCategory(Enum):
     VSU_CRYPTO_DFU = TaskCategoryCharacteristics(1.0, 2)
     VSU_QUAD_WORD = TaskCategoryCharacteristics(1.0, 2)
@@ -126,13 +247,26 @@ def get_task_color(task_id: int, total_tasks: int) -> str:
 TOTAL_TASKS = 7
 
 
+def task_rng(seed: int, task_id: int) -> Random:
+    """
+    splits a run seed into one independent stream per task, so a task takes the same branches
+    no matter which tasks it shares the processor with or which process runs it.
+    """
+    return Random(f"{seed}:{task_id}")
+
+
 @dataclass
 class Task:
     id: int
     category: TaskCategory
 
-    instructions: list[Instruction] = field(repr=False)
+    instructions: InstructionStream = field(repr=False)
     inst_index: int = 0
+    # branch slot -> counter, the only mutable state of the program
+    branch_counters: array = field(default=None, repr=False)
+    # decides probabilistic branches, derived from seed unless given
+    seed: int = SEED
+    rng: Random = field(default=None, repr=False, compare=False)
 
     # representation data
     colour: str = ""
@@ -140,16 +274,21 @@ class Task:
     # metadata
     fname: str = ""
     ran_at: list[TimeQuantum] = field(default_factory=list)
-    completed_at: TimeQuantum = -1
+    completed_at: TimeQuantum = -1  # -1 until the task completed, quantum 0 is a valid completion
 
     def __post_init__(self):
+        if not isinstance(self.instructions, InstructionStream):
+            self.instructions = InstructionStream.from_instructions(self.instructions)
+        if self.branch_counters is None:
+            self.branch_counters = array("I", bytes(4 * self.instructions.branch_slot_count))
+        if self.rng is None:
+            self.rng = task_rng(self.seed, self.id)
         self.colour = get_task_color(self.id, TOTAL_TASKS)
-        print(
-            f"Task {self.id} has colour {self.colour}"
-        )
+        if trace.tasks:
+            trace.log("tasks", f"Task {self.id} has colour {self.colour}")
 
     def is_complete(self) -> bool:
-        return self.completed_at > 0
+        return self.completed_at >= 0
 
     def mark_completed(self, quantum: TimeQuantum):
         self.completed_at = quantum
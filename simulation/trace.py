@@ -0,0 +1,156 @@
+"""
+tracing for the simulation.
+
+Every subsystem has a module level flag that is checked before a message is formatted:
+
+    if trace.fetch:
+        trace.log("fetch", f"fetched {n} instructions")
+
+so a disabled subsystem only costs one attribute lookup. Messages that are costly to format can pass their
+arguments separately, trace.log("loader", "decoded %d instructions", trace.Level.INFO, n), they are only
+formatted if the message passes the level. Subsystems are enabled through enable()
+or the TRACE environment variable, e.g. TRACE=fetch,ifb TRACE_LEVEL=debug.
+
+Events can additionally be recorded into a buffered binary file for later replay, see start_recording().
+"""
+import struct
+import sys
+from enum import IntEnum
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional, TextIO
+
+from simulation import TRACE, TRACE_LEVEL
+
+
+class Level(IntEnum):
+    ERROR = 0
+    WARN = 1
+    INFO = 2
+    DEBUG = 3
+
+
+SUBSYSTEMS = ("loader", "tasks", "fetch", "ifb", "pipeline", "simulation", "scheduler")
+
+loader = False
+tasks = False
+fetch = False
+ifb = False
+pipeline = False
+simulation = False
+scheduler = False
+
+level = Level.DEBUG
+output: TextIO = sys.stdout
+
+
+def enable(*subsystems: str, at_level: Optional[Level] = None):
+    global level
+    for subsystem in subsystems:
+        if subsystem not in SUBSYSTEMS:
+            raise ValueError(f"Unknown trace subsystem {subsystem}")
+        globals()[subsystem] = True
+    if at_level is not None:
+        level = at_level
+
+
+def disable(*subsystems: str):
+    for subsystem in subsystems or SUBSYSTEMS:
+        if subsystem not in SUBSYSTEMS:
+            raise ValueError(f"Unknown trace subsystem {subsystem}")
+        globals()[subsystem] = False
+
+
+def log(subsystem: str, message: str, at_level: Level = Level.DEBUG, *args: object):
+    """
+    :param args: formatted into message with % only if the message is printed, like logging does
+    """
+    if at_level <= level:
+        print(f"[{subsystem}] {message % args if args else message}", file=output)
+
+
+class Event(IntEnum):
+    INSTRUCTION_COMPLETED = 1  # value: instruction type
+    TASK_COMPLETED = 2
+    TASK_SCHEDULED = 3  # value: number of tasks scheduled together
+
+
+class TraceRecord(NamedTuple):
+    time: int  # cycle or time quantum, depending on the event
+    event: Event
+    task_id: int
+    value: int
+
+
+MAGIC = b"SIMT"
+_RECORD = struct.Struct("=QBqq")
+
+
+class BinaryTrace:
+    """
+    appends fixed size records to a file, buffered in memory.
+    """
+    _file: object
+    _buffer: bytearray
+    buffer_size: int
+
+    def __init__(self, file: Path, buffer_size: int = 1 << 16):
+        self._file = open(file, "wb")
+        self._file.write(MAGIC)
+        self._buffer = bytearray()
+        self.buffer_size = buffer_size
+
+    def record(self, time: int, event: Event, task_id: int, value: int = 0):
+        self._buffer += _RECORD.pack(time, event, task_id, value)
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def read_trace(file: Path) -> Iterator[TraceRecord]:
+    with open(file, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file} is not a binary simulation trace")
+        while chunk := f.read(_RECORD.size):
+            time, event, task_id, value = _RECORD.unpack(chunk)
+            yield TraceRecord(time, Event(event), task_id, value)
+
+
+recording = False
+_binary_trace: Optional[BinaryTrace] = None
+
+
+def start_recording(file: Path, buffer_size: int = 1 << 16):
+    global recording, _binary_trace
+    stop_recording()
+    _binary_trace = BinaryTrace(file, buffer_size)
+    recording = True
+
+
+def stop_recording():
+    global recording, _binary_trace
+    if _binary_trace is not None:
+        _binary_trace.close()
+    _binary_trace = None
+    recording = False
+
+
+def record(time: int, event: Event, task_id: int, value: int = 0):
+    # callers check trace.recording first
+    _binary_trace.record(time, event, task_id, value)
+
+
+if TRACE:
+    enable(*(s.strip() for s in TRACE.split(",") if s.strip()), at_level=Level[TRACE_LEVEL.upper()])
@@ -0,0 +1,48 @@
+from simulation import checkpoint
+from simulation.scheduling import round_robin_smt4
+from simulation.simulation import PipelineSimulation
+from simulation.tasks import BranchInstruction, InstructionStream, InstructionType, Task, TaskCategory
+
+PROGRAM = InstructionStream.from_instructions(
+    [InstructionType.LSU, InstructionType.FX, InstructionType.VSU, BranchInstruction.branch_prob(0.3, 2),
+     InstructionType.FX, InstructionType.LSU, BranchInstruction.branch_until(20, -6), BranchInstruction.ret()]
+)
+CATEGORIES = (TaskCategory.LSU, TaskCategory.FX, TaskCategory.BRANCH, TaskCategory.VSU_QUAD_WORD)
+
+
+def simulation() -> PipelineSimulation:
+    tasks = [(i // 2, Task(i, CATEGORIES[i % 4], PROGRAM)) for i in range(1, 7)]
+    return PipelineSimulation(tasks, round_robin_smt4, lsu_latency=5)
+
+
+def outcome(simulation: PipelineSimulation) -> tuple:
+    result = simulation.result()
+    run_order = {quantum: [task.id for task in tasks] for quantum, tasks in result.run_order.items()}
+    completed_at = sorted((task.id, task.completed_at) for tasks in result.run_order.values() for task in tasks)
+    return run_order, result.cycles, result.instructions, completed_at
+
+
+def test_resume_matches_an_uninterrupted_run(tmp_path):
+    expected = simulation()
+    expected.run()
+
+    interrupted = simulation()
+    for _ in range(5):
+        interrupted.step()
+    path = tmp_path / "run.checkpoint"
+    checkpoint.save(path, interrupted)
+    interrupted.run()
+
+    resumed = checkpoint.load(path, [PROGRAM])
+    assert resumed.quantum == 5
+    resumed.run()
+    assert resumed.done()
+    assert outcome(resumed) == outcome(interrupted) == outcome(expected)
+
+
+def test_step_after_the_end_does_nothing():
+    finished = simulation()
+    finished.run()
+    before = outcome(finished)
+    finished.step()
+    assert outcome(finished) == before
@@ -0,0 +1,49 @@
+from simulation.exec_cache import read_cache, write_cache
+from simulation.tasks import BranchInstruction, InstructionStream, InstructionType, STREAM_COLUMNS
+
+KEY = bytes(range(32))
+ENTRIES = {"main": 0, "loop": 3}
+
+
+def program() -> InstructionStream:
+    return InstructionStream.from_instructions([
+        InstructionType.FX, InstructionType.LSU, BranchInstruction.branch_prob(0.25, -2),
+        InstructionType.VSU, BranchInstruction.branch_until(3, -4), BranchInstruction.ret(),
+    ])
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "add.dump.simcache"
+    written = program()
+    write_cache(path, KEY, written, ENTRIES)
+    read, entries = read_cache(path, KEY)
+    assert read == written
+    assert read.branch_slot_count == written.branch_slot_count == 1
+    assert entries == ENTRIES
+
+
+def test_round_trip_keeps_branch_slot_count(tmp_path):
+    path = tmp_path / "add.dump.simcache"
+    written = program()
+    written = InstructionStream(4, **{name: getattr(written, name) for name, _ in STREAM_COLUMNS})
+    write_cache(path, KEY, written, {})
+    assert read_cache(path, KEY)[0].branch_slot_count == 4
+
+
+def test_other_key_is_a_miss(tmp_path):
+    path = tmp_path / "add.dump.simcache"
+    write_cache(path, KEY, program(), ENTRIES)
+    assert read_cache(path, bytes(32)) is None
+    assert read_cache(tmp_path / "missing.simcache", KEY) is None
+
+
+def test_truncated_file_is_a_miss(tmp_path):
+    path = tmp_path / "add.dump.simcache"
+    write_cache(path, KEY, program(), ENTRIES)
+    data = path.read_bytes()
+    path.write_bytes(data[:-1])
+    assert read_cache(path, KEY) is None
+    path.write_bytes(data[:20])
+    assert read_cache(path, KEY) is None
+    path.write_bytes(b"")
+    assert read_cache(path, KEY) is None
@@ -0,0 +1,53 @@
+import copy
+
+from simulation.fastforward import fast_forward
+from simulation.pipeline import PipelineStart
+from simulation.tasks import BranchInstruction, InstructionStream, InstructionType, Task, TaskCategory
+
+# a probabilistic branch inside a counted loop, both longer and shorter than a fetch of 8 instructions
+PROGRAM = InstructionStream.from_instructions(
+    [InstructionType.FX, InstructionType.LSU, BranchInstruction.branch_prob(0.5, 3)]
+    + [InstructionType.FX] * 10
+    + [InstructionType.LSU, BranchInstruction.branch_until(6, -14), InstructionType.VSU, BranchInstruction.ret()]
+)
+
+
+def state(task: Task) -> tuple:
+    return task.inst_index, task.branch_counters.tolist(), task.rng.getstate()
+
+
+def test_fast_forward_matches_fetch():
+    fetched = Task(1, TaskCategory.FX, PROGRAM)
+    forwarded = copy.deepcopy(fetched)
+    start = PipelineStart([fetched])
+    total = 0
+    while fetched.inst_index < len(PROGRAM):
+        count = len(start.forward()[0])
+        total += count
+        assert fast_forward(forwarded, count) == count
+        assert state(forwarded) == state(fetched)
+    assert total > len(PROGRAM)
+    assert fast_forward(forwarded) == 0
+
+
+def test_fast_forward_in_one_call_matches_fetch():
+    fetched = Task(1, TaskCategory.FX, PROGRAM)
+    forwarded = copy.deepcopy(fetched)
+    start = PipelineStart([fetched])
+    total = 0
+    while fetched.inst_index < len(PROGRAM):
+        total += len(start.forward()[0])
+    assert fast_forward(forwarded) == total
+    assert state(forwarded) == state(fetched)
+
+
+def test_fast_forward_stops_at_until():
+    task = Task(1, TaskCategory.FX, PROGRAM)
+    assert fast_forward(task, until=1) == 1
+    assert task.inst_index == 1
+
+
+def test_fast_forward_stops_an_endless_loop_at_the_limit():
+    task = Task(1, TaskCategory.FX, [InstructionType.FX, BranchInstruction.branch_prob(1.0, -1)])
+    assert fast_forward(task, 1001) == 1001
+    assert task.inst_index == 1
@@ -0,0 +1,46 @@
+import pytest
+
+from simulation.mnemonics import MnemonicClassifier
+from simulation.tasks import InstructionType
+
+
+def test_exact_match_wins_over_prefix():
+    classifier = MnemonicClassifier({"mr": InstructionType.FX}, {"m": InstructionType.VSU})
+    assert classifier.classify("mr") == InstructionType.FX
+    assert classifier.classify("mrx") == InstructionType.VSU
+
+
+def test_longer_prefix_wins():
+    classifier = MnemonicClassifier({}, {"l": InstructionType.LSU, "lxv": InstructionType.VSU})
+    assert classifier.classify("lxvd2x") == InstructionType.VSU
+    assert classifier.classify("lwz") == InstructionType.LSU
+    assert classifier.classify("lx") == InstructionType.LSU
+
+
+def test_unknown_mnemonic_is_skipped():
+    classifier = MnemonicClassifier({}, {"add": InstructionType.FX})
+    assert classifier.classify("xor") is None
+
+
+def test_load_extends_the_tables(tmp_path):
+    table = tmp_path / "mnemonics.toml"
+    table.write_text('[exact]\nmfvsrld = "VSU"\nsc = "ignore"\n[prefix]\nxx = "vsu"\n')
+    classifier = MnemonicClassifier({"sc": InstructionType.FX}, {"x": InstructionType.FX})
+    fingerprint = classifier.fingerprint()
+    classifier.classify("xxlor")
+    classifier.load(table)
+    assert classifier.classify("mfvsrld") == InstructionType.VSU
+    assert classifier.classify("sc") is None
+    assert classifier.classify("xxlor") == InstructionType.VSU
+    assert classifier.classify("xor") == InstructionType.FX
+    assert classifier.fingerprint() != fingerprint
+
+
+@pytest.mark.parametrize("name", ["CRYPTO", "unknown"])
+def test_load_rejects_types_the_pipeline_cannot_issue(tmp_path, name):
+    table = tmp_path / "mnemonics.toml"
+    table.write_text(f'[prefix]\nvcipher = "{name}"\n')
+    classifier = MnemonicClassifier({}, {})
+    with pytest.raises(ValueError):
+        classifier.load(table)
+    assert classifier.classify("vcipher") is None
@@ -0,0 +1,36 @@
+from simulation.pipeline import Pipeline
+from simulation.tasks import BranchInstruction, InstructionStream, InstructionType, Task, TaskCategory
+
+BODY = [InstructionType.LSU, InstructionType.FX, InstructionType.LSU, InstructionType.VSU]
+PROGRAM = InstructionStream.from_instructions(
+    BODY + [BranchInstruction.branch_until(10, -len(BODY)), BranchInstruction.ret()])
+
+
+def tasks() -> list[Task]:
+    return [Task(i, TaskCategory.LSU, PROGRAM) for i in range(1, 4)]
+
+
+def completions(pipeline: Pipeline, step) -> list[tuple[int, int]]:
+    trace = []
+    while pipeline.cycle < 600:
+        completed = step(pipeline)
+        if completed:
+            trace.append((pipeline.cycle, len(completed)))
+    return trace
+
+
+def test_advance_matches_tick():
+    for latency in (1, 20):
+        ticked = completions(Pipeline(tasks(), latency), Pipeline.tick)
+        assert ticked
+        assert completions(Pipeline(tasks(), latency), Pipeline.advance) == ticked
+
+
+def test_pipelines_count_their_own_moves():
+    busy = Pipeline(tasks(), 1)
+    idle = Pipeline([], 1)
+    assert busy.moves is not idle.moves
+    busy.tick()
+    idle.tick()
+    assert busy.moves.moved > 0
+    assert idle.moves.moved == 0
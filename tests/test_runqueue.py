@@ -0,0 +1,87 @@
+import pickle
+
+import pytest
+
+from simulation.runqueue import RunQueue
+from simulation.tasks import InstructionType, Task, TaskCategory
+
+PROGRAM = [InstructionType.FX]
+
+
+def tasks(*categories: TaskCategory) -> list[Task]:
+    return [Task(i, category, PROGRAM) for i, category in enumerate(categories, 1)]
+
+
+def ids(tasks: list[Task]) -> list[int]:
+    return [task.id for task in tasks]
+
+
+def test_removed_tasks_are_skipped():
+    queue = RunQueue(tasks(TaskCategory.LSU, TaskCategory.BRANCH, TaskCategory.LSU, TaskCategory.BRANCH))
+    first, second, third, _ = list(queue)
+    queue.pop_specific_task(first)
+    queue.pop_specific_task(second)
+    assert len(queue) == 2
+    assert queue.oldest_of_category(TaskCategory.LSU) is third
+    assert queue.oldest_with_width(1).id == 4
+    assert queue.oldest_fitting(2) is third
+    assert ids(queue.peek_n_tasks(4)) == [3, 4]
+    assert ids(queue.pop_n_tasks(4)) == [3, 4]
+    assert queue.is_empty()
+
+
+def test_removing_a_task_that_is_not_queued():
+    queue = RunQueue(tasks(TaskCategory.FX))
+    task = queue.pop_task()[0]
+    with pytest.raises(ValueError):
+        queue.pop_specific_task(task)
+
+
+def test_oldest_fitting_skips_wider_tasks():
+    queue = RunQueue(tasks(TaskCategory.LSU, TaskCategory.BRANCH))
+    assert queue.oldest_fitting(1).id == 2
+    assert queue.oldest_fitting(0) is None
+
+
+def test_queues_are_rebuilt_after_many_removals():
+    queue = RunQueue()
+    kept = Task(0, TaskCategory.BRANCH, PROGRAM)
+    queue.add_task(kept)
+    for i in range(1, 3000):
+        task = Task(i, TaskCategory.LSU, PROGRAM)
+        queue.add_task(task)
+        queue.pop_specific_task(task)
+    assert len(queue._queue) < 1100
+    assert len(queue._by_width[2]) < 1100
+    assert len(queue._by_category[TaskCategory.LSU]) < 1100
+    assert list(queue) == [kept]
+    assert queue.oldest_of_category(TaskCategory.LSU) is None
+    assert queue.oldest_with_width(1) is kept
+
+
+def test_pickling_keeps_the_queued_tasks():
+    queue = RunQueue(tasks(TaskCategory.LSU, TaskCategory.FX, TaskCategory.BRANCH))
+    queue.pop_specific_task(list(queue)[1])
+    restored = pickle.loads(pickle.dumps(queue))
+    assert ids(restored) == [1, 3]
+    assert len(restored) == 2
+    restored.pop_specific_task(list(restored)[0])
+    assert ids(restored) == [3]
+    restored.add_task(Task(4, TaskCategory.FX, PROGRAM))
+    assert ids(restored.pop_n_tasks(4)) == [3, 4]
+
+
+def test_peek_cursors():
+    queue = RunQueue(tasks(TaskCategory.LSU, TaskCategory.BRANCH, TaskCategory.FX, TaskCategory.BRANCH))
+    assert [queue.peek_next().id for _ in range(4)] == [1, 2, 3, 4]
+    assert queue.peek_next() is None
+    assert [queue.peek_prev().id for _ in range(4)] == [4, 3, 2, 1]
+    assert queue.peek_prev() is None
+    assert [queue.peek_prev_single_width().id for _ in range(2)] == [4, 2]
+    assert queue.peek_prev_single_width() is None
+    assert queue.peek_prev_double_width().id == 3
+    assert queue.peek_prev_four_width() is None
+    queue.reset_indices()
+    assert queue.peek_next().id == 1
+    assert queue.peek_prev().id == 4
+    assert ids(queue.tasks) == [1, 2, 3, 4]
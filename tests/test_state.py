@@ -0,0 +1,71 @@
+from simulation.state import RingBuffer
+
+
+def wrapped(items: list, max_size: int) -> RingBuffer:
+    """
+    :return: a buffer holding items whose head is near the end of its storage, so they wrap around
+    """
+    buffer = RingBuffer(max_size)
+    buffer.extend([None] * (max_size - 2))
+    buffer.pop_into([], max_size - 2)
+    buffer.extend(items)
+    return buffer
+
+
+def test_remove_masked_keeps_order_of_the_rest():
+    buffer = wrapped([0, 1, 2, 3, 4], 6)
+    out = []
+    assert buffer.remove_masked([True, False, True, False, True], out) == 3
+    assert out == [0, 2, 4]
+    assert list(buffer) == [1, 3]
+    assert buffer.append(5) and list(buffer) == [1, 3, 5]
+
+
+def test_remove_masked_keeps_positions_past_the_mask():
+    buffer = wrapped([0, 1, 2, 3], 5)
+    out = []
+    assert buffer.remove_masked([False, True], out) == 1
+    assert out == [1]
+    assert list(buffer) == [0, 2, 3]
+
+
+def test_remove_masked_offset():
+    buffer = wrapped([0, 1, 2], 4)
+    out = []
+    assert buffer.remove_masked([True, True, False, True, False], out, offset=2) == 1
+    assert out == [1]
+    assert list(buffer) == [0, 2]
+
+
+def test_remove_masked_clears_removed_slots():
+    buffer = RingBuffer(3)
+    buffer.extend(["a", "b", "c"])
+    buffer.remove_masked([True, True, True], [])
+    assert len(buffer) == 0
+    assert buffer._items == [None, None, None]
+
+
+def test_move_into_wraps_and_stops_when_full():
+    source = wrapped([0, 1, 2, 3, 4], 6)
+    target = wrapped(["x"], 4)
+    assert source.move_into(target, 10) == 3
+    assert list(target) == ["x", 0, 1, 2]
+    assert list(source) == [3, 4]
+    assert source.move_into(target, 10) == 0
+
+
+def test_move_into_at_most_n():
+    source = RingBuffer(4)
+    source.extend([0, 1, 2])
+    target = RingBuffer(4)
+    assert source.move_into(target, 2) == 2
+    assert list(target) == [0, 1]
+    assert list(source) == [2]
+
+
+def test_copy_into_keeps_items():
+    buffer = wrapped([0, 1, 2], 4)
+    out = ["before"]
+    assert buffer.copy_into(out) == 3
+    assert out == ["before", 0, 1, 2]
+    assert list(buffer) == [0, 1, 2]
@@ -0,0 +1,33 @@
+import math
+
+from simulation.statistics import from_timeline
+from simulation.tasks import InstructionType, Task, TaskCategory
+
+
+def tasks(*ids: int) -> list[Task]:
+    return [Task(i, TaskCategory.FX, [InstructionType.FX]) for i in ids]
+
+
+def test_from_timeline():
+    a, b, c = tasks(1, 2, 3)
+    for task in (a, b, c):
+        task.mark_completed(0)
+    summary = from_timeline({0: [a, b], 1: [b], 5: [c]}).summary()
+    assert summary.task_ids.tolist() == [1, 2, 3]
+    assert summary.turnaround.tolist() == [1, 2, 1]
+    assert summary.response.tolist() == [0, 0, 0]
+    assert summary.waiting.tolist() == [0, 0, 0]
+    assert summary.occupancy.tolist() == [2, 1, 0, 0, 0, 1]
+    assert summary.makespan == 6
+
+
+def test_from_timeline_with_arrivals():
+    a, b = tasks(1, 2)
+    a.mark_completed(0)
+    summary = from_timeline({2: [a, b], 3: [a]}, arrivals={1: 0}).summary()
+    assert summary.task_ids.tolist() == [1, 2]
+    assert summary.completed.tolist() == [True, False]
+    assert summary.turnaround[0] == 4
+    assert summary.response.tolist() == [2, 0]
+    assert summary.waiting[0] == 2
+    assert math.isnan(summary.turnaround[1])